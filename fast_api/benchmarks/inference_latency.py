@@ -0,0 +1,80 @@
+# Latency of concurrent predictions, inline on the event loop vs. the inference pool, with and without micro-batching.
+#   uv run python -m benchmarks.inference_latency [concurrency] [model]
+# INFERENCE_WORKERS / INFERENCE_QUEUE_DEPTH size the pools, INFERENCE_MAX_BATCH / INFERENCE_MAX_WAIT_MS the batches.
+# Live predictions skip the feature cache, so every spectrum is preprocessed.
+import os
+import asyncio
+import sys
+import time
+import numpy as np
+from src.inference import BatchDispatcher, InferencePool, registry
+from src.spectra import CompiledPipeline
+
+_EXAMPLE = "example/2509150914089 250mw 3000ms.txt"
+
+
+async def predict_inline(spectrum: np.ndarray, model_name: str) -> float:
+    # What `predict` did before: everything on the event loop
+    model = registry.get(model_name)
+    pipeline = CompiledPipeline.for_axis(registry.raman_shift())
+    return float(model.predict(pipeline(spectrum).reshape(1, -1))[0])
+
+
+async def watch_loop(lags: list[float], period: float = 0.005):
+    # How late the event loop wakes up: what every other connection waits
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(period)
+        lags.append(time.perf_counter() - start - period)
+
+
+async def bench(name: str, predict, spectra: np.ndarray, model_name: str):
+    lags: list[float] = []
+    watcher = asyncio.create_task(watch_loop(lags))
+    await asyncio.sleep(0.05)
+
+    # Every measurement finishes at the same time: the latency counts from there
+    start = time.perf_counter()
+
+    async def timed(spectrum: np.ndarray) -> float:
+        await predict(spectrum, model_name)
+        return time.perf_counter() - start
+
+    latencies = np.array(await asyncio.gather(*[timed(spectrum) for spectrum in spectra])) * 1e3
+    elapsed = time.perf_counter() - start
+    # Let the watcher record the last (possibly blocked) wake-up
+    await asyncio.sleep(0.02)
+    watcher.cancel()
+    lag = np.array(lags or [0.0]) * 1e3
+    print(f"{name:<10}{np.median(latencies):>10.1f}{np.percentile(latencies, 95):>10.1f}{latencies.max():>10.1f} ms"
+          f"{len(spectra)/elapsed:>10.1f} req/s{lag.max():>12.1f} ms")
+
+
+async def main(concurrency: int, model_name: str | None):
+    registry.load()
+    model_name = model_name or registry.default
+    data = np.loadtxt(_EXAMPLE, delimiter=";", skiprows=15, encoding="utf-8-sig")
+    spectra = data[:, 5] + np.random.default_rng(0).normal(scale=5, size=(concurrency, data.shape[0]))
+    print(f"{concurrency} concurrent predictions with {model_name}, {os.cpu_count()} CPU(s)")
+    print(f"{'':<10}{'p50':>10}{'p95':>10}{'max':>13}{'throughput':>16}{'loop lag':>12}")
+
+    await predict_inline(spectra[0], model_name)
+    await bench("inline", predict_inline, spectra, model_name)
+    for kind in ["thread", "process"]:
+        pool = InferencePool(kind=kind, queue_depth=max(concurrency, 32))
+        pool.start()
+        # Wait for the workers to load the models
+        await asyncio.gather(*[pool.predict(spectra[0], model_name) for _ in range(pool.workers)])
+        await bench(f"{kind}[{pool.workers}]", lambda spectrum, name: pool.predict(spectrum, name), spectra, model_name)
+        dispatcher = BatchDispatcher(pool=pool)
+        await bench(f"  batched", dispatcher.predict, spectra, model_name)
+        # One request at a time: what micro-batching costs a lone measurement
+        await bench(f"  single", lambda spectrum, name: pool.predict(spectrum, name), spectra[:1], model_name)
+        await bench(f"  single*", dispatcher.predict, spectra[:1], model_name)
+        await dispatcher.stop()
+        await pool.stop()
+
+
+if __name__ == '__main__':
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    asyncio.run(main(concurrency, sys.argv[2] if len(sys.argv) > 2 else None))
@@ -0,0 +1,52 @@
+# Reference implementations the benchmarks compare against (also used by the tests as oracles).
+from datetime import datetime
+from pathlib import Path
+from src.db import OptoFile
+
+
+def read_opto_file_legacy(file_path: Path, subject_id: str) -> OptoFile:
+    """
+    The original line-by-line parser: the baseline of `optofile_parse` and the parity oracle of the tests.
+    """
+    def _check_int(s:str) -> bool:
+        if s[0] in ('-', '+'):
+            return s[1:].isdigit()
+        return s.isdigit()
+
+    def rename(name:str) -> str:
+        name = name.strip().replace(" ","_").lower()
+        while True:
+            start = name.find("(")
+            end = name.find(")")
+            if start == -1 or end == -1 or end < start:
+                break
+            name = name[:start] + name[end+1:]
+        return name
+
+    is_data = False
+    with open(file_path, mode='r', encoding='utf-8-sig') as f:
+        opto_data = {rename("Subject ID"):subject_id}
+        for idx, line in enumerate(f.readlines()):
+            line = line.strip()
+            if is_data == False:
+                if(idx == 0): opto_data[rename("Header")] = line
+                elif(line[:17] == "Pixel;Raman Shift"):
+                    is_data = True
+                    opto_data["columns"] = [x.strip() for x in line.split(";")]
+                    for col in opto_data["columns"]:
+                        opto_data[rename(col)] = []
+                else:
+                    key, value = line.split(";")
+                    opto_data[rename(key.strip())] = value.strip()
+            else:
+                values = line.split(";")
+                for col, value in zip(opto_data["columns"], values):
+                    if _check_int(value.strip()):
+                        opto_data[rename(col)].append(int(value.strip()))
+                    else:
+                        opto_data[rename(col)].append(float(value.strip()))
+
+        opto_data[rename("Created")] = datetime.strptime(opto_data[rename("Created")], "%m/%d/%Y %H:%M:%S %p")
+        for key in ["Integration Time(ms)", "Laser Power(mW)", "Average Number", "Scan Interval", "Pixel Num"]:
+            opto_data[rename(key)] = int(opto_data[rename(key)])
+    return OptoFile(**opto_data)
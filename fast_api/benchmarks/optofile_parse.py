@@ -0,0 +1,30 @@
+# Throughput of the Optosky parser over the bundled datasets.
+#   uv run python -m benchmarks.optofile_parse [data_dir ...]
+import os
+os.environ.setdefault("ME_CONFIG_MONGODB_URL", "mongodb://localhost:27017")
+import sys
+import time
+from pathlib import Path
+from src.db import OptoFile
+from src.db.ingest import find_files
+from benchmarks.legacy import read_opto_file_legacy
+
+
+def bench(name: str, func, files: list[Path]) -> float:
+    size = sum(f.stat().st_size for f in files)
+    start = time.perf_counter()
+    for f in files:
+        func(f)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<28}{len(files)/elapsed:>10.1f} files/s{size/elapsed/1e6:>10.1f} MB/s{elapsed:>10.2f} s")
+    return elapsed
+
+
+if __name__ == '__main__':
+    dirs = [Path(d) for d in sys.argv[1:]] or [Path("../data/finger"), Path("../data/additional")]
+    files = find_files(dirs)
+    print(f"{len(files)} files from {[d.as_posix() for d in dirs]}")
+    legacy = bench("read_opto_file (legacy)", lambda f: read_opto_file_legacy(f, subject_id="s"), files)
+    current = bench("read_opto_file", lambda f: OptoFile.read_opto_file(f, subject_id="s"), files)
+    bench("parse_opto_file (arrays)", OptoFile.parse_opto_file, files)
+    print(f"speedup: {legacy/current:.1f}x")
@@ -0,0 +1,41 @@
+# BSON size and load time of a subject's history per OptoFile storage.
+#   uv run python -m benchmarks.optofile_storage [subject_dir]
+# Load = bson.decode (what the driver does) + OptoFile.model_validate_doc + reading baseline_subtracted as an array.
+import os
+os.environ.setdefault("ME_CONFIG_MONGODB_URL", "mongodb://localhost:27017")
+import sys
+import time
+from pathlib import Path
+import bson
+from src.db import OptoFile
+from src.db.ingest import TIMESTAMP_PATTERN
+
+
+def bench(name: str, docs: list[dict]) -> tuple[int, float]:
+    raw = [bson.encode(doc) for doc in docs]
+    start = time.perf_counter()
+    for data in raw:
+        OptoFile.model_validate_doc(bson.decode(data)).array("baseline_subtracted")
+    elapsed = time.perf_counter() - start
+    size = sum(len(data) for data in raw)
+    print(f"{name:<10}{size/1e6:>10.2f} MB{elapsed*1e3:>10.1f} ms")
+    return size, elapsed
+
+
+if __name__ == '__main__':
+    folder = Path(sys.argv[1]) if len(sys.argv) > 1 else Path("../data/finger/s1")
+    files = sorted(folder.glob(TIMESTAMP_PATTERN))
+    print(f"{len(files)} files from {folder.as_posix()}")
+    results = {}
+    for storage in ["list", "float64", "float32"]:
+        docs = []
+        for f in files:
+            optofile = OptoFile.read_opto_file(f, subject_id=folder.name)
+            if storage != "list":
+                optofile.pack(storage)
+            docs.append(optofile.model_dump_doc())
+        results[storage] = bench(storage, docs)
+    for storage in ["float64", "float32"]:
+        size = results["list"][0] / results[storage][0]
+        load = results["list"][1] / results[storage][1]
+        print(f"{storage}: {size:.1f}x smaller, {load:.1f}x faster to load")
@@ -1,7 +1,10 @@
-import requests
-import json
+import asyncio
+import os
+from dataclasses import dataclass
 from datetime import datetime
-import enum 
+from typing import Any
+import enum
+import httpx
 
 class Code(enum.Enum):
     TYPICAL_MEAL  = 66
@@ -16,42 +19,151 @@ class Code(enum.Enum):
     POST_BREAKFAST = 59
     PRE_BREAKFAST = 58
 
-_BASE_LOCATION = "https://telehealth.ait.ac.th:5000/api/v1/"
-_API_KEY = "a3fca5e7b8d1e2f3c4a5b6d7e8f9g0a1b2c3d4e5f6a7b8c9d0e1f2a3b4c5d6e7"
-
-def fetch_by_user_id(user_id:int, start_date:datetime, end_date:datetime):
-    endpoint:str = "get_blood_sugar"
-    url:str = f"{_BASE_LOCATION}{endpoint}"
-
-    payload = json.dumps({
-        "patient_id": user_id,
-        "date_time_start": start_date.strftime("%Y-%m-%d"),
-        "date_time_end": end_date.strftime("%Y-%m-%d")
-    })
-    headers = {
-        'Content-Type': 'application/json',
-        'x-api-key': _API_KEY
-    }
-
-    response = requests.request("POST", url, headers=headers, data=payload)
-
-    return json.loads(response.text)
-
-def post_glucose(user_id:int, code:Code, value:float, created_date:datetime):
-    endpoint:str = "diabetesrecords"
-    url:str = f"{_BASE_LOCATION}{endpoint}"
-
-    payload = json.dumps({
-        "PatientID": user_id,
-        "Code": code.value,
-        "Value": value,
-        "RecordDT": created_date.strftime("%Y-%m-%d %H:%M:%S")
-    })
-    headers = {
-        'Content-Type': 'application/json',
-        'x-api-key': _API_KEY
-    }
-
-    response = requests.request("POST", url, headers=headers, data=payload)
-
-    return json.loads(response.text)
\ No newline at end of file
+_BASE_LOCATION = os.environ.get("TELEHEALTH_URL", "https://telehealth.ait.ac.th:5000/api/v1/")
+_API_KEY = os.environ.get("TELEHEALTH_API_KEY", "a3fca5e7b8d1e2f3c4a5b6d7e8f9g0a1b2c3d4e5f6a7b8c9d0e1f2a3b4c5d6e7")
+_TIMEOUT:float = float(os.environ.get("TELEHEALTH_TIMEOUT", "10"))
+_RETRIES:int = int(os.environ.get("TELEHEALTH_RETRIES", "3"))
+_BACKOFF:float = float(os.environ.get("TELEHEALTH_BACKOFF", "0.5"))
+_MAX_CONNECTIONS:int = int(os.environ.get("TELEHEALTH_MAX_CONNECTIONS", "10"))
+_CONCURRENCY:int = int(os.environ.get("TELEHEALTH_CONCURRENCY", "8"))
+# Responses worth another attempt; anything else (e.g. 400, 401) is returned to the caller as an error at once.
+_RETRY_STATUS:set[int] = {429, 500, 502, 503, 504}
+# A write (not idempotent) is only retried when the server did not process it:
+# throttled / unavailable, or the request was never sent.
+_WRITE_RETRY_STATUS:set[int] = {429, 503}
+_WRITE_RETRY_ERRORS:tuple[type[Exception], ...] = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+@dataclass
+class GlucoseRecord:
+    user_id: int
+    code: Code
+    value: float
+    created_date: datetime
+
+    def payload(self) -> dict[str, Any]:
+        return {
+            "PatientID": self.user_id,
+            "Code": self.code.value,
+            "Value": self.value,
+            "RecordDT": self.created_date.strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+    @staticmethod
+    def from_payload(payload: dict[str, Any]) -> "GlucoseRecord":
+        return GlucoseRecord(
+            user_id=payload["PatientID"],
+            code=Code(payload["Code"]),
+            value=payload["Value"],
+            created_date=datetime.strptime(payload["RecordDT"], "%Y-%m-%d %H:%M:%S")
+        )
+
+
+class TelehealthClient:
+    """
+    Non-blocking client of the telehealth API (`httpx.AsyncClient`).
+
+    Connections are pooled and kept alive (at most `max_connections`), every request has a timeout of `timeout` seconds,
+    and failed requests are retried `retries` times with an exponential backoff (`backoff`, 2 * `backoff`, 4 * `backoff`, ...):
+    every transport error, timeout and 429/5xx response for reads (`get_blood_sugar`), but only connection errors and
+    429/503 responses for writes (`diabetesrecords`), which must not be recorded twice.
+    The session is created lazily in the running event loop (and recreated if the loop changes, e.g. between tests:
+    the old one is closed in its loop when that loop is still open).
+    """
+
+    def __init__(self, base_url: str = _BASE_LOCATION, api_key: str = _API_KEY, timeout: float = _TIMEOUT,
+                 retries: int = _RETRIES, backoff: float = _BACKOFF, max_connections: int = _MAX_CONNECTIONS,
+                 concurrency: int = _CONCURRENCY):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_connections = max_connections
+        self.concurrency = concurrency
+        self._session: httpx.AsyncClient | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    @property
+    def session(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._loop is not loop:
+            if self._session is not None and self._loop is not None and self._loop.is_closed() == False:
+                # The old session belongs to the other loop: close it there
+                asyncio.run_coroutine_threadsafe(self._session.aclose(), self._loop)
+            self._session = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={'Content-Type': 'application/json', 'x-api-key': self.api_key},
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+            )
+            self._loop = loop
+        return self._session
+
+    async def post(self, endpoint: str, payload: dict[str, Any], idempotent: bool = False) -> Any:
+        """
+        POST `payload` as JSON to `endpoint` and return the decoded response.
+        Raises `httpx.HTTPStatusError` or `httpx.TransportError` once the retries are exhausted.
+
+        A request that is not `idempotent` (a write) is only retried when it did not reach the server.
+        """
+        retry_status = _RETRY_STATUS if idempotent else _WRITE_RETRY_STATUS
+        retry_errors = httpx.TransportError if idempotent else _WRITE_RETRY_ERRORS
+        attempt = 0
+        while True:
+            try:
+                response = await self.session.post(endpoint, json=payload)
+                if response.status_code not in retry_status or attempt >= self.retries:
+                    response.raise_for_status()
+                    return response.json()
+            except retry_errors:
+                if attempt >= self.retries:
+                    raise
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+            attempt += 1
+
+    async def fetch_by_user_id(self, user_id: int, start_date: datetime, end_date: datetime) -> Any:
+        return await self.post("get_blood_sugar", {
+            "patient_id": user_id,
+            "date_time_start": start_date.strftime("%Y-%m-%d"),
+            "date_time_end": end_date.strftime("%Y-%m-%d")
+        }, idempotent=True)
+
+    async def post_glucose(self, user_id: int, code: Code, value: float, created_date: datetime) -> Any:
+        return await self.post("diabetesrecords", GlucoseRecord(user_id, code, value, created_date).payload())
+
+    async def post_glucose_many(self, records: list[GlucoseRecord], concurrency: int | None = None) -> list[Any]:
+        """
+        Send `records` concurrently, at most `concurrency` (default `self.concurrency`) in flight.
+
+        Returns
+        -------
+        list :
+            The response of each record (same order), or the exception raised for it:
+            one failing record does not stop the others.
+        """
+        semaphore = asyncio.Semaphore(concurrency or self.concurrency)
+
+        async def send(record: GlucoseRecord) -> Any:
+            async with semaphore:
+                return await self.post("diabetesrecords", record.payload())
+
+        return await asyncio.gather(*[send(record) for record in records], return_exceptions=True)
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.aclose()
+        self._session = None
+        self._loop = None
+
+
+client = TelehealthClient()
+
+async def fetch_by_user_id(user_id:int, start_date:datetime, end_date:datetime):
+    return await client.fetch_by_user_id(user_id, start_date, end_date)
+
+async def post_glucose(user_id:int, code:Code, value:float, created_date:datetime):
+    return await client.post_glucose(user_id, code, value, created_date)
+
+async def post_glucose_many(records:list[GlucoseRecord], concurrency:int | None = None) -> list[Any]:
+    return await client.post_glucose_many(records, concurrency=concurrency)
\ No newline at end of file
@@ -1,6 +1,9 @@
 from .optofile import OptoFile
-from ._var import engine
+from .packed import Axis, PackedArray, load_axes
+from .query import SpectraMatrix, iter_optofiles, fetch_matrix
+from .reference import ReferenceCurves, label_optofiles
+from ._var import engine, get_collection
 
 
 async def init_db():
-    await engine.configure_database([OptoFile])
\ No newline at end of file
+    await engine.configure_database([OptoFile, Axis])
\ No newline at end of file
@@ -1,15 +1,34 @@
 import os
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection
 from odmantic import AIOEngine
 from typing import Any, Dict
 
 
 _MONGO_URI = os.environ["ME_CONFIG_MONGODB_URL"]
 _MONGO_DB = "raman"
+# Connection pool of the shared client (see pymongo.MongoClient).
+_MONGO_MAX_POOL_SIZE:int = int(os.environ.get("MONGO_MAX_POOL_SIZE", "100"))
+_MONGO_MIN_POOL_SIZE:int = int(os.environ.get("MONGO_MIN_POOL_SIZE", "0"))
+_MONGO_MAX_IDLE_TIME_MS:int | None = int(os.environ["MONGO_MAX_IDLE_TIME_MS"]) if "MONGO_MAX_IDLE_TIME_MS" in os.environ else None
+_MONGO_WAIT_QUEUE_TIMEOUT_MS:int | None = int(os.environ["MONGO_WAIT_QUEUE_TIMEOUT_MS"]) if "MONGO_WAIT_QUEUE_TIMEOUT_MS" in os.environ else None
+_MONGO_SERVER_SELECTION_TIMEOUT_MS:int = int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", "30000"))
 
-_client:AsyncIOMotorClient[Dict[str, Any]] = AsyncIOMotorClient(_MONGO_URI)
+_client:AsyncIOMotorClient[Dict[str, Any]] = AsyncIOMotorClient(
+    _MONGO_URI,
+    maxPoolSize=_MONGO_MAX_POOL_SIZE,
+    minPoolSize=_MONGO_MIN_POOL_SIZE,
+    maxIdleTimeMS=_MONGO_MAX_IDLE_TIME_MS,
+    waitQueueTimeoutMS=_MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    serverSelectionTimeoutMS=_MONGO_SERVER_SELECTION_TIMEOUT_MS,
+)
 engine = AIOEngine(client=_client, database=_MONGO_DB)
 
+def get_collection(name: str, database: str = _MONGO_DB) -> AsyncIOMotorCollection:
+    """
+    A collection of any database through the shared client (and its connection pool).
+    """
+    return _client[database][name]
+
 async def delete_db() -> None:
     try:
         await _client.drop_database(_MONGO_DB)
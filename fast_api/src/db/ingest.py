@@ -0,0 +1,213 @@
+"""
+Bulk ingestion of Optosky exports into `raman.optofiles`.
+
+    uv run python -m src.db.ingest ../data/finger ../data/additional --checkpoint .ingest
+
+Files are parsed in a process pool and written with one unordered `bulk_write` of upserts per batch,
+keyed on `subject_created_index` (subject_id, created), so re-ingesting a campaign is idempotent.
+Labels that do not come from the file (prick_time, is_interpolated, glucose_predict) are only set on insert.
+With `--storage float32|float64` the arrays are packed (see `src.db.packed`).
+
+The subject is taken from the file name when it follows the `additional` naming
+(`<subject>_<glucose>_<name>.txt`, which also gives the glucose target) and from the parent folder otherwise
+(`finger/<subject>/<name>.txt`).
+"""
+import argparse
+import asyncio
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterable
+from pymongo import UpdateOne
+from .optofile import OptoFile, _STORAGE
+from .packed import Axis, save_axes
+from ._var import engine
+
+# Optosky exports are named by their timestamp (YYMMDDhhmmss + 1 digit), or "<subject_id>_<glucose>_<timestamp>"
+TIMESTAMP_PATTERN: str = "[0-9]" * 13 + "*.txt"
+NAMED_PATTERN: str = "s*_*.txt"
+_PATTERNS: list[str] = [TIMESTAMP_PATTERN, NAMED_PATTERN]
+_BATCH_SIZE: int = int(os.environ.get("INGEST_BATCH_SIZE", "32"))
+_CONCURRENCY: int = int(os.environ.get("INGEST_CONCURRENCY", "4"))
+_NAMED = re.compile(r"^(?P<subject_id>s\d+)_(?P<glucose>\d+(?:\.\d+)?)_")
+# Set by the file on every ingestion. `glucose_target` is only overwritten when the file name carries it.
+_INSERT_ONLY = ["_id", "prick_time", "glucose_target", "is_interpolated", "glucose_predict"]
+
+
+def describe(file_path: Path) -> tuple[str, float | None]:
+    """
+    Return the (subject_id, glucose_target) of a file from its name or its folder.
+    """
+    match = _NAMED.match(file_path.name)
+    if match is not None:
+        return match["subject_id"], float(match["glucose"])
+    return file_path.parent.name, None
+
+
+def find_files(roots: Iterable[Path], patterns: list[str] = _PATTERNS) -> list[Path]:
+    files: set[Path] = set()
+    for root in roots:
+        if root.is_file():
+            files.add(root)
+            continue
+        for pattern in patterns:
+            files.update(root.rglob(pattern))
+    return sorted(files)
+
+
+def _parse_batch(files: list[Path], storage: str = "list") -> tuple[list[dict[str, Any]], dict[str, Axis], list[tuple[Path, str]]]:
+    # Runs in a worker process: return plain BSON documents, they pickle much faster than models.
+    docs: list[dict[str, Any]] = []
+    axes: dict[str, Axis] = {}
+    errors: list[tuple[Path, str]] = []
+    for file_path in files:
+        subject_id, glucose_target = describe(file_path)
+        try:
+            optofile = OptoFile.read_opto_file(file_path, subject_id=subject_id)
+        except Exception as e:
+            errors.append((file_path, f"{type(e).__name__}: {e}"))
+            continue
+        optofile.glucose_target = glucose_target
+        if storage != "list":
+            axis = optofile.pack(storage)
+            axes[axis.key] = axis
+        docs.append(optofile.model_dump_doc())
+    return docs, axes, errors
+
+
+def _upsert(doc: dict[str, Any]) -> UpdateOne:
+    on_insert = {key: doc.pop(key) for key in _INSERT_ONLY}
+    if on_insert["glucose_target"] is not None:
+        doc["glucose_target"] = on_insert.pop("glucose_target")
+    return UpdateOne({"subject_id": doc["subject_id"], "created": doc["created"]},
+                     {"$set": doc, "$setOnInsert": on_insert}, upsert=True)
+
+
+class Checkpoint:
+    """
+    Append-only list of ingested files (path, size, mtime) used to resume an interrupted run.
+    A file that changed since it was ingested is ingested again.
+    """
+
+    def __init__(self, path: Path | None):
+        self.path = path
+        self.done: set[str] = set()
+        if path is not None and path.exists():
+            self.done = set(path.read_text().splitlines())
+
+    @staticmethod
+    def key(file_path: Path) -> str:
+        stat = file_path.stat()
+        return f"{file_path.resolve().as_posix()}\t{stat.st_size}\t{stat.st_mtime_ns}"
+
+    def __contains__(self, file_path: Path) -> bool:
+        return self.key(file_path) in self.done
+
+    def add(self, files: list[Path]) -> None:
+        keys = [self.key(f) for f in files]
+        self.done.update(keys)
+        if self.path is not None:
+            with open(self.path, mode="a") as f:
+                f.writelines(f"{key}\n" for key in keys)
+
+
+@dataclass
+class IngestReport:
+    total: int = 0
+    skipped: int = 0
+    parsed: int = 0
+    inserted: int = 0
+    updated: int = 0
+    failed: list[tuple[Path, str]] = field(default_factory=list)
+    elapsed: float = 0
+
+    def __str__(self) -> str:
+        done = self.skipped + self.parsed + len(self.failed)
+        rate = self.parsed / self.elapsed if self.elapsed > 0 else 0
+        return (f"[{done}/{self.total}] parsed={self.parsed} inserted={self.inserted} updated={self.updated} "
+                f"skipped={self.skipped} failed={len(self.failed)} | {rate:.1f} files/s")
+
+
+async def ingest(files: list[Path], collection=None, batch_size: int = _BATCH_SIZE, concurrency: int = _CONCURRENCY,
+                 workers: int | None = None, checkpoint: Checkpoint | None = None, storage: str = _STORAGE,
+                 verbose: bool = True) -> IngestReport:
+    """
+    Parse `files` in a process pool and upsert them into `collection` (the `OptoFile` collection by default).
+
+    Parameters
+    ----------
+    batch_size : int
+        Files per worker task and per `bulk_write`.
+    concurrency : int
+        Maximum number of batches in flight (parsing or writing), which bounds the memory used.
+    workers : int or None
+        Size of the process pool (`os.cpu_count()` by default).
+    checkpoint : Checkpoint or None
+        Files in the checkpoint are skipped, and each written batch is added to it.
+    storage : str
+        "list", "float32" or "float64" (`OPTOFILE_STORAGE` by default).
+    """
+    if collection is None:
+        collection = engine.get_collection(OptoFile)
+    checkpoint = checkpoint or Checkpoint(None)
+    report = IngestReport(total=len(files))
+    todo = [f for f in files if f not in checkpoint]
+    report.skipped = len(files) - len(todo)
+    batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    start = time.perf_counter()
+
+    async def run(executor: ProcessPoolExecutor, batch: list[Path]):
+        async with semaphore:
+            docs, axes, errors = await loop.run_in_executor(executor, _parse_batch, batch, storage)
+            await save_axes(axes.values())
+            if len(docs) > 0:
+                result = await collection.bulk_write([_upsert(doc) for doc in docs], ordered=False)
+                report.inserted += result.upserted_count
+                # Matched, not modified: re-ingesting identical files still counts them as updated
+                report.updated += result.matched_count
+            failed = {f for f, _ in errors}
+            checkpoint.add([f for f in batch if f not in failed])
+            report.parsed += len(docs)
+            report.failed.extend(errors)
+            report.elapsed = time.perf_counter() - start
+            if verbose:
+                print(report, file=sys.stderr)
+
+    if len(batches) > 0:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            await asyncio.gather(*(run(executor, batch) for batch in batches))
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+async def main(args: argparse.Namespace) -> IngestReport:
+    from . import init_db
+    await init_db()
+    files = find_files(args.paths, patterns=args.pattern or _PATTERNS)
+    checkpoint = Checkpoint(args.checkpoint)
+    report = await ingest(files, batch_size=args.batch_size, concurrency=args.concurrency,
+                          workers=args.workers, checkpoint=checkpoint, storage=args.storage)
+    for file_path, error in report.failed:
+        print(f"Failed {file_path} | {error}", file=sys.stderr)
+    print(report)
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog="python -m src.db.ingest", description="Ingest Optosky exports into MongoDB.")
+    parser.add_argument("paths", nargs="+", type=Path, help="Files or directories (searched recursively).")
+    parser.add_argument("--pattern", action="append", help=f"File name pattern, repeatable. Default: {_PATTERNS}")
+    parser.add_argument("--batch-size", type=int, default=_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=_CONCURRENCY)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--checkpoint", type=Path, default=None, help="Resume file; ingested files are skipped.")
+    parser.add_argument("--storage", choices=["list", "float32", "float64"], default=_STORAGE)
+    report = asyncio.run(main(parser.parse_args()))
+    sys.exit(1 if len(report.failed) > 0 else 0)
@@ -1,13 +1,32 @@
-from typing import Optional
+from typing import Any, IO, Optional
 from odmantic import Model, Field, Index
 from datetime import datetime
 from pathlib import Path
+import io
+import os
+import numpy as np
 from ._var import engine
+from .packed import AXIS_FIELDS, SPECTRUM_FIELDS, DTYPES, PackedArray, Axis, get_axis, register_axis, load_axes, save_axes
 
-def _check_int(s:str) -> bool:
-    if s[0] in ('-', '+'):
-        return s[1:].isdigit()
-    return s.isdigit()
+_DATA_HEADER = "Pixel;Raman Shift"
+# "list" (BSON arrays), "float32" or "float64" (see `src.db.packed`). Applied by `OptoFile.save`.
+_STORAGE:str = os.environ.get("OPTOFILE_STORAGE", "list")
+
+def _rename(name:str) -> str:
+    # remove space
+    name = name.strip()
+    # space to underscore
+    name = name.replace(" ","_")
+    # capital to small
+    name = name.lower()
+    # remove ( ) and thing in between
+    while True:
+        start = name.find("(")
+        end = name.find(")")
+        if start == -1 or end == -1 or end < start:
+            break
+        name = name[:start] + name[end+1:]
+    return name
 
 
 class OptoFile(Model):
@@ -33,6 +52,8 @@ class OptoFile(Model):
     dark:Optional[list[float]]        = Field(default=None, description="Dark")
     dark_subtracted:Optional[list[float]]     = Field(default=None, description="Dark Subtracted")
     baseline_subtracted:Optional[list[float]] = Field(default=None, description="BaseLine Subtracted")
+    axis_key:Optional[str] = Field(default=None, description="Key of the shared pixel/raman_shift Axis (packed)")
+    packed:Optional[dict[str, PackedArray]] = Field(default=None, description="Binary spectra (packed)")
     
     prick_time:Optional[datetime]  = Field(default=None, description="Prick Time")
     glucose_target:Optional[float] = Field(default=None, description="Glucose Target")
@@ -49,61 +70,135 @@ class OptoFile(Model):
 
     @staticmethod
     async def fetch(subject_id: str, created: datetime) -> "OptoFile":
-        return await engine.find_one(OptoFile, {"subject_id": subject_id, "created": created})
+        optofile = await engine.find_one(OptoFile, {"subject_id": subject_id, "created": created})
+        if optofile is not None:
+            await load_axes([optofile.axis_key])
+        return optofile
 
     @staticmethod
     async def fetch_all(subject_id: str) -> list["OptoFile"]:
-        return await engine.find(OptoFile, {"subject_id": subject_id})
+        optofiles = await engine.find(OptoFile, {"subject_id": subject_id})
+        await load_axes(optofile.axis_key for optofile in optofiles)
+        return optofiles
+
+    async def save(self) -> "OptoFile":
+        """
+        Save the document, packed if `OPTOFILE_STORAGE` is "float32" or "float64".
+        This instance keeps its lists: a packed copy is saved and returned.
+        """
+        optofile = self
+        if _STORAGE != "list" and self.is_packed == False and self.raw is not None:
+            optofile = self.model_copy()
+            await save_axes([optofile.pack(_STORAGE)])
+        return await engine.save(optofile)
+
+    @property
+    def is_packed(self) -> bool:
+        return self.packed is not None
+
+    def array(self, name: str) -> np.ndarray:
+        """
+        Return the array `name` (e.g. 'raman_shift', 'baseline_subtracted') whichever the storage.
+        Arrays of a packed document are read-only views and keep their stored dtype.
+        """
+        if name not in AXIS_FIELDS + SPECTRUM_FIELDS:
+            raise KeyError(f"'{name}' is not an array field")
+        values = getattr(self, name)
+        if values is not None:
+            return np.asarray(values, dtype=np.int64 if name == "pixel" else np.float64)
+        if name in AXIS_FIELDS and self.axis_key is not None:
+            return getattr(get_axis(self.axis_key), name).unpack()
+        if self.packed is not None and name in self.packed:
+            return self.packed[name].unpack()
+        raise KeyError(f"'{name}' is not stored")
 
-    async def save(self) -> None:
-        await engine.save(self)
+    def pack(self, dtype: str = "float32") -> Axis:
+        """
+        Convert the arrays to the packed form in place and return the `Axis` to save with `save_axes`.
+        """
+        axis = Axis.create(self.device_sn, pixel=self.array("pixel"), raman_shift=self.array("raman_shift"))
+        self.packed = {name: PackedArray.pack(self.array(name), dtype=DTYPES[dtype]) for name in SPECTRUM_FIELDS}
+        self.axis_key = axis.key
+        register_axis(axis)
+        for name in AXIS_FIELDS + SPECTRUM_FIELDS:
+            setattr(self, name, None)
+        return axis
+
+    def unpack(self) -> None:
+        """
+        Convert the arrays back to lists in place. The axis must be loaded (`load_axes`).
+        """
+        arrays = {name: self.array(name) for name in AXIS_FIELDS + SPECTRUM_FIELDS}
+        for name, values in arrays.items():
+            setattr(self, name, values.tolist())
+        self.packed = None
+        self.axis_key = None
 
     @staticmethod
-    def read_opto_file(file_path:Path, subject_id:str) -> "OptoFile":
-        def rename(name:str) -> str:
-            # remove space
-            name = name.strip()
-            # space to underscore
-            name = name.replace(" ","_")
-            # capital to small
-            name = name.lower()
-            # remove ( ) and thing in between
-            while True:
-                start = name.find("(")
-                end = name.find(")")
-                if start == -1 or end == -1 or end < start:
-                    break
-                name = name[:start] + name[end+1:]
-            return name
+    def parse_opto_file(source: Path | str | bytes | IO) -> tuple[dict[str, str], dict[str, np.ndarray]]:
+        """
+        Parse an Optosky export into its header and typed data columns.
+
+        The header lines are read one by one; the data block is then handed to `np.loadtxt` in one call.
 
+        Parameters
+        ----------
+        source : pathlib.Path or str or bytes or file-like
+            A path to the file, the content of the file (bytes), or an opened text/binary file.
+            Bytes and file-like objects are never written to disk (e.g. uploads).
 
-        is_data = False
-        with open(file_path, mode='r', encoding='utf-8-sig') as f:
-            opto_data = {rename("Subject ID"):subject_id}
-            for idx, line in enumerate(f.readlines()):
+        Returns
+        -------
+        tuple of (dict, dict) :
+            The header {renamed key: value} (including 'header', the first line) and the
+            data columns {renamed column: NDArray}. 'pixel' is int64, the others are float64.
+        """
+        if isinstance(source, bytes):
+            stream: IO[str] = io.StringIO(source.decode('utf-8-sig'))
+        elif isinstance(source, (str, Path)):
+            stream = open(source, mode='r', encoding='utf-8-sig')
+        elif isinstance(source, io.TextIOBase):
+            stream = source
+        else:
+            stream = io.TextIOWrapper(source, encoding='utf-8-sig')  # type: ignore
+
+        header: dict[str, str] = {}
+        columns: list[str] = []
+        try:
+            header[_rename("Header")] = stream.readline().strip().lstrip('\ufeff')
+            for line in stream:
                 line = line.strip()
-                if is_data == False:
-                    if(idx == 0): opto_data[rename("Header")] = line
-                    elif(line[:17] == "Pixel;Raman Shift"):
-                        is_data = True
-                        opto_data["columns"] = [x.strip() for x in line.split(";")]
-                        for col in opto_data["columns"]:
-                            opto_data[rename(col)] = []
-                    else:
-                        key, value = line.split(";")
-                        opto_data[rename(key.strip())] = value.strip()
-                else:
-                    values = line.split(";")
-                    for col, value in zip(opto_data["columns"], values):
-                        if _check_int(value.strip()):
-                            opto_data[rename(col)].append(int(value.strip()))
-                        else:
-                            opto_data[rename(col)].append(float(value.strip()))
-
-            opto_data[rename("Created")] = datetime.strptime(opto_data[rename("Created")], "%m/%d/%Y %H:%M:%S %p")
-            opto_data[rename("Integration Time(ms)")] = int(opto_data[rename("Integration Time(ms)")])
-            opto_data[rename("Laser Power(mW)")] = int(opto_data[rename("Laser Power(mW)")])
-            opto_data[rename("Average Number")] = int(opto_data[rename("Average Number")])
-            opto_data[rename("Scan Interval")] = int(opto_data[rename("Scan Interval")])
-            opto_data[rename("Pixel Num")] = int(opto_data[rename("Pixel Num")])
+                if line[:len(_DATA_HEADER)] == _DATA_HEADER:
+                    columns = [_rename(col) for col in line.split(";")]
+                    break
+                key, value = line.split(";")
+                header[_rename(key.strip())] = value.strip()
+            if len(columns) == 0:
+                raise ValueError(f"Data header '{_DATA_HEADER}' is not found.")
+            data: np.ndarray = np.loadtxt(stream, delimiter=";", ndmin=2, dtype=np.float64)
+        finally:
+            if isinstance(source, (str, Path)):
+                stream.close()
+            elif stream is not source and isinstance(stream, io.TextIOWrapper):
+                # The wrapper would close the caller's binary stream when collected
+                stream.detach()
+
+        arrays: dict[str, np.ndarray] = {col: data[:, idx] for idx, col in enumerate(columns)}
+        arrays["pixel"] = arrays["pixel"].astype(np.int64)
+        return header, arrays
+
+    @staticmethod
+    def read_opto_file(file_path: Path | str | bytes | IO, subject_id: str) -> "OptoFile":
+        header, arrays = OptoFile.parse_opto_file(file_path)
+        opto_data: dict[str, Any] = {_rename("Subject ID"): subject_id}
+        opto_data.update(header)
+        for col, values in arrays.items():
+            opto_data[col] = values.tolist()
+
+        opto_data[_rename("Created")] = datetime.strptime(opto_data[_rename("Created")], "%m/%d/%Y %H:%M:%S %p")
+        opto_data[_rename("Integration Time(ms)")] = int(opto_data[_rename("Integration Time(ms)")])
+        opto_data[_rename("Laser Power(mW)")] = int(opto_data[_rename("Laser Power(mW)")])
+        opto_data[_rename("Average Number")] = int(opto_data[_rename("Average Number")])
+        opto_data[_rename("Scan Interval")] = int(opto_data[_rename("Scan Interval")])
+        opto_data[_rename("Pixel Num")] = int(opto_data[_rename("Pixel Num")])
         return OptoFile(**opto_data)
\ No newline at end of file
@@ -0,0 +1,152 @@
+"""
+Compact storage of the `OptoFile` arrays.
+
+A packed `OptoFile` keeps `raw`, `dark`, `dark_subtracted` and `baseline_subtracted` as BSON Binary blobs
+(`PackedArray`, float32 or float64) in `packed`, and refers to its `pixel`/`raman_shift` with `axis_key`.
+The axis is stored once per device calibration in the `axes` collection.
+
+Migrate existing documents with
+
+    uv run python -m src.db.packed --dtype float32
+    uv run python -m src.db.packed --unpack
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import sys
+from collections import OrderedDict
+from typing import Iterable
+import numpy as np
+from odmantic import EmbeddedModel, Model, Field
+from ._var import engine
+
+AXIS_FIELDS: list[str] = ["pixel", "raman_shift"]
+SPECTRUM_FIELDS: list[str] = ["raw", "dark", "dark_subtracted", "baseline_subtracted"]
+DTYPES: dict[str, np.dtype] = {
+    "float32": np.dtype("<f4"),
+    "float64": np.dtype("<f8"),
+}
+_AXES_CACHE_SIZE:int = int(os.environ.get("AXES_CACHE_SIZE", "256"))
+
+
+class PackedArray(EmbeddedModel):
+    dtype: str       = Field(description="NumPy dtype, little-endian (e.g. '<f4')")
+    shape: list[int] = Field(description="Shape")
+    data: bytes      = Field(description="Raw bytes, C order")
+
+    @staticmethod
+    def pack(array: np.ndarray, dtype: np.dtype | str | None = None) -> "PackedArray":
+        array = np.asarray(array, dtype=dtype)
+        array = np.ascontiguousarray(array, dtype=array.dtype.newbyteorder("<"))
+        return PackedArray(dtype=array.dtype.str, shape=list(array.shape), data=array.tobytes())
+
+    def unpack(self) -> np.ndarray:
+        """
+        Return the array. It is a read-only view of `data`.
+        """
+        return np.frombuffer(self.data, dtype=np.dtype(self.dtype)).reshape(self.shape)
+
+
+class Axis(Model):
+    key: str             = Field(primary_field=True, description="'<device_sn>:<hash of pixel and raman_shift>'")
+    device_sn: str       = Field(description="Device Sn")
+    pixel: PackedArray   = Field(description="Pixel")
+    raman_shift: PackedArray = Field(description="Raman Shift")
+
+    model_config = {
+        "collection": "axes",
+    }
+
+    @staticmethod
+    def create(device_sn: str, pixel: np.ndarray, raman_shift: np.ndarray) -> "Axis":
+        pixel = PackedArray.pack(pixel, dtype="<i8")
+        raman_shift = PackedArray.pack(raman_shift, dtype="<f8")
+        digest = hashlib.sha1(pixel.data + raman_shift.data).hexdigest()[:16]
+        return Axis(key=f"{device_sn}:{digest}", device_sn=device_sn, pixel=pixel, raman_shift=raman_shift)
+
+
+# The key is content-addressed, so a cached axis is never stale.
+# At most `AXES_CACHE_SIZE` axes (and saved keys) are kept, the least recently used are dropped first.
+_axes: OrderedDict[str, Axis] = OrderedDict()
+_saved: OrderedDict[str, None] = OrderedDict()
+
+
+def _remember(cache: OrderedDict, key: str, value) -> None:
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > _AXES_CACHE_SIZE:
+        cache.popitem(last=False)
+
+
+def register_axis(axis: Axis) -> None:
+    _remember(_axes, axis.key, axis)
+
+
+def get_axis(key: str) -> Axis:
+    if key not in _axes:
+        raise KeyError(f"Axis {key=} is not loaded. Use `await load_axes(...)` first.")
+    _axes.move_to_end(key)
+    return _axes[key]
+
+
+async def load_axes(keys: Iterable[str | None]) -> None:
+    missing = {key for key in keys if key is not None and key not in _axes}
+    if len(missing) == 0:
+        return
+    for axis in await engine.find(Axis, Axis.key.in_(list(missing))):  # type: ignore
+        _remember(_axes, axis.key, axis)
+        _remember(_saved, axis.key, None)
+
+
+async def save_axes(axes: Iterable[Axis]) -> None:
+    for axis in axes:
+        if axis.key not in _saved:
+            await engine.save(axis)
+        _remember(_axes, axis.key, axis)
+        _remember(_saved, axis.key, None)
+
+
+async def migrate(dtype: str | None = "float32", batch_size: int = 100) -> int:
+    """
+    Pack (or unpack, if `dtype` is None) every `OptoFile` document that is not in that form yet.
+    Returns the number of documents updated.
+    """
+    from pymongo import UpdateOne
+    from .optofile import OptoFile
+    collection = engine.get_collection(OptoFile)
+    array_fields = AXIS_FIELDS + SPECTRUM_FIELDS
+    if dtype is None:
+        query: dict = {"packed": {"$ne": None}}
+    else:
+        query = {"packed": None, "raw": {"$ne": None}}
+    count = 0
+    requests: list[UpdateOne] = []
+    async for doc in collection.find(query):
+        optofile = OptoFile.model_validate_doc(doc)
+        if dtype is None:
+            await load_axes([optofile.axis_key])
+            optofile.unpack()
+        else:
+            await save_axes([optofile.pack(dtype)])
+        updated = optofile.model_dump_doc()
+        fields = ["packed", "axis_key", *array_fields]
+        requests.append(UpdateOne({"_id": doc["_id"]}, {"$set": {field: updated[field] for field in fields}}))
+        if len(requests) >= batch_size:
+            count += (await collection.bulk_write(requests, ordered=False)).modified_count
+            requests = []
+            print(f"{count} documents updated", file=sys.stderr)
+    if len(requests) > 0:
+        count += (await collection.bulk_write(requests, ordered=False)).modified_count
+    return count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog="python -m src.db.packed", description="Pack or unpack the OptoFile arrays.")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--dtype", choices=list(DTYPES), default="float32")
+    group.add_argument("--unpack", action="store_true", help="Convert back to BSON arrays.")
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+    count = asyncio.run(migrate(dtype=None if args.unpack else args.dtype, batch_size=args.batch_size))
+    print(f"{count} documents updated")
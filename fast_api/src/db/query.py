@@ -0,0 +1,200 @@
+"""
+Streaming, projection-aware queries on `raman.optofiles` that bypass the ODMantic models.
+
+    matrix = await fetch_matrix("baseline_subtracted", subject_ids=["s1", "s2"], fields=["subject_id", "created", "glucose_target"])
+    matrix.X               # (n_samples, n_pixels)
+    matrix.raman_shift     # (n_pixels, ), when every sample shares the axis
+    pd.DataFrame(matrix.meta)
+
+Documents are read as plain dicts with only the requested fields, in batches, and their arrays
+(BSON arrays or packed, see `src.db.packed`) are copied straight into NumPy.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, AsyncIterator
+import numpy as np
+from .optofile import OptoFile
+from .packed import AXIS_FIELDS, SPECTRUM_FIELDS, get_axis, load_axes
+from ._var import engine
+
+_BATCH_SIZE: int = 256
+
+
+def build_query(subject_ids: list[str] | None = None, start: datetime | None = None, end: datetime | None = None,
+                query: dict[str, Any] | None = None) -> dict[str, Any]:
+    """
+    Mongo filter for the subjects and the `created` range [start, end).
+    """
+    query = dict(query or {})
+    if subject_ids is not None:
+        query["subject_id"] = {"$in": list(subject_ids)}
+    created: dict[str, datetime] = {}
+    if start is not None:
+        created["$gte"] = start
+    if end is not None:
+        created["$lt"] = end
+    if len(created) > 0:
+        query["created"] = created
+    return query
+
+
+def build_projection(fields: list[str], arrays: list[str] = []) -> dict[str, int]:
+    """
+    Projection of `fields` plus `arrays` in both storages (the list field, `packed.<name>` and `axis_key`).
+    """
+    projection = {name: 1 for name in fields}
+    for name in arrays:
+        if name not in AXIS_FIELDS + SPECTRUM_FIELDS:
+            raise KeyError(f"'{name}' is not an array field")
+        projection[name] = 1
+        projection["axis_key"] = 1
+        if name in SPECTRUM_FIELDS:
+            projection[f"packed.{name}"] = 1
+    if "_id" not in fields:
+        projection["_id"] = 0
+    return projection
+
+
+def get_array(doc: dict[str, Any], name: str) -> np.ndarray:
+    """
+    The array `name` of a raw `OptoFile` document, whichever the storage.
+    The axis of a packed document must be loaded (`load_axes`).
+    """
+    values = doc.get(name)
+    if values is not None:
+        return np.asarray(values, dtype=np.int64 if name == "pixel" else np.float64)
+    if name in AXIS_FIELDS and doc.get("axis_key") is not None:
+        return getattr(get_axis(doc["axis_key"]), name).unpack()
+    packed = (doc.get("packed") or {}).get(name)
+    if packed is not None:
+        return np.frombuffer(packed["data"], dtype=np.dtype(packed["dtype"])).reshape(packed["shape"])
+    raise KeyError(f"'{name}' is not stored")
+
+
+def _column(values: list) -> np.ndarray:
+    if len(values) > 0 and all(isinstance(v, datetime) for v in values):
+        return np.array(values, dtype="datetime64[ms]")
+    return np.array(values)
+
+
+@dataclass
+class SpectraMatrix:
+    """
+    Spectra of many documents as one matrix.
+
+    Attributes
+    ----------
+    X : NDArray of shape (n_samples, n_pixels)
+    meta : dict of {field: NDArray of shape (n_samples, )}
+        Datetimes are `datetime64[ms]`, missing values are None (object arrays).
+    axes : list of NDArray of shape (n_pixels, )
+        The distinct Raman Shift axes.
+    axis_index : NDArray of shape (n_samples, )
+        The axis of each sample in `axes`.
+    """
+    X: np.ndarray
+    meta: dict[str, np.ndarray] = field(default_factory=dict)
+    axes: list[np.ndarray] = field(default_factory=list)
+    axis_index: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.int64))
+
+    def __len__(self) -> int:
+        return self.X.shape[0]
+
+    @property
+    def raman_shift(self) -> np.ndarray:
+        if len(self.axes) != 1:
+            raise ValueError(f"Samples are on {len(self.axes)} Raman Shift axes. Use `axes` and `axis_index`.")
+        return self.axes[0]
+
+    @staticmethod
+    def from_docs(docs: list[dict[str, Any]], array: str = "baseline_subtracted", fields: list[str] = [],
+                  dtype: np.dtype | type = np.float64) -> "SpectraMatrix":
+        X = np.empty((len(docs), 0), dtype=dtype)
+        if len(docs) > 0:
+            X = np.stack([get_array(doc, array) for doc in docs]).astype(dtype, copy=False)
+        meta = {name: _column([doc.get(name) for doc in docs]) for name in fields}
+
+        # Packed documents share their axis by key; list documents are compared by value.
+        axes: list[np.ndarray] = []
+        index: dict[Any, int] = {}
+        axis_index = np.empty(len(docs), dtype=np.int64)
+        for i, doc in enumerate(docs):
+            key = doc.get("axis_key")
+            raman_shift = None
+            if key is None:
+                raman_shift = get_array(doc, "raman_shift")
+                key = raman_shift.tobytes()
+            if key not in index:
+                index[key] = len(axes)
+                axes.append(get_array(doc, "raman_shift") if raman_shift is None else raman_shift)
+            axis_index[i] = index[key]
+        return SpectraMatrix(X=X, meta=meta, axes=axes, axis_index=axis_index)
+
+    @staticmethod
+    def concatenate(matrices: list["SpectraMatrix"]) -> "SpectraMatrix":
+        if len(matrices) == 0:
+            return SpectraMatrix(X=np.empty((0, 0)))
+        axes: list[np.ndarray] = []
+        index: dict[bytes, int] = {}
+        axis_index: list[np.ndarray] = []
+        for matrix in matrices:
+            remap = []
+            for axis in matrix.axes:
+                key = axis.tobytes()
+                if key not in index:
+                    index[key] = len(axes)
+                    axes.append(axis)
+                remap.append(index[key])
+            axis_index.append(np.asarray(remap, dtype=np.int64)[matrix.axis_index])
+        X = np.concatenate([m.X for m in matrices if len(m) > 0] or [matrices[0].X])
+        meta = {name: np.concatenate([m.meta[name] for m in matrices]) for name in matrices[0].meta}
+        return SpectraMatrix(X=X, meta=meta, axes=axes, axis_index=np.concatenate(axis_index))
+
+
+async def iter_optofiles(fields: list[str], arrays: list[str] = [], subject_ids: list[str] | None = None,
+                         start: datetime | None = None, end: datetime | None = None, query: dict[str, Any] | None = None,
+                         batch_size: int = _BATCH_SIZE, collection=None) -> AsyncIterator[list[dict[str, Any]]]:
+    """
+    Stream raw `OptoFile` documents in batches of `batch_size`, sorted by (subject_id, created).
+
+    Parameters
+    ----------
+    fields : list of str
+        Scalar fields to return (e.g. ['subject_id', 'created', 'glucose_target']).
+    arrays : list of str
+        Array fields to return (read them with `get_array`). The axes of packed documents are loaded.
+    subject_ids, start, end, query :
+        See `build_query`.
+    """
+    if collection is None:
+        collection = engine.get_collection(OptoFile)
+    cursor = collection.find(build_query(subject_ids, start, end, query), projection=build_projection(fields, arrays),
+                             sort=[("subject_id", 1), ("created", 1)], batch_size=batch_size)
+    batch: list[dict[str, Any]] = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            await load_axes(doc.get("axis_key") for doc in batch)
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        await load_axes(doc.get("axis_key") for doc in batch)
+        yield batch
+
+
+async def fetch_matrix(array: str = "baseline_subtracted", fields: list[str] = ["subject_id", "created", "glucose_target"],
+                       subject_ids: list[str] | None = None, start: datetime | None = None, end: datetime | None = None,
+                       query: dict[str, Any] | None = None, dtype: np.dtype | type = np.float64,
+                       batch_size: int = _BATCH_SIZE, collection=None) -> SpectraMatrix:
+    """
+    Fetch `array` of every matching document as one (n_samples, n_pixels) matrix with the `fields` as metadata.
+    Each batch is converted (and released) as soon as it arrives.
+    """
+    matrices: list[SpectraMatrix] = []
+    async for batch in iter_optofiles(fields, arrays=[array, "raman_shift"], subject_ids=subject_ids, start=start, end=end,
+                                      query=query, batch_size=batch_size, collection=collection):
+        matrices.append(SpectraMatrix.from_docs(batch, array=array, fields=fields, dtype=dtype))
+    matrix = SpectraMatrix.concatenate(matrices)
+    if len(matrices) == 0:
+        matrix.meta = {name: np.array([]) for name in fields}
+    return matrix
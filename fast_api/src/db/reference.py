@@ -0,0 +1,162 @@
+"""
+Glucose targets from the finger-prick reference series (`data/<subject_id>.csv`, columns created,glucose).
+
+    uv run python -m src.db.reference ../data --subjects s1 s2
+
+A spectrum within `tolerance` of a prick gets that reading (`is_interpolated=False`, `prick_time` set), like
+`map_glucose_target` in `notebook/0-db.ipynb`. A spectrum between two pricks gets the reference curve
+interpolated at its `created` (`is_interpolated=True`). Spectra outside the series are left unlabelled.
+"""
+import argparse
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any
+import numpy as np
+from scipy.interpolate import make_interp_spline  # type: ignore
+from pymongo import UpdateOne
+from .optofile import OptoFile
+from .query import iter_optofiles
+from ._var import engine
+
+_REFERENCE_DIR: str = os.environ.get("REFERENCE_DIR", "../data")
+_TOLERANCE: timedelta = timedelta(minutes=3)
+# "quadratic" is the notebook's `interpolate(method='polynomial', order=2)`, fitted on time instead of row number.
+KINDS: list[str] = ["linear", "quadratic"]
+
+
+def _to_seconds(times) -> np.ndarray:
+    return np.asarray(times, dtype="datetime64[s]").astype(np.int64)
+
+
+class ReferenceCurves:
+    """
+    The reference series of every subject, as sorted (time in seconds, glucose) arrays, loaded once.
+    """
+
+    def __init__(self, series: dict[str, tuple[np.ndarray, np.ndarray]], kind: str = "quadratic"):
+        if kind not in KINDS:
+            raise ValueError(f"`kind` must be one of {KINDS}. Got {kind=}")
+        self.kind = kind
+        self.series: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        self._splines: dict[str, Any] = {}
+        for subject_id, (times, glucose) in series.items():
+            t = _to_seconds(times)
+            order = np.argsort(t, kind="stable")
+            t, g = t[order], np.asarray(glucose, dtype=np.float64)[order]
+            self.series[subject_id] = (t, g)
+            if kind == "quadratic" and len(t) > 2:
+                self._splines[subject_id] = make_interp_spline(t, g, k=2)
+
+    @staticmethod
+    def load(directory: Path | str = _REFERENCE_DIR, kind: str = "quadratic") -> "ReferenceCurves":
+        """
+        Read every `<subject_id>.csv` of `directory`.
+        """
+        series = {}
+        for path in sorted(Path(directory).glob("*.csv")):
+            data = np.loadtxt(path, delimiter=",", skiprows=1, dtype=str, ndmin=2)
+            times = np.array([value.replace(" ", "T") for value in data[:, 0]], dtype="datetime64[s]")
+            series[path.stem] = (times, data[:, 1].astype(np.float64))
+        return ReferenceCurves(series, kind=kind)
+
+    @property
+    def subject_ids(self) -> list[str]:
+        return list(self.series)
+
+    def label(self, subject_ids: np.ndarray | list[str], created: np.ndarray | list[datetime],
+              tolerance: timedelta = _TOLERANCE) -> dict[str, np.ndarray]:
+        """
+        Glucose targets of a batch of spectra, any mix of subjects.
+
+        Returns
+        -------
+        dict of NDArray of shape (n_samples, ) :
+            'glucose_target' (NaN when unlabelled), 'is_interpolated' (bool),
+            'prick_time' (datetime64[s], NaT unless the reading of a prick is used) and 'labelled' (bool).
+        """
+        subject_ids = np.asarray(subject_ids)
+        t = _to_seconds(created)
+        n = t.shape[0]
+        glucose = np.full(n, np.nan)
+        is_interpolated = np.zeros(n, dtype=bool)
+        prick = np.full(n, np.iinfo(np.int64).min)
+        limit = int(tolerance.total_seconds())
+
+        for subject_id in np.unique(subject_ids):
+            if subject_id not in self.series:
+                continue
+            rows = np.flatnonzero(subject_ids == subject_id)
+            ref_t, ref_g = self.series[subject_id]
+            q = t[rows]
+            # Nearest prick: compare the neighbours found by searchsorted
+            right = np.clip(np.searchsorted(ref_t, q), 0, len(ref_t) - 1)
+            left = np.clip(right - 1, 0, len(ref_t) - 1)
+            nearest = np.where(np.abs(ref_t[left] - q) <= np.abs(ref_t[right] - q), left, right)
+            is_prick = np.abs(ref_t[nearest] - q) <= limit
+            glucose[rows[is_prick]] = ref_g[nearest[is_prick]]
+            prick[rows[is_prick]] = ref_t[nearest[is_prick]]
+
+            between = ~is_prick & (q > ref_t[0]) & (q < ref_t[-1])
+            if between.any():
+                if subject_id in self._splines:
+                    values = self._splines[subject_id](q[between])
+                else:
+                    values = np.interp(q[between], ref_t, ref_g)
+                glucose[rows[between]] = values
+                is_interpolated[rows[between]] = True
+
+        return {
+            "glucose_target": glucose,
+            "is_interpolated": is_interpolated,
+            "prick_time": prick.astype("datetime64[s]"),
+            "labelled": ~np.isnan(glucose),
+        }
+
+
+def _updates(docs: list[dict[str, Any]], labels: dict[str, np.ndarray]) -> list[UpdateOne]:
+    requests = []
+    for i in np.flatnonzero(labels["labelled"]):
+        prick_time = labels["prick_time"][i]
+        requests.append(UpdateOne({"_id": docs[i]["_id"]}, {"$set": {
+            "glucose_target": float(labels["glucose_target"][i]),
+            "is_interpolated": bool(labels["is_interpolated"][i]),
+            "prick_time": None if np.isnat(prick_time) else prick_time.astype(datetime),
+        }}))
+    return requests
+
+
+async def label_optofiles(curves: ReferenceCurves, subject_ids: list[str] | None = None, overwrite: bool = False,
+                          tolerance: timedelta = _TOLERANCE, batch_size: int = 1000, collection=None) -> int:
+    """
+    Label the stored spectra of `subject_ids` (every subject with a reference series by default)
+    with one `bulk_write` per batch. Spectra that already have a `glucose_target` are kept unless `overwrite`.
+    Returns the number of documents updated.
+    """
+    if collection is None:
+        collection = engine.get_collection(OptoFile)
+    query = None if overwrite else {"glucose_target": None}
+    count = 0
+    async for docs in iter_optofiles(["_id", "subject_id", "created"], subject_ids=subject_ids or curves.subject_ids,
+                                     query=query, batch_size=batch_size, collection=collection):
+        labels = curves.label([doc["subject_id"] for doc in docs], [doc["created"] for doc in docs], tolerance=tolerance)
+        requests = _updates(docs, labels)
+        if len(requests) > 0:
+            count += (await collection.bulk_write(requests, ordered=False)).modified_count
+    return count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog="python -m src.db.reference", description="Label OptoFile documents with the reference glucose.")
+    parser.add_argument("directory", nargs="?", type=Path, default=Path(_REFERENCE_DIR), help="Folder of <subject_id>.csv")
+    parser.add_argument("--subjects", nargs="+", default=None)
+    parser.add_argument("--kind", choices=KINDS, default="quadratic")
+    parser.add_argument("--tolerance", type=float, default=_TOLERANCE.total_seconds(), help="Seconds to a prick.")
+    parser.add_argument("--overwrite", action="store_true", help="Also relabel documents that have a glucose_target.")
+    args = parser.parse_args()
+    curves = ReferenceCurves.load(args.directory, kind=args.kind)
+    count = asyncio.run(label_optofiles(curves, subject_ids=args.subjects, overwrite=args.overwrite,
+                                        tolerance=timedelta(seconds=args.tolerance)))
+    print(f"{count} documents labelled", file=sys.stderr)
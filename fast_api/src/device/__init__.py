@@ -1,13 +1,21 @@
 import asyncio
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from functools import partial
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 from datetime import datetime, timedelta
+from google.protobuf.json_format import MessageToDict
 import grpc
-import os
 import numpy as np
 import json
-from rpc import raman_pb2, raman_pb2_grpc
+from rpc import raman_pb2
+from .client import RamanClient, client
+from .session import DeviceSession, session
+from .baseline import baseline_correction, baseline_correction_batch
+from .hub import CCDHub, Frame, Subscription, END_OF_STREAM
+from .jobs import Job, JobScheduler, JobStatus, Lane, MeasureRequest, FAILED
+from . import protocol
+from src.inference import registry, inference, dispatcher, InferenceBusy
 
 router = APIRouter(
     responses={
@@ -17,9 +25,7 @@ router = APIRouter(
     },
 )
 
-_RPC_SERVER:str = os.environ["RPC_SERVER"]
 _x_axis = np.loadtxt("static/xaxis.txt")
-stub = raman_pb2_grpc.RamanStub(channel=grpc.insecure_channel(_RPC_SERVER))
 
 class Device(BaseModel):
     name: str
@@ -27,11 +33,10 @@ class Device(BaseModel):
     device_id: str
 
 @router.get("/", response_class=JSONResponse)
-def get_device_list() -> list[Device]:
+async def get_device_list() -> list[Device]:
     devices:list[raman_pb2.Device] = []
 
-    device_list_future = stub.GetDeviceList.future(request=raman_pb2.Empty())
-    device_list:raman_pb2.DeviceList = device_list_future.result()
+    device_list:raman_pb2.DeviceList = await client.get_device_list()
     device:raman_pb2.Device
     for device in device_list.devices:
         devices.append(device)
@@ -41,22 +46,34 @@ def get_device_list() -> list[Device]:
 
 class DeviceStatus(BaseModel):
     IsConnected: bool
-    device: Device
-    laser_power: int
-    exposure: int
-    accumulations: int
+    device: Device | None = None
+    laser_power: int | None = None
+    exposure: int | None = None
+    accumulations: int | None = None
+    temperature: float | None = None
     x_axis: list[float] = _x_axis.tolist()
 
+    @staticmethod
+    def from_proto(status: raman_pb2.DeviceStatus) -> "DeviceStatus":
+        return DeviceStatus(**MessageToDict(status, preserving_proto_field_name=True, always_print_fields_with_no_presence=True))
+
+@router.get("/status", response_class=JSONResponse)
+async def get_device_status() -> DeviceStatus | None:
+    """
+    The device status cached by the session (refreshed by the heartbeat), without a device round trip.
+    """
+    return DeviceStatus.from_proto(session.status) if session.status is not None else None
+
 @router.get("/connect/{index}", response_class=JSONResponse)
-def get_device_connect(index: int) -> DeviceStatus:
-    status:raman_pb2.DeviceStatus = stub.Connect(raman_pb2.ConnectRequest(index=index))
-    return status
+async def get_device_connect(index: int) -> DeviceStatus:
+    status:raman_pb2.DeviceStatus = await session.connect(index=index)
+    return DeviceStatus.from_proto(status)
 
 
 @router.get("/measure_conf/{laser_power}/{exposure}/{accumulation}", response_class=JSONResponse)
-def get_device_measure_conf(laser_power: int, exposure: int, accumulation: int) -> DeviceStatus:
-    status:raman_pb2.DeviceStatus = stub.SetMeasureConf(raman_pb2.MeasureConfRequest(exposure=exposure, laser_power=laser_power, accumulations=accumulation))
-    return status
+async def get_device_measure_conf(laser_power: int, exposure: int, accumulation: int) -> DeviceStatus:
+    status:raman_pb2.DeviceStatus = await session.configure(laser_power=laser_power, exposure=exposure, accumulations=accumulation)
+    return DeviceStatus.from_proto(status)
 
 
 class ConnectionManager:
@@ -75,8 +92,8 @@ class ConnectionManager:
         await websocket.send_text(message)
 
     async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
+        # Send concurrently so one slow client does not hold up the others
+        await asyncio.gather(*[connection.send_text(message) for connection in self.active_connections], return_exceptions=True)
 
 manager = ConnectionManager()
 
@@ -105,69 +122,83 @@ class CCD(BaseModel):
     data_type: str
 
 
+def to_ccd(ccd: raman_pb2.CCD) -> CCD:
+    return CCD(time=ccd.time.ToDatetime(),
+               duration=timedelta(seconds=ccd.duration.seconds + ccd.duration.nanos*1e-9),
+               data=ccd.data,
+               data_type=ccd.data_type
+               )
+
+def encode_frame(frame: Frame, format: str = "json", corrected: bool = True) -> str | bytes:
+    """
+    Encode a CCD frame as a JSON `CCD` message or, for format 'float32'/'float64', as a binary frame (see `protocol`).
+    """
+    if format == "json":
+        data = to_ccd(frame.ccd)
+        if corrected:
+            data.corrected_data = frame.corrected.tolist()
+        return data.model_dump_json()
+    return protocol.encode_ccd(time=frame.ccd.time.ToDatetime(),
+                               duration=timedelta(seconds=frame.ccd.duration.seconds + frame.ccd.duration.nanos*1e-9),
+                               data_type=frame.ccd.data_type,
+                               data=frame.data,
+                               corrected_data=frame.corrected if corrected else None,
+                               format=format)
+
+FORMATS:list[str] = ["json", *protocol.FORMATS]
+
+async def send_frame(websocket: WebSocket, message: str | bytes):
+    if isinstance(message, bytes):
+        await websocket.send_bytes(message)
+    else:
+        await manager.send_personal_message(message, websocket)
+
+hub = CCDHub(client=client, encoders={format: partial(encode_frame, format=format) for format in FORMATS})
+
+async def forward_ccd(subscription: Subscription, websocket: WebSocket, format: str):
+    while True:
+        item = await subscription.get()
+        if isinstance(item, Frame):
+            # if(data.data_type == 'signal'):
+            #     print(np.array(data.data).shape)
+            #     data.data = (np.array(data.data) - np.array(prev_data.data)).tolist()
+            #     data.corrected_data = baseline_correction(np.array(data.data)).tolist()
+            #     data.data_type = 'spectrum'
+            await send_frame(websocket, item.encode(format))
+        elif isinstance(item, grpc.aio.AioRpcError):
+            serv_msg = ServerMessage(is_ok=False, detail=f"Device error | {item.code().name}: {item.details()}")
+            await manager.send_personal_message(serv_msg.model_dump_json(), websocket)
+        elif isinstance(item, Exception):
+            serv_msg = ServerMessage(is_ok=False, detail=f"CCD error | {item!r}")
+            await manager.send_personal_message(serv_msg.model_dump_json(), websocket)
+
 @router.websocket("/ws/ccd")
-async def read_ccd(websocket: WebSocket):
+async def read_ccd(websocket: WebSocket, format: str = "json"):
+    """
+    Stream CCD frames. `?format=float32` or `?format=float64` sends binary frames (see `protocol`) instead of JSON.
+    """
+    if format not in FORMATS:
+        await websocket.close(code=1003, reason=f"Unknown {format=}. Use one of {FORMATS}")
+        return
     await manager.connect(websocket)
+    # Every client watches the same ReadCCD stream through the hub
+    subscription:Subscription = hub.subscribe()
+    sender:asyncio.Task = asyncio.create_task(forward_ccd(subscription, websocket, format))
     try:
         while True:
             action:str = await websocket.receive_text()
             if(action == "read_ccd"):
-                prev_data = None
-                for ccd in stub.ReadCCD(raman_pb2.Empty()):
-                    data = CCD(time=ccd.time.ToDatetime(), 
-                               duration=timedelta(seconds=ccd.duration.seconds + ccd.duration.nanos*1e-9), 
-                               data=ccd.data,
-                               corrected_data=baseline_correction(np.array(ccd.data)).tolist(),
-                               data_type=ccd.data_type
-                               )
-                    # if(data.data_type == 'signal'):
-                    #     print(np.array(data.data).shape)
-                    #     data.data = (np.array(data.data) - np.array(prev_data.data)).tolist()
-                    #     data.corrected_data = baseline_correction(np.array(data.data)).tolist()
-                    #     data.data_type = 'spectrum'
-                    await manager.send_personal_message(data.model_dump_json(), websocket)
-                    prev_data = data
+                hub.start(subscription)
+            elif(action == "stop"):
+                hub.stop(subscription)
     except WebSocketDisconnect:
         manager.disconnect(websocket)
+    finally:
+        # The ReadCCD call is cancelled when no client requests it anymore
+        hub.unsubscribe(subscription)
+        sender.cancel()
 
-def baseline_correction(signal: np.ndarray):
-    window_size:int = 7
-    baseline_signal: np.ndarray = signal.copy()
-    original_signal_itera: np.ndarray = signal.copy()
-
-    for _ in range(20):
-        start_window:int = (window_size - 1) // 2
-        end_window  :int = (window_size + 1) // 2
-        # This is padding
-        # ([a[0]] * 3) + a + ([a[-1]] * 3)
-        original_signal_itera_before: list[float] = ([original_signal_itera[0]] * start_window) + original_signal_itera.tolist() + ([original_signal_itera[-1]] * end_window )
-        # for temp1 in range(start_window):
-        #     original_signal_itera_before.append(original_signal_itera[temp1])
-        #     for j in original_signal_itera:
-        #         original_signal_itera_before.append(j)
-        #     original_signal_itera_before[-1] = original_signal_itera[-1]
-        #     original_signal_itera = np.array(original_signal_itera_before)
-        original_signal_itera_after: list[float] = []
-
-        for temp1 in range(len(signal)):
-            _Temporigin_signal_itera_before:list[float] = []
-            for j in range(temp1 + window_size - temp1):
-                _Temporigin_signal_itera_before.append(original_signal_itera_before[j + temp1])
-            avg:float = sum(_Temporigin_signal_itera_before)/len(_Temporigin_signal_itera_before)
-            original_signal_itera_after.append(avg)
-
-
-        r1:np.ndarray = np.array(baseline_signal) - np.array(original_signal_itera_after)
-        for idx, point in enumerate(r1):
-            if point > 0:
-                baseline_signal[idx] = original_signal_itera_after[idx]
-        window_size = window_size + 4
-        original_signal_itera = baseline_signal.copy()
-
-    corrected_signal: np.ndarray = signal - baseline_signal
-    return corrected_signal
-
-class ClientMessage(BaseModel):
+class ClientMessage(MeasureRequest):
     action: str
 
 class ServerMessage(BaseModel):
@@ -178,96 +209,159 @@ class ServerMessage(BaseModel):
     progress: float | None = None
 
 
-async def get_raman_shift() -> list[float]:
+@router.get("/models", response_class=JSONResponse)
+def get_models() -> dict:
+    return {"default": registry.default, "models": registry.names}
+
+async def get_raman_shift() -> np.ndarray:
     # from src.db import OptoFile
     # from datetime import datetime
 
     # created = datetime.strptime("2025-09-25 08:16:44", "%Y-%m-%d %H:%M:%S")
     # optofile = await OptoFile.fetch(subject_id='s1', created=created)
     # return optofile.raman_shift
-    import pickle
-    with open("models/ramanshift", 'rb') as f:
-        shift = pickle.load(f)
-    return shift
-
-async def create_sample(spectrum:list[float]):
-    from src.spectra import Sample
-    import numpy as np
-    from rampy import baseline as rbaseline
-
-    raman_shift:list[float] = await get_raman_shift()
-    sample:Sample = Sample(
-        x=np.array(raman_shift),
-        y=np.array(spectrum),
-        interpolate=False,
-        verbose=True
-    )
-    sample.despike(window_length=10,threshold=5)
-    sample.interpolate(step=1)
-    sample.extract_range(low=750, high=1650)
-    sample.smoothing(window_length=60, polyorder=1)
-    signal_y, by = rbaseline(sample.x, sample.y, roi=[[905, 915],[1050, 1070],[1100, 1150],[1400,1460]])
-    sample.y = signal_y.reshape(-1)
-    # f911  = sample.at(np.arange(905, 915)).mean()
-    # f1060 = sample.at(np.arange(1050, 1070)).mean()
-    # f1125 = sample.at(np.arange(1125, 1170)).mean()
-    # f1450 = sample.at(np.arange(1440, 1460)).mean()
-    sample.normalized(method='minmax')
-    sample.extract_range(low=800, high=1600)
-    return sample
-
-async def predict(spectrum:list[float]) -> float:
-    import pickle
-    from src.spectra import Sample
-    with open("models/GridSearch-RandomForestRegressor", 'rb') as f:
-        model = pickle.load(f)
-    with open("models/GridSearch-RandomForestRegressor_pca", 'rb') as f:
-        pca = pickle.load(f)
-
-    sample:Sample = await create_sample(spectrum=spectrum)
-    pred = float(model.predict(pca.transform(sample.y.reshape(1,-1)))[0])
+    return registry.raman_shift()
+
+async def create_sample(spectrum:list[float], raman_shift:np.ndarray | None = None):
+    # The `Sample` chain runs in the inference pool, not on the event loop
+    return await inference.create_sample(spectrum, raman_shift=raman_shift)
+
+async def predict(spectrum:list[float], model_name:str | None = None) -> float:
+    # Batched with the other measurements finishing at the same time, then run in the inference pool
+    # (see `src.inference.batching`)
+    pred = await dispatcher.predict(spectrum, model_name=model_name)
     return pred
 
+async def run_measurement(lane: Lane, job: Job) -> dict | None:
+    """
+    Measure glucose with the device of `lane`, publishing the progress to `job` (see `jobs.JobScheduler`).
+    """
+    request:MeasureRequest = job.request
+    serv_msg:ServerMessage
+    try:
+        job.publish(ServerMessage(is_ok=True, message="Device is initializing...", progress=10.0))
+        # The session only re-connects / re-configures the device when needed.
+        status:DeviceStatus = DeviceStatus.from_proto(await lane.session.connect(index=request.device))
+        if(status.IsConnected == False):
+            serv_msg = ServerMessage(is_ok=False, detail="Device is not connected", data={"device_status": status.model_dump()})
+            job.publish(serv_msg)
+            job.finish(FAILED, detail=serv_msg.detail)
+            return None
+
+        await lane.session.configure(laser_power=request.laser_power, exposure=request.exposure, accumulations=request.accumulations)
+        signal:np.ndarray = None
+        for idx in range(request.reads):
+            async for frame in lane.hub.stream(fresh=True):
+                last_frame:Frame = frame
+                signal = frame.data.copy() if signal is None else signal + frame.data
+            progress = 30 + 40 * idx / max(request.reads - 1, 1)
+            job.publish(ServerMessage(is_ok=True, message=f"Measuring sample {idx+1}", progress=progress), last_frame)
+    except grpc.aio.AioRpcError as e:
+        lane.session.invalidate()
+        serv_msg = ServerMessage(is_ok=False, detail=f"Device error | {e.code().name}: {e.details()}")
+        job.publish(serv_msg)
+        job.finish(FAILED, detail=serv_msg.detail)
+        return None
+    except Exception as e:
+        print(f"Measurement error | {e!r}")
+        serv_msg = ServerMessage(is_ok=False, detail=f"Measurement error | {e!r}")
+        job.publish(serv_msg)
+        job.finish(FAILED, detail=serv_msg.detail)
+        return None
+
+    job.publish(ServerMessage(is_ok=True, message=f"Calculating...", progress=85))
+    try:
+        glucose = await predict(signal, model_name=request.model)
+    except (KeyError, ValueError, InferenceBusy) as e:
+        serv_msg = ServerMessage(is_ok=False, detail=str(e))
+        job.publish(serv_msg)
+        job.finish(FAILED, detail=serv_msg.detail)
+        return None
+    except Exception as e:
+        print(f"Prediction error | {e!r}")
+        serv_msg = ServerMessage(is_ok=False, detail=f"Prediction error | {e!r}")
+        job.publish(serv_msg)
+        job.finish(FAILED, detail=serv_msg.detail)
+        return None
+    data:dict = {"glucose": glucose}
+    if request.patient_id is not None and request.code is not None:
+        data["queued"] = await queue_glucose(request.patient_id, request.code, glucose)
+    job.publish(ServerMessage(is_ok=True, message=f"Complete", progress=100.0, data=data))
+    return data
+
+scheduler = JobScheduler(run=run_measurement, lane=Lane(client=client, session=session, hub=hub))
+
+def submit(request: MeasureRequest) -> Job:
+    job = scheduler.submit(request)
+    position = scheduler.status(job).position
+    if position:
+        job.publish(ServerMessage(is_ok=True, message=f"Waiting for the device ({position} measurement(s) ahead)", progress=0.0))
+    return job
+
+async def forward_job(job: Job, websocket: WebSocket, format: str = "json"):
+    """
+    Send the progress of `job`. With format 'json' the measured CCD frame is inside its progress message,
+    otherwise it follows as a binary frame (see `protocol`).
+    """
+    async for serv_msg, frame in job.events():
+        if frame is not None and format == "json":
+            serv_msg = serv_msg.model_copy(update={"data": {"ccd": to_ccd(frame.ccd).model_dump()}})
+        await manager.send_personal_message(serv_msg.model_dump_json(), websocket)
+        if frame is not None and format != "json":
+            await send_frame(websocket, encode_frame(frame, format=format, corrected=False))
+
+async def queue_glucose(patient_id:int, code:int, glucose:float) -> bool:
+    """
+    Put the prediction in the telehealth outbox. Only a local write: the upload is done by the outbox worker.
+    Returns False when it could not be queued (or was already).
+    """
+    from src.api import Code, GlucoseRecord
+    from src.outbox import outbox
+    try:
+        record = GlucoseRecord(user_id=patient_id, code=Code(code), value=glucose, created_date=datetime.now())
+        return await outbox.enqueue(record)
+    except Exception as e:
+        print(f"Glucose is not queued | {e!r}")
+        return False
+
 @router.websocket("/ws/measure")
-async def ws_measure(websocket: WebSocket):
+async def ws_measure(websocket: WebSocket, format: str = "json"):
+    """
+    Measure glucose. With `?format=float32` or `?format=float64`, each measured CCD frame is sent
+    as a binary frame (see `protocol`) after its JSON progress message instead of inside it.
+    """
+    if format not in FORMATS:
+        await websocket.close(code=1003, reason=f"Unknown {format=}. Use one of {FORMATS}")
+        return
     await manager.connect(websocket)
     raw:str
+    job:Job | None = None
+    task:asyncio.Task | None = None
     try:
         while True:
             raw = await websocket.receive_text()
-            cli_msg:ClientMessage = ClientMessage(**json.loads(raw))
             serv_msg:ServerMessage
+            try:
+                cli_msg:ClientMessage = ClientMessage(**json.loads(raw))
+            except ValidationError as e:
+                # e.g. laser_power=0: reported, the socket stays open
+                serv_msg = ServerMessage(is_ok=False, detail=f"Invalid message | {e.errors(include_url=False, include_input=False)}")
+                await manager.send_personal_message(serv_msg.model_dump_json(), websocket)
+                continue
             if(cli_msg.action == "arming"):
                 serv_msg = ServerMessage(is_ok=True, message="Device is arming...")
             elif(cli_msg.action == "start"):
-                serv_msg = ServerMessage(is_ok=True, message="Device is initializing...", progress=10.0)
-                await manager.send_personal_message(serv_msg.model_dump_json(), websocket)
-                devices:list[Device] = get_device_list()
-
-                status:DeviceStatus = get_device_connect(0)
-                if(status.IsConnected == False):
-                    serv_msg = ServerMessage(is_ok=False, detail="Device is not connected", data={"device_status": status.model_dump()})
-                    await manager.send_personal_message(serv_msg.model_dump_json(), websocket)
+                if job is not None and job.is_finished == False:
+                    serv_msg = ServerMessage(is_ok=False, detail="Measurement is already running")
+                else:
+                    # The measurement is queued for its device; the handler keeps listening for disconnects.
+                    job = submit(MeasureRequest(**cli_msg.model_dump(exclude={"action"})))
+                    task = asyncio.create_task(forward_job(job, websocket, format))
                     continue
-
-                status:DeviceStatus = get_device_measure_conf(laser_power=300, exposure=3000, accumulation=1)
-                # await asyncio.sleep(2)
-                signal:np.ndarray = None
-                for idx, progress in enumerate([30,50,70]):
-                    for ccd in stub.ReadCCD(raman_pb2.Empty()):
-                        data = CCD(time=ccd.time.ToDatetime(), 
-                            duration=timedelta(seconds=ccd.duration.seconds + ccd.duration.nanos*1e-9), 
-                            data=ccd.data,
-                            data_type=ccd.data_type
-                            )
-                        
-                        signal = np.array(ccd.data) if signal is None else signal + np.array(ccd.data)
-                    serv_msg = ServerMessage(is_ok=True, message=f"Measuring sample {idx+1}", progress=progress, data={"ccd": data.model_dump()})
-                    await manager.send_personal_message(serv_msg.model_dump_json(), websocket)
-                serv_msg = ServerMessage(is_ok=True, message=f"Calculating...", progress=85)
-                await manager.send_personal_message(serv_msg.model_dump_json(), websocket)
-                glucose = await predict(signal)
-                serv_msg = ServerMessage(is_ok=True, message=f"Complete", progress=100.0, data={"glucose": glucose})
+            elif(cli_msg.action == "cancel"):
+                if job is not None:
+                    scheduler.cancel(job)
+                serv_msg = ServerMessage(is_ok=True, message="Measurement is cancelled")
             else:
                 serv_msg = ServerMessage(is_ok=False, detail="Unknown action")
             await manager.send_personal_message(serv_msg.model_dump_json(), websocket)
@@ -276,6 +370,59 @@ async def ws_measure(websocket: WebSocket):
         await manager.send_personal_message(serv_msg.model_dump_json(), websocket)
     except WebSocketDisconnect:
         manager.disconnect(websocket)
+    finally:
+        if job is not None:
+            scheduler.cancel(job)
+        if task is not None:
+            task.cancel()
+
+@router.post("/jobs", response_class=JSONResponse)
+async def post_job(request: MeasureRequest) -> JobStatus:
+    """
+    Queue a measurement on `request.device`. Follow it with `GET /jobs/{job_id}` or the `/ws/jobs/{job_id}` websocket.
+    """
+    return scheduler.status(submit(request))
+
+@router.get("/jobs", response_class=JSONResponse)
+async def get_jobs() -> list[JobStatus]:
+    return [scheduler.status(job) for job in scheduler.jobs.values()]
+
+def get_job_or_404(job_id: str) -> Job:
+    try:
+        return scheduler.get(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Job {job_id=} is not found")
+
+@router.get("/jobs/{job_id}", response_class=JSONResponse)
+async def get_job(job_id: str) -> JobStatus:
+    return scheduler.status(get_job_or_404(job_id))
+
+@router.delete("/jobs/{job_id}", response_class=JSONResponse)
+async def delete_job(job_id: str) -> JobStatus:
+    job = get_job_or_404(job_id)
+    scheduler.cancel(job)
+    return scheduler.status(job)
+
+@router.websocket("/ws/jobs/{job_id}")
+async def ws_job(websocket: WebSocket, job_id: str, format: str = "json"):
+    """
+    Stream the progress of a job from its first event, like `/ws/measure`. The socket is closed when the job is finished.
+    Disconnecting does not cancel the job.
+    """
+    if format not in FORMATS:
+        await websocket.close(code=1003, reason=f"Unknown {format=}. Use one of {FORMATS}")
+        return
+    if job_id not in scheduler.jobs:
+        await websocket.close(code=1008, reason=f"Job {job_id=} is not found")
+        return
+    await manager.connect(websocket)
+    try:
+        await forward_job(scheduler.get(job_id), websocket, format)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        manager.disconnect(websocket)
 
 # async def predict(signal: np.ndarray):
 #     asyncio.sleep(2)
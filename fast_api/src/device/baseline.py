@@ -0,0 +1,48 @@
+import numpy as np
+
+
+def baseline_correction_batch(signals: np.ndarray) -> np.ndarray:
+    """
+    Iterative moving-average baseline removal applied along the last axis.
+
+    Each of the 20 iterations smooths the current baseline with an edge-padded
+    moving average (the window grows from 7 by 4 every iteration) and keeps the
+    point-wise minimum of the baseline and its average. The moving average is
+    computed from a cumulative sum, so an iteration costs O(n_pixels) per frame.
+
+    Parameters
+    ----------
+    signals : NDArray of shape (n_frames, n_pixels) or (n_pixels, )
+        The CCD frames to correct.
+
+    Returns
+    -------
+    NDArray :
+        The corrected frames (`signals` - baseline) with the same shape as `signals`.
+    """
+    signals = np.asarray(signals)
+    frames: np.ndarray = np.atleast_2d(signals)
+    n_pixels: int = frames.shape[-1]
+    window_size: int = 7
+    baseline_signal: np.ndarray = frames.copy()
+
+    for _ in range(20):
+        start_window:int = (window_size - 1) // 2
+        end_window  :int = (window_size + 1) // 2
+        # Pad with the edge values, equivalent to ([a[0]] * start) + a + ([a[-1]] * end)
+        padded: np.ndarray = np.pad(baseline_signal.astype(np.float64), ((0, 0), (start_window, end_window)), mode="edge")
+        cumsum: np.ndarray = np.zeros((frames.shape[0], padded.shape[1] + 1))
+        np.cumsum(padded, axis=1, out=cumsum[:, 1:])
+        avg: np.ndarray = (cumsum[:, window_size:window_size + n_pixels] - cumsum[:, :n_pixels]) / window_size
+        # Lower the baseline wherever the moving average is below it
+        np.copyto(baseline_signal, avg, casting="unsafe", where=avg < baseline_signal)
+        window_size = window_size + 4
+
+    corrected_signal: np.ndarray = frames - baseline_signal
+    return corrected_signal.reshape(signals.shape)
+
+def baseline_correction(signal: np.ndarray) -> np.ndarray:
+    """
+    Baseline correction of a single CCD frame. See `baseline_correction_batch`.
+    """
+    return baseline_correction_batch(signal)
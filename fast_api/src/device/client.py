@@ -0,0 +1,77 @@
+import asyncio
+import os
+from typing import AsyncIterator
+import grpc
+from rpc import raman_pb2, raman_pb2_grpc
+
+_RPC_SERVER:str = os.environ["RPC_SERVER"]
+_RPC_TIMEOUT:float = float(os.environ.get("RPC_TIMEOUT", "10"))
+_RPC_STREAM_TIMEOUT:float = float(os.environ.get("RPC_STREAM_TIMEOUT", "60"))
+
+
+class RamanClient:
+    """
+    Non-blocking client of the Raman gRPC service (`grpc.aio`).
+
+    Every unary call has a deadline of `timeout` seconds and `read_ccd` a deadline of
+    `stream_timeout` seconds. The channel is created lazily in the running event loop
+    (and recreated if the loop changes, e.g. between tests, the old one being closed).
+    """
+
+    def __init__(self, target: str = _RPC_SERVER, timeout: float = _RPC_TIMEOUT, stream_timeout: float = _RPC_STREAM_TIMEOUT):
+        self.target = target
+        self.timeout = timeout
+        self.stream_timeout = stream_timeout
+        self._channel: grpc.aio.Channel | None = None
+        self._stub: raman_pb2_grpc.RamanStub | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    @property
+    def stub(self) -> raman_pb2_grpc.RamanStub:
+        loop = asyncio.get_running_loop()
+        if self._stub is None or self._loop is not loop:
+            if self._channel is not None and self._loop is not None and self._loop.is_closed() == False:
+                # The old channel belongs to the other loop: close it there
+                asyncio.run_coroutine_threadsafe(self._channel.close(), self._loop)
+            self._channel = grpc.aio.insecure_channel(self.target)
+            self._stub = raman_pb2_grpc.RamanStub(channel=self._channel)
+            self._loop = loop
+        return self._stub
+
+    async def get_device_list(self) -> raman_pb2.DeviceList:
+        return await self.stub.GetDeviceList(raman_pb2.Empty(), timeout=self.timeout)
+
+    async def device_check(self) -> raman_pb2.DeviceStatus:
+        return await self.stub.DeviceCheck(raman_pb2.Empty(), timeout=self.timeout)
+
+    async def connect(self, index: int) -> raman_pb2.DeviceStatus:
+        return await self.stub.Connect(raman_pb2.ConnectRequest(index=index), timeout=self.timeout)
+
+    async def disconnect(self) -> raman_pb2.DeviceStatus:
+        return await self.stub.Disconnect(raman_pb2.Empty(), timeout=self.timeout)
+
+    async def set_measure_conf(self, laser_power: int, exposure: int, accumulations: int) -> raman_pb2.DeviceStatus:
+        request = raman_pb2.MeasureConfRequest(exposure=exposure, laser_power=laser_power, accumulations=accumulations)
+        return await self.stub.SetMeasureConf(request, timeout=self.timeout)
+
+    async def read_ccd(self, timeout: float | None = None) -> AsyncIterator[raman_pb2.CCD]:
+        """
+        Stream CCD frames. The RPC is cancelled as soon as the consumer stops iterating
+        (e.g. the task is cancelled because the websocket disconnected).
+        """
+        call = self.stub.ReadCCD(raman_pb2.Empty(), timeout=self.stream_timeout if timeout is None else timeout)
+        try:
+            async for ccd in call:
+                yield ccd
+        finally:
+            call.cancel()
+
+    async def close(self) -> None:
+        if self._channel is not None:
+            await self._channel.close()
+        self._channel = None
+        self._stub = None
+        self._loop = None
+
+
+client = RamanClient()
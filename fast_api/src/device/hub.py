@@ -0,0 +1,158 @@
+import asyncio
+import os
+from typing import AsyncIterator, Callable
+import grpc
+import numpy as np
+from rpc import raman_pb2
+from .client import RamanClient
+from .baseline import baseline_correction
+
+_QUEUE_SIZE:int = int(os.environ.get("CCD_QUEUE_SIZE", "8"))
+
+END_OF_STREAM = object()
+
+
+class Frame:
+    """
+    A CCD frame shared by every subscriber.
+
+    The baseline-corrected data and each encoding (see `CCDHub.encoders`) are computed once,
+    on first access, and reused for every client asking for the same format.
+    """
+
+    def __init__(self, ccd: raman_pb2.CCD, encoders: dict[str, Callable[["Frame"], str | bytes]]):
+        self.ccd = ccd
+        self._encoders = encoders
+        self._encoded: dict[str, str | bytes] = {}
+        self._data: np.ndarray | None = None
+        self._corrected: np.ndarray | None = None
+
+    @property
+    def data(self) -> np.ndarray:
+        if self._data is None:
+            self._data = np.array(self.ccd.data)
+        return self._data
+
+    @property
+    def corrected(self) -> np.ndarray:
+        if self._corrected is None:
+            self._corrected = baseline_correction(self.data)
+        return self._corrected
+
+    def encode(self, format: str) -> str | bytes:
+        if format not in self._encoded:
+            self._encoded[format] = self._encoders[format](self)
+        return self._encoded[format]
+
+
+class Subscription:
+    """
+    A bounded queue of frames for one consumer. When full, the oldest frame is dropped.
+    `maxsize=0` never drops (used by measurements, which need every frame).
+    """
+
+    def __init__(self, maxsize: int = _QUEUE_SIZE):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.active: bool = False
+        self.dropped: int = 0
+
+    def put(self, item) -> None:
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(item)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class CCDHub:
+    """
+    Fan-out of the device's `ReadCCD` stream.
+
+    A single producer task reads each frame once and puts the same `Frame` in every subscriber's queue,
+    so a slow websocket only delays (and drops) its own frames. The producer is started by the first
+    subscriber that requests a stream (`start`) and cancelled when no subscriber requests it anymore.
+    Subscribers that did not request the stream still receive its frames (viewers).
+    """
+
+    def __init__(self, client: RamanClient, encoders: dict[str, Callable[[Frame], str | bytes]], queue_size: int = _QUEUE_SIZE):
+        self.client = client
+        self.encoders = encoders
+        self.queue_size = queue_size
+        self.subscribers: set[Subscription] = set()
+        self._producer: asyncio.Task | None = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._producer is not None and self._producer.done() == False
+
+    def subscribe(self, maxsize: int | None = None) -> Subscription:
+        subscription = Subscription(maxsize=self.queue_size if maxsize is None else maxsize)
+        self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self.subscribers.discard(subscription)
+        self.stop(subscription)
+
+    def start(self, subscription: Subscription) -> None:
+        """
+        Request a stream for `subscription`, joining the running one if any.
+        """
+        subscription.active = True
+        if self.is_running == False:
+            self._producer = asyncio.create_task(self._produce())
+
+    def stop(self, subscription: Subscription) -> None:
+        """
+        Withdraw the request of `subscription`. The stream is cancelled when nobody requests it.
+        """
+        subscription.active = False
+        if self.is_running and not any(s.active for s in self.subscribers):
+            self._producer.cancel()  # type: ignore
+
+    def _publish(self, item) -> None:
+        for subscription in list(self.subscribers):
+            subscription.put(item)
+
+    async def _produce(self):
+        try:
+            async for ccd in self.client.read_ccd():
+                self._publish(Frame(ccd=ccd, encoders=self.encoders))
+            self._publish(END_OF_STREAM)
+        except Exception as e:
+            # `AioRpcError` or any other failure: the consumers re-raise or report it
+            self._publish(e)
+        except asyncio.CancelledError:
+            # Do not leave `stream` consumers waiting for frames that will never come
+            self._publish(END_OF_STREAM)
+            raise
+        finally:
+            for subscription in self.subscribers:
+                subscription.active = False
+
+    async def stream(self, fresh: bool = False) -> AsyncIterator[Frame]:
+        """
+        Iterate the frames of one `ReadCCD` stream without dropping any.
+
+        Parameters
+        ----------
+        fresh : bool
+            If True, wait for the running stream (if any) to finish and start a new one,
+            so that the frames cover a whole acquisition.
+        """
+        if fresh and self.is_running:
+            await asyncio.wait([self._producer])  # type: ignore
+        subscription = self.subscribe(maxsize=0)
+        self.start(subscription)
+        try:
+            while True:
+                item = await subscription.get()
+                if item is END_OF_STREAM:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            self.unsubscribe(subscription)
@@ -0,0 +1,283 @@
+"""
+Measurement jobs, queued per device and run in the background.
+
+    job = scheduler.submit(MeasureRequest(device=1, laser_power=250, exposure=2000, reads=3))
+    async for event in job.events():
+        ...
+
+backend_dotnet drives one device at a time (`Connect(index)` selects it and every other call goes to it), so
+the devices are served by *lanes*: a `RamanClient` / `DeviceSession` / `CCDHub` per backend. `DEVICE_TARGETS`
+maps a device index to its own backend (e.g. "1=raman-1:5283,2=raman-2:5283"); every other index goes through
+the default `RPC_SERVER` lane. Jobs on the same lane run one after another, lanes run in parallel.
+"""
+import asyncio
+import os
+import uuid
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable
+from pydantic import BaseModel, Field
+from .client import RamanClient
+from .hub import CCDHub, Frame
+from .session import DeviceSession
+
+_JOB_HISTORY:int = int(os.environ.get("JOB_HISTORY", "100"))
+_DEVICE_TARGETS:str = os.environ.get("DEVICE_TARGETS", "")
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+def parse_targets(value: str) -> dict[int, str]:
+    """
+    "1=raman-1:5283,2=raman-2:5283" -> {1: "raman-1:5283", 2: "raman-2:5283"}
+    """
+    targets: dict[int, str] = {}
+    for item in value.split(","):
+        if item.strip() == "":
+            continue
+        index, sep, target = item.partition("=")
+        if sep == "" or target.strip() == "":
+            raise ValueError(f"Invalid DEVICE_TARGETS item {item!r}. Use 'index=host:port'.")
+        targets[int(index)] = target.strip()
+    return targets
+
+
+class MeasureRequest(BaseModel):
+    device: int = Field(default=0, ge=0)
+    laser_power: int = Field(default=300, gt=0)
+    exposure: int = Field(default=3000, gt=0)
+    accumulations: int = Field(default=1, gt=0)
+    reads: int = Field(default=3, gt=0)
+    model: str | None = None
+    # When both are given, the glucose is queued for the telehealth server (see `src.outbox`)
+    patient_id: int | None = None
+    code: int | None = None
+
+
+class JobStatus(BaseModel):
+    job_id: str
+    status: str
+    request: MeasureRequest
+    created: datetime
+    started: datetime | None = None
+    finished: datetime | None = None
+    position: int | None = None
+    progress: float | None = None
+    result: dict | None = None
+    detail: str | None = None
+
+
+class Job:
+    """
+    A measurement and its progress events (kept so a late subscriber still gets the whole history).
+    """
+
+    def __init__(self, request: MeasureRequest):
+        self.id = uuid.uuid4().hex
+        self.request = request
+        self.status = QUEUED
+        self.created = datetime.now()
+        self.started: datetime | None = None
+        self.finished: datetime | None = None
+        self.progress: float | None = None
+        self.result: dict | None = None
+        self.detail: str | None = None
+        self.history: list[tuple[BaseModel, Frame | None]] = []
+        self._changed = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    def _notify(self) -> None:
+        # Wake the current subscribers, the next ones wait on a new event.
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def publish(self, message: BaseModel, frame: Frame | None = None) -> None:
+        """
+        Add a progress event: a `ServerMessage`, with the CCD frame it refers to if any.
+        """
+        if getattr(message, "progress", None) is not None:
+            self.progress = message.progress  # type: ignore
+        self.history.append((message, frame))
+        self._notify()
+
+    def finish(self, status: str, result: dict | None = None, detail: str | None = None) -> None:
+        if self.is_finished:
+            return
+        self.status = status
+        self.result = result
+        self.detail = detail
+        self.finished = datetime.now()
+        self._notify()
+
+    async def events(self) -> AsyncIterator[tuple[BaseModel, Frame | None]]:
+        """
+        Every event of the job, from the first one, until it is finished.
+        """
+        index = 0
+        while True:
+            changed = self._changed
+            while index < len(self.history):
+                yield self.history[index]
+                index += 1
+            if self.is_finished:
+                return
+            await changed.wait()
+
+    def to_status(self, position: int | None = None) -> JobStatus:
+        return JobStatus(job_id=self.id, status=self.status, request=self.request, created=self.created,
+                         started=self.started, finished=self.finished, position=position, progress=self.progress,
+                         result=self.result, detail=self.detail)
+
+
+class Lane:
+    """
+    One backend (and the device it is connected to) with its queue of jobs.
+    """
+
+    def __init__(self, client: RamanClient, session: DeviceSession, hub: CCDHub):
+        self.client = client
+        self.session = session
+        self.hub = hub
+        self.pending: list[Job] = []
+        self.current: Job | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._worker: asyncio.Task | None = None
+
+    def position(self, job: Job) -> int | None:
+        """
+        The number of jobs to run before `job` (None if it is not waiting).
+        """
+        if job not in self.pending:
+            return None
+        return self.pending.index(job) + (1 if self.current is not None else 0)
+
+
+class JobScheduler:
+    """
+    Runs `run(lane, job)` for every submitted job: serialized per lane, lanes in parallel.
+
+    `run` publishes the progress of the job and returns its result; it should not raise for a failed
+    measurement but `job.finish(FAILED, ...)` instead. An exception is recorded as a failure.
+    """
+
+    def __init__(self, run: Callable[[Lane, Job], Awaitable[dict | None]], lane: Lane,
+                 targets: dict[int, str] | None = None, encoders: dict[str, Callable[[Frame], str | bytes]] | None = None,
+                 history: int = _JOB_HISTORY):
+        self.run = run
+        self.default = lane
+        self.targets = parse_targets(_DEVICE_TARGETS) if targets is None else targets
+        self.encoders = encoders if encoders is not None else lane.hub.encoders
+        self.history = history
+        # The lanes of `targets`, by target
+        self.lanes: dict[str, Lane] = {}
+        self.jobs: dict[str, Job] = {}
+        self._lanes_of: dict[str, Lane] = {}
+
+    def lane(self, device: int) -> Lane:
+        target = self.targets.get(device)
+        if target is None:
+            return self.default
+        if target not in self.lanes:
+            client = RamanClient(target=target, timeout=self.default.client.timeout, stream_timeout=self.default.client.stream_timeout)
+            session = DeviceSession(client=client, heartbeat_interval=self.default.session.heartbeat_interval)
+            self.lanes[target] = Lane(client=client, session=session, hub=CCDHub(client=client, encoders=self.encoders))
+        return self.lanes[target]
+
+    def get(self, job_id: str) -> Job:
+        return self.jobs[job_id]
+
+    def status(self, job: Job) -> JobStatus:
+        lane = self._lanes_of.get(job.id)
+        return job.to_status(position=lane.position(job) if lane is not None else None)
+
+    def submit(self, request: MeasureRequest) -> Job:
+        """
+        Queue a measurement. Call it from the running event loop.
+        """
+        job = Job(request)
+        lane = self.lane(request.device)
+        self.jobs[job.id] = job
+        self._lanes_of[job.id] = lane
+        lane.pending.append(job)
+        self._forget()
+        if lane._wakeup is None or lane._worker is None or lane._worker.done():
+            lane._wakeup = asyncio.Event()
+            lane._worker = asyncio.create_task(self._run_lane(lane))
+        lane._wakeup.set()
+        return job
+
+    def cancel(self, job: Job) -> None:
+        lane = self._lanes_of.get(job.id)
+        if lane is not None and job in lane.pending:
+            lane.pending.remove(job)
+        if job._task is not None and job._task.done() == False:
+            job._task.cancel()
+        job.finish(CANCELLED, detail="Measurement is cancelled")
+
+    def _forget(self) -> None:
+        # Keep at most `history` finished jobs, the oldest ones are dropped first.
+        finished = [job for job in self.jobs.values() if job.is_finished]
+        for job in finished[:max(len(finished) - self.history, 0)]:
+            del self.jobs[job.id]
+            self._lanes_of.pop(job.id, None)
+
+    async def _execute(self, lane: Lane, job: Job) -> None:
+        try:
+            result = await self.run(lane, job)
+        except asyncio.CancelledError:
+            job.finish(CANCELLED, detail="Measurement is cancelled")
+            raise
+        except Exception as e:
+            job.finish(FAILED, detail=repr(e))
+            return
+        job.finish(DONE, result=result)
+
+    async def _run_lane(self, lane: Lane):
+        while True:
+            while len(lane.pending) > 0:
+                job = lane.pending.pop(0)
+                lane.current = job
+                job.status = RUNNING
+                job.started = datetime.now()
+                job._task = asyncio.create_task(self._execute(lane, job))
+                try:
+                    await asyncio.wait([job._task])
+                finally:
+                    lane.current = None
+            lane._wakeup.clear()  # type: ignore
+            await lane._wakeup.wait()  # type: ignore
+
+    def start(self) -> None:
+        """
+        Start the heartbeat of the `DEVICE_TARGETS` lanes. Call it from the running event loop (the FastAPI `lifespan`).
+        """
+        for device in self.targets:
+            self.lane(device)
+        for lane in self.lanes.values():
+            lane.session.start()
+
+    async def stop(self) -> None:
+        for lane in [self.default, *self.lanes.values()]:
+            current = lane.current
+            for job in [*lane.pending, *([current] if current is not None else [])]:
+                self.cancel(job)
+            if current is not None and current._task is not None:
+                await asyncio.gather(current._task, return_exceptions=True)
+            if lane._worker is not None:
+                lane._worker.cancel()
+                try:
+                    await lane._worker
+                except asyncio.CancelledError:
+                    pass
+            lane._worker = None
+            lane._wakeup = None
+            if lane is not self.default:
+                await lane.session.stop()
+                await lane.client.close()
@@ -0,0 +1,70 @@
+"""
+Binary websocket frame format for CCD data.
+
+A frame is a 40-byte little-endian header followed by the raw samples:
+
+    offset  size  field
+    0       4     magic b"CCD1"
+    4       1     itemsize, 4 (float32) or 8 (float64)
+    5       1     flags, bit 0 set when `corrected_data` follows `data`
+    6       2     (padding)
+    8       4     n, uint32 number of points
+    12      8     data_type, ASCII, NUL padded
+    20      8     time, float64 unix timestamp (seconds)
+    28      8     duration, float64 seconds
+    36      4     (padding)
+    40      n*itemsize  data
+    ...     n*itemsize  corrected_data (if flags & 1)
+
+The header length is a multiple of 8 so both arrays can be viewed in place
+(e.g. `new Float32Array(buffer, 40, n)` in the browser).
+"""
+import struct
+from datetime import datetime, timedelta, timezone
+import numpy as np
+
+MAGIC: bytes = b"CCD1"
+HEADER = struct.Struct("<4sBBxxI8sdd4x")
+FLAG_CORRECTED: int = 1
+FORMATS: dict[str, np.dtype] = {
+    "float32": np.dtype("<f4"),
+    "float64": np.dtype("<f8"),
+}
+
+
+def encode_ccd(time: datetime, duration: timedelta, data_type: str, data: np.ndarray,
+               corrected_data: np.ndarray | None = None, format: str = "float32") -> bytes:
+    """
+    Pack a CCD frame into the binary format. `format` is one of `FORMATS`.
+    """
+    dtype = FORMATS[format]
+    data = np.asarray(data)
+    flags = 0 if corrected_data is None else FLAG_CORRECTED
+    timestamp = time.replace(tzinfo=timezone.utc).timestamp() if time.tzinfo is None else time.timestamp()
+    header = HEADER.pack(MAGIC, dtype.itemsize, flags, data.shape[0], data_type.encode("ascii")[:8],
+                         timestamp, duration.total_seconds())
+    parts = [header, data.astype(dtype, copy=False).tobytes()]
+    if corrected_data is not None:
+        parts.append(np.asarray(corrected_data).astype(dtype, copy=False).tobytes())
+    return b"".join(parts)
+
+
+def decode_ccd(buffer: bytes) -> dict:
+    """
+    Unpack a binary CCD frame into a dict with the same keys as the JSON `CCD` message.
+    """
+    magic, itemsize, flags, n, data_type, timestamp, duration = HEADER.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ValueError(f"Not a CCD frame. Got {magic=}")
+    dtype = np.dtype(f"<f{itemsize}")
+    data = np.frombuffer(buffer, dtype=dtype, count=n, offset=HEADER.size)
+    corrected_data = None
+    if flags & FLAG_CORRECTED:
+        corrected_data = np.frombuffer(buffer, dtype=dtype, count=n, offset=HEADER.size + n * itemsize)
+    return {
+        "time": datetime.fromtimestamp(timestamp, tz=timezone.utc),
+        "duration": timedelta(seconds=duration),
+        "data_type": data_type.rstrip(b"\x00").decode("ascii"),
+        "data": data,
+        "corrected_data": corrected_data,
+    }
@@ -0,0 +1,114 @@
+import asyncio
+import os
+import grpc
+from rpc import raman_pb2
+from .client import RamanClient, client
+
+_HEARTBEAT_INTERVAL:float = float(os.environ.get("DEVICE_HEARTBEAT_INTERVAL", "10"))
+
+
+class DeviceSession:
+    """
+    Keeps the device connection and measurement configuration between measurements.
+
+    - `connect` only sends `Connect` when the device is not already connected at that index.
+    - `configure` only sends `SetMeasureConf` when (laser_power, exposure, accumulations) changes.
+    - A background heartbeat (`DeviceCheck` every `heartbeat_interval` seconds) keeps the cached status fresh.
+    Any RPC error invalidates the cache so the next measurement starts from a fresh handshake.
+    """
+
+    def __init__(self, client: RamanClient = client, heartbeat_interval: float = _HEARTBEAT_INTERVAL):
+        self.client = client
+        self.heartbeat_interval = heartbeat_interval
+        self.status: raman_pb2.DeviceStatus | None = None
+        self.index: int | None = None
+        self._lock: asyncio.Lock | None = None
+        self._heartbeat: asyncio.Task | None = None
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    @property
+    def is_connected(self) -> bool:
+        return self.status is not None and self.status.IsConnected
+
+    @property
+    def conf(self) -> tuple[int, int, int] | None:
+        """
+        The (laser_power, exposure, accumulations) the device reported last, if any.
+        """
+        if self.status is None:
+            return None
+        for field in ["laser_power", "exposure", "accumulations"]:
+            if not self.status.HasField(field):
+                return None
+        return (self.status.laser_power, self.status.exposure, self.status.accumulations)
+
+    def invalidate(self) -> None:
+        self.status = None
+        self.index = None
+
+    def _update(self, status: raman_pb2.DeviceStatus) -> raman_pb2.DeviceStatus:
+        self.status = status
+        if status.IsConnected == False:
+            self.index = None
+        return status
+
+    async def _call(self, coro) -> raman_pb2.DeviceStatus:
+        try:
+            return self._update(await coro)
+        except grpc.aio.AioRpcError:
+            self.invalidate()
+            raise
+
+    async def connect(self, index: int = 0, force: bool = False) -> raman_pb2.DeviceStatus:
+        async with self.lock:
+            if force == False and self.index == index and self.is_connected:
+                return self.status  # type: ignore
+            status = await self._call(self.client.connect(index=index))
+            self.index = index if status.IsConnected else None
+            return status
+
+    async def configure(self, laser_power: int, exposure: int, accumulations: int, force: bool = False) -> raman_pb2.DeviceStatus:
+        async with self.lock:
+            if force == False and self.conf == (laser_power, exposure, accumulations):
+                return self.status  # type: ignore
+            return await self._call(self.client.set_measure_conf(laser_power=laser_power, exposure=exposure, accumulations=accumulations))
+
+    async def check(self) -> raman_pb2.DeviceStatus:
+        async with self.lock:
+            return await self._call(self.client.device_check())
+
+    async def _run_heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await self.check()
+            except grpc.aio.AioRpcError as e:
+                print(f"Device heartbeat failed | {e.code().name}: {e.details()}")
+            except Exception as e:
+                # Anything else must not stop the heartbeat either
+                print(f"Device heartbeat failed | {e!r}")
+
+    def start(self) -> None:
+        """
+        Start the heartbeat. Call it from the running event loop (the FastAPI `lifespan`).
+        """
+        self._lock = asyncio.Lock()
+        if self.heartbeat_interval > 0 and (self._heartbeat is None or self._heartbeat.done()):
+            self._heartbeat = asyncio.create_task(self._run_heartbeat())
+
+    async def stop(self) -> None:
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            try:
+                await self._heartbeat
+            except asyncio.CancelledError:
+                pass
+        self._heartbeat = None
+
+
+session = DeviceSession()
@@ -0,0 +1,168 @@
+"""
+Read-through cache of the telehealth blood-sugar history (`get_blood_sugar` of `src.api`).
+
+    response = await history.fetch_by_user_id(10, datetime(2025, 10, 1), datetime(2025, 10, 31))
+
+The records are kept in Mongo (`raman.telehealth_history`), one document per (patient_id, date).
+A query only sends `get_blood_sugar` for the days that are not cached, one request per run of consecutive
+missing days. Past days are kept; today (and later days) can still receive records, so they expire after
+`today_ttl` seconds (a TTL index on `expires`, also checked on read since Mongo purges about once a minute).
+Only successful responses (`status` 200) are cached; an error response is passed through.
+"""
+import asyncio
+import os
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any
+from pymongo import UpdateOne
+from src.api import TelehealthClient, client as telehealth_client
+from src.db import get_collection
+
+_HISTORY_TODAY_TTL:float = float(os.environ.get("HISTORY_TODAY_TTL", "300"))
+
+
+class HistoryError(RuntimeError):
+    """
+    `get_blood_sugar` answered with a `status` other than 200 (often over HTTP 200).
+    """
+
+    def __init__(self, response: dict[str, Any]):
+        super().__init__(f"status={response.get('status')} message={response.get('message')}")
+        self.response = response
+
+
+def _now() -> datetime:
+    # Naive UTC, as read back from Mongo and compared by the TTL index
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _day(value: date | datetime) -> date:
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _runs(days: list[date]) -> list[tuple[date, date]]:
+    """
+    The (first, last) day of each run of consecutive `days` (sorted).
+    """
+    runs: list[tuple[date, date]] = []
+    for day in days:
+        if len(runs) > 0 and runs[-1][1] + timedelta(days=1) == day:
+            runs[-1] = (runs[-1][0], day)
+        else:
+            runs.append((day, day))
+    return runs
+
+
+class HistoryCache:
+    """
+    The cached history of every patient.
+    """
+
+    def __init__(self, collection=None, client: TelehealthClient = telehealth_client, today_ttl: float = _HISTORY_TODAY_TTL):
+        self.collection = collection if collection is not None else get_collection("telehealth_history")
+        self.client = client
+        self.today_ttl = today_ttl
+        self._indexed = False
+
+    @staticmethod
+    def key(patient_id: int, day: date) -> str:
+        return f"{patient_id}:{day.isoformat()}"
+
+    async def _ensure_indexes(self):
+        if self._indexed == False:
+            await self.collection.create_index([("expires", 1)], expireAfterSeconds=0)
+            self._indexed = True
+
+    async def _cached(self, patient_id: int, start: date, end: date, now: datetime) -> dict[date, list[dict[str, Any]]]:
+        query = {"patient_id": patient_id, "date": {"$gte": datetime.combine(start, time()), "$lte": datetime.combine(end, time())}}
+        days: dict[date, list[dict[str, Any]]] = {}
+        async for doc in self.collection.find(query, {"date": 1, "records": 1, "expires": 1}):
+            if doc.get("expires") is None or doc["expires"] > now:
+                days[doc["date"].date()] = doc["records"]
+        return days
+
+    async def _fetch(self, patient_id: int, start: date, end: date, now: datetime) -> dict[date, list[dict[str, Any]]]:
+        """
+        One `get_blood_sugar` for [start, end], stored day by day (days without records too).
+        An error response raises `HistoryError` and is not stored: its days are fetched again by the next query.
+        """
+        response = await self.client.fetch_by_user_id(patient_id, datetime.combine(start, time()), datetime.combine(end, time()))
+        if response.get("status") != 200:
+            raise HistoryError(response)
+        days: dict[date, list[dict[str, Any]]] = {start + timedelta(days=i): [] for i in range((end - start).days + 1)}
+        for record in response.get("data") or []:
+            day = date.fromisoformat(record["RecordDate"])
+            if day in days:
+                days[day].append(record)
+
+        today = date.today()
+        requests = []
+        for day, records in days.items():
+            expires = now + timedelta(seconds=self.today_ttl) if day >= today else None
+            requests.append(UpdateOne({"_id": self.key(patient_id, day)}, {"$set": {
+                "patient_id": patient_id,
+                "date": datetime.combine(day, time()),
+                "records": records,
+                "fetched": now,
+                "expires": expires,
+            }}, upsert=True))
+        if len(requests) > 0:
+            await self.collection.bulk_write(requests, ordered=False)
+        return days
+
+    async def get(self, patient_id: int, start_date: date | datetime, end_date: date | datetime) -> list[dict[str, Any]]:
+        """
+        The records of `patient_id` from `start_date` to `end_date` (whole days, inclusive), sorted by 'RecordDT'.
+
+        Raises
+        ------
+        HistoryError :
+            When `get_blood_sugar` failed for any of the missing days (the other ones are still cached).
+        """
+        start, end = _day(start_date), _day(end_date)
+        if end < start:
+            return []
+        await self._ensure_indexes()
+        now = _now()
+        days = await self._cached(patient_id, start, end, now)
+        all_days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+        missing = [day for day in all_days if day not in days]
+        results = await asyncio.gather(*[self._fetch(patient_id, first, last, now) for first, last in _runs(missing)],
+                                       return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+            days.update(result)
+        records = [record for day in all_days for record in days.get(day, [])]
+        return sorted(records, key=lambda record: record.get("RecordDT", ""))
+
+    async def fetch_by_user_id(self, user_id: int, start_date: datetime, end_date: datetime) -> dict[str, Any]:
+        """
+        Same response as `src.api.fetch_by_user_id`, served from the cache.
+        An upstream error response is returned as is.
+        """
+        try:
+            data = await self.get(user_id, start_date, end_date)
+        except HistoryError as e:
+            return e.response
+        return {
+            "status": 200,
+            "date_time_start": f"{_day(start_date).isoformat()} 00:00:00",
+            "date_time_end": f"{_day(end_date).isoformat()} 23:59:59",
+            "message": "success",
+            "data": data,
+        }
+
+    async def invalidate(self, patient_id: int, day: date | datetime | None = None) -> None:
+        """
+        Forget the cached days of `patient_id` (only `day` if given), e.g. after posting a record for them.
+        """
+        if day is None:
+            await self.collection.delete_many({"patient_id": patient_id})
+        else:
+            await self.collection.delete_one({"_id": self.key(patient_id, _day(day))})
+
+
+history = HistoryCache()
+
+async def fetch_by_user_id(user_id:int, start_date:datetime, end_date:datetime) -> dict[str, Any]:
+    return await history.fetch_by_user_id(user_id, start_date, end_date)
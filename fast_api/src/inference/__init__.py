@@ -0,0 +1,3 @@
+from .registry import ModelRegistry, LoadedModel, registry
+from .pool import InferencePool, InferenceBusy, inference
+from .batching import BatchDispatcher, dispatcher
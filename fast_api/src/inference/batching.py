@@ -0,0 +1,176 @@
+"""
+Micro-batching of concurrent predictions.
+
+    glucose = await dispatcher.predict(spectrum, model_name="LinearRegression")
+
+Each `predict` call only queues its spectrum and awaits a future. The dispatcher task stacks the spectra queued
+for the same (model, Raman Shift axis) and sends them to the inference pool as one preprocessing + `pca.transform`
++ `model.predict` pass, then resolves every caller's future with its row.
+
+A batch leaves when it holds `max_batch` spectra (`INFERENCE_MAX_BATCH`) or when its oldest spectrum has waited
+`max_wait_ms` (`INFERENCE_MAX_WAIT_MS`), so a lone request is only delayed by `max_wait_ms`. At most one batch per
+pool worker is in flight: while they are all busy, the next batch keeps filling up to `max_batch`.
+"""
+import asyncio
+import os
+import time
+import numpy as np
+from numpy.typing import NDArray
+from .pool import InferenceBusy, InferencePool, inference
+
+_INFERENCE_MAX_BATCH:int = int(os.environ.get("INFERENCE_MAX_BATCH", "32"))
+_INFERENCE_MAX_WAIT_MS:float = float(os.environ.get("INFERENCE_MAX_WAIT_MS", "2"))
+
+
+class _Request:
+    def __init__(self, spectrum: NDArray[np.float64], raman_shift: NDArray[np.float64] | None, future: asyncio.Future):
+        self.spectrum = spectrum
+        self.raman_shift = raman_shift
+        self.future = future
+        self.arrived = time.monotonic()
+
+
+class BatchDispatcher:
+    """
+    Collects the pending predictions and runs them in batches through `pool`.
+    The dispatcher task is started on first use (in the running event loop).
+    """
+
+    def __init__(self, pool: InferencePool = inference, max_batch: int = _INFERENCE_MAX_BATCH, max_wait_ms: float = _INFERENCE_MAX_WAIT_MS):
+        if max_batch < 1 or max_wait_ms < 0:
+            raise ValueError(f"Expecting max_batch >= 1 and max_wait_ms >= 0 but got {max_batch=}, {max_wait_ms=}")
+        self.pool = pool
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        # The number of batches and predictions sent to the pool
+        self.batches: int = 0
+        self.predictions: int = 0
+        self.pending: dict[tuple[str, bytes | None], list[_Request]] = {}
+        self._running: set[asyncio.Task] = set()
+        self._wakeup: asyncio.Event | None = None
+        self._worker: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    @property
+    def max_pending(self) -> int:
+        return self.pool.capacity * self.max_batch
+
+    @property
+    def size(self) -> int:
+        return sum(len(requests) for requests in self.pending.values())
+
+    def _ensure_worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self.pending = {}
+            self._running = set()
+            self._wakeup = asyncio.Event()
+            self._worker = loop.create_task(self._run())
+
+    async def predict(self, spectrum: NDArray[np.float64] | list[float], model_name: str | None = None,
+                      raman_shift: NDArray[np.float64] | None = None) -> float:
+        """
+        The glucose of one raw spectrum measured on `raman_shift` (default: the registry's).
+
+        Raises
+        ------
+        KeyError :
+            When there is no such model.
+        ValueError :
+            When the spectrum does not match `raman_shift`.
+        InferenceBusy :
+            When `max_pending` spectra are already waiting.
+        """
+        Y = np.asarray(spectrum, dtype=np.float64)
+        n_pixels = (self.pool.registry.raman_shift() if raman_shift is None else raman_shift).shape[0]
+        if Y.shape != (n_pixels, ):
+            # Checked here: a bad spectrum must not fail the whole batch
+            raise ValueError(f"Expecting a spectrum of shape ({n_pixels}, ) but got shape={Y.shape}")
+        if self.max_batch == 1:
+            return float((await self.pool.predict(Y, model_name=model_name, raman_shift=raman_shift))[0])
+
+        self._ensure_worker()
+        if self.size >= self.max_pending:
+            raise InferenceBusy(f"Inference queue is full ({self.size} pending predictions)")
+        model_name = model_name or self.pool.registry.default
+        key = (model_name, None if raman_shift is None else np.asarray(raman_shift, dtype=np.float64).tobytes())
+        request = _Request(Y, raman_shift, asyncio.get_running_loop().create_future())
+        self.pending.setdefault(key, []).append(request)
+        self._wakeup.set()  # type: ignore
+        return await request.future
+
+    async def _execute(self, model_name: str, batch: list[_Request]) -> None:
+        try:
+            preds = await self.pool.predict(np.vstack([request.spectrum for request in batch]), model_name=model_name,
+                                            raman_shift=batch[0].raman_shift)
+        except asyncio.CancelledError:
+            for request in batch:
+                request.future.cancel()
+            raise
+        except Exception as e:
+            for request in batch:
+                if request.future.done() == False:
+                    request.future.set_exception(e)
+            return
+        for request, pred in zip(batch, preds):
+            if request.future.done() == False:
+                request.future.set_result(float(pred))
+
+    def _take(self, key: tuple[str, bytes | None]) -> list[_Request]:
+        requests = self.pending[key]
+        batch = requests[:self.max_batch]
+        del requests[:self.max_batch]
+        if len(requests) == 0:
+            del self.pending[key]
+        # A caller that gave up (e.g. its measurement was cancelled) is not predicted
+        return [request for request in batch if request.future.done() == False]
+
+    async def _run(self):
+        while True:
+            if len(self.pending) == 0:
+                self._wakeup.clear()  # type: ignore
+                await self._wakeup.wait()  # type: ignore
+                continue
+            if len(self._running) >= self.pool.workers:
+                # Every worker is busy: the pending batches keep filling meanwhile
+                await asyncio.wait(self._running, return_when=asyncio.FIRST_COMPLETED)
+                continue
+            key = min(self.pending, key=lambda key: self.pending[key][0].arrived)
+            requests = self.pending[key]
+            remaining = requests[0].arrived + self.max_wait_ms / 1e3 - time.monotonic()
+            if len(requests) < self.max_batch and remaining > 0:
+                self._wakeup.clear()  # type: ignore
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=remaining)  # type: ignore
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            batch = self._take(key)
+            if len(batch) == 0:
+                continue
+            self.batches += 1
+            self.predictions += len(batch)
+            task = asyncio.create_task(self._execute(key[0], batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def stop(self) -> None:
+        """
+        Stop the dispatcher task. The pending callers are cancelled.
+        """
+        tasks = [task for task in [self._worker, *self._running] if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for requests in self.pending.values():
+            for request in requests:
+                request.future.cancel()
+        self.pending = {}
+        self._running = set()
+        self._worker = None
+        self._wakeup = None
+        self._loop = None
+
+
+dispatcher = BatchDispatcher()
@@ -0,0 +1,192 @@
+"""
+CPU-bound inference (preprocessing, PCA and `model.predict`) off the event loop.
+
+    glucose = float((await inference.predict(spectrum, model_name="LinearRegression"))[0])
+
+The work is sent to a thread pool or, with `INFERENCE_POOL=process`, to a process pool whose workers load every
+model of the registry (and compile the preprocessing of its Raman Shift axis) when they start.
+A process pool runs the predictions truly in parallel, a thread pool avoids copying the spectra and models.
+
+At most `workers + queue_depth` calls are in the pool at once (`INFERENCE_WORKERS`, `INFERENCE_QUEUE_DEPTH`).
+Past that, `InferenceBusy` is raised right away instead of letting the backlog (and its latency) grow.
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable
+import numpy as np
+from numpy.typing import NDArray
+from .registry import ModelRegistry, registry as default_registry
+
+_INFERENCE_POOL:str = os.environ.get("INFERENCE_POOL", "thread")
+_INFERENCE_WORKERS:int = int(os.environ.get("INFERENCE_WORKERS", str(os.cpu_count() or 1)))
+_INFERENCE_QUEUE_DEPTH:int = int(os.environ.get("INFERENCE_QUEUE_DEPTH", "32"))
+
+KINDS:list[str] = ["thread", "process"]
+
+# The registry of a process worker (see `_init_process`)
+_worker_registry: ModelRegistry | None = None
+
+
+class InferenceBusy(RuntimeError):
+    """
+    The inference pool already holds `workers + queue_depth` calls.
+    """
+
+
+def _preload(registry: ModelRegistry) -> None:
+    from src.spectra import CompiledPipeline
+    registry.load()
+    CompiledPipeline.for_axis(registry.raman_shift())
+
+
+def _init_process(model_dir: str, default: str) -> None:
+    global _worker_registry
+    _worker_registry = ModelRegistry(model_dir=model_dir, default=default)
+    _preload(_worker_registry)
+
+
+def _ping(registry: ModelRegistry | None) -> int:
+    return os.getpid()
+
+
+def _predict(registry: ModelRegistry | None, groups: list[tuple[NDArray[np.float64] | None, Any]], model_name: str | None,
+             cached: bool = True) -> NDArray[np.float64]:
+    from src.spectra import CompiledPipeline, feature_cache
+    registry = registry if registry is not None else _worker_registry
+    model = registry.get(model_name)  # type: ignore
+    X = []
+    for raman_shift, spectra in groups:
+        pipeline = CompiledPipeline.for_axis(registry.raman_shift() if raman_shift is None else raman_shift)  # type: ignore
+        features = feature_cache.transform(pipeline, spectra) if cached else pipeline(spectra)
+        X.append(np.atleast_2d(features))
+    return model.predict(np.vstack(X))
+
+
+def _create_sample(registry: ModelRegistry | None, spectrum: Any, raman_shift: NDArray[np.float64] | None):
+    from src.spectra import Sample
+    from rampy import baseline as rbaseline  # type: ignore
+
+    registry = registry if registry is not None else _worker_registry
+    if raman_shift is None:
+        raman_shift = registry.raman_shift()  # type: ignore
+    sample:Sample = Sample(
+        x=np.asarray(raman_shift, dtype=np.float64),
+        y=np.array(spectrum),
+        interpolate=False,
+        verbose=True
+    )
+    sample.despike(window_length=10,threshold=5)
+    sample.interpolate(step=1)
+    sample.extract_range(low=750, high=1650)
+    sample.smoothing(window_length=60, polyorder=1)
+    signal_y, by = rbaseline(sample.x, sample.y, roi=[[905, 915],[1050, 1070],[1100, 1150],[1400,1460]])
+    sample.y = signal_y.reshape(-1)
+    sample.normalized(method='minmax')
+    sample.extract_range(low=800, high=1600)
+    return sample
+
+
+class InferencePool:
+    """
+    Runs the inference functions of this module in a thread or process pool.
+
+    The executor is created by `start` (the FastAPI `lifespan`) or on first use.
+    Thread workers share `registry`; process workers load their own copy of it.
+    """
+
+    def __init__(self, registry: ModelRegistry = default_registry, kind: str = _INFERENCE_POOL,
+                 workers: int = _INFERENCE_WORKERS, queue_depth: int = _INFERENCE_QUEUE_DEPTH):
+        if kind not in KINDS:
+            raise ValueError(f"Unknown inference pool {kind=}. Use one of {KINDS}")
+        if workers < 1 or queue_depth < 0:
+            raise ValueError(f"Expecting workers >= 1 and queue_depth >= 0 but got {workers=}, {queue_depth=}")
+        self.registry = registry
+        self.kind = kind
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.pending: int = 0
+        self._executor: Executor | None = None
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                # spawn: never fork the gRPC / Mongo client threads of the server
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_process,
+                    initargs=(Path(self.registry.model_dir).as_posix(), self.registry.default),
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference",
+                                                    initializer=_preload, initargs=(self.registry, ))
+        return self._executor
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.queue_depth
+
+    async def run(self, func: Callable, *args) -> Any:
+        """
+        `func(registry, *args)` in the pool. `registry` is None in a process worker (it uses its own).
+
+        Raises
+        ------
+        InferenceBusy :
+            When `capacity` calls are already in the pool.
+        """
+        if self.pending >= self.capacity:
+            raise InferenceBusy(f"Inference queue is full ({self.pending} calls, {self.workers} workers)")
+        registry = None if self.kind == "process" else self.registry
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, partial(func, registry, *args))
+        finally:
+            self.pending -= 1
+
+    async def predict(self, spectra: NDArray[np.float64] | list[float] | list[list[float]], model_name: str | None = None,
+                      raman_shift: NDArray[np.float64] | None = None, cached: bool = False) -> NDArray[np.float64]:
+        """
+        The glucose of raw `spectra` measured on `raman_shift` (default: the registry's), shape (n_samples, ).
+        Live spectra never repeat: they only go through the `feature_cache` when `cached` is True.
+
+        Raises
+        ------
+        KeyError :
+            When there is no such model.
+        """
+        return await self.run(_predict, [(raman_shift, spectra)], model_name, cached)
+
+    async def predict_groups(self, groups: list[tuple[NDArray[np.float64] | None, Any]], model_name: str | None = None,
+                             cached: bool = True) -> NDArray[np.float64]:
+        """
+        Same as `predict` for several (raman_shift, spectra) groups, stacked into one `model.predict`.
+        The features are looked up in / added to the `feature_cache` (stored spectra are predicted again and again).
+        """
+        return await self.run(_predict, groups, model_name, cached)
+
+    async def create_sample(self, spectrum: list[float] | NDArray[np.float64], raman_shift: NDArray[np.float64] | None = None):
+        """
+        The `Sample`-based preprocessing of one spectrum (see `CompiledPipeline`).
+        """
+        return await self.run(_create_sample, spectrum, raman_shift)
+
+    def start(self) -> None:
+        """
+        Create the executor and start its workers (which load the models), so the first requests do not wait for it.
+        """
+        for _ in range(self.workers):
+            self.executor.submit(_ping, None if self.kind == "process" else self.registry)
+
+    async def stop(self) -> None:
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+
+
+inference = InferencePool()
@@ -0,0 +1,145 @@
+import os
+import pickle
+import threading
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+_MODEL_DIR: str = os.environ.get("MODEL_DIR", "models")
+_DEFAULT_MODEL: str = os.environ.get("DEFAULT_MODEL", "GridSearch-RandomForestRegressor")
+_PCA_SUFFIX: str = "_pca"
+_RAMAN_SHIFT: str = "ramanshift"
+
+
+def _load_pickle(path: Path) -> Any:
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+def _mtime(path: Path) -> int:
+    return os.stat(path).st_mtime_ns
+
+
+class LoadedModel:
+    """
+    A regressor and the PCA it was trained on, as pickled in `models/<name>` and `models/<name>_pca`.
+    """
+    name: str
+    model: Any
+    pca: Any
+    mtime: tuple[int, int]
+
+    def __init__(self, name: str, model: Any, pca: Any, mtime: tuple[int, int]):
+        self.name = name
+        self.model = model
+        self.pca = pca
+        self.mtime = mtime
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """
+        Parameters
+        ----------
+        X : NDArray of shape (n_samples, n_features)
+            Preprocessed spectra (see `create_sample`).
+
+        Returns
+        -------
+        NDArray of shape (n_samples, ) :
+            The predicted glucose.
+        """
+        return self.model.predict(self.pca.transform(X))
+
+
+class ModelRegistry:
+    """
+    Keeps every model pair of `model_dir` and the Raman Shift axis resident in memory.
+
+    Models are loaded once (usually in the FastAPI `lifespan`) and looked up by name.
+    Each lookup compares the files' mtime with the loaded one, so replacing a pickle
+    on disk is picked up on the next request without restarting the server.
+    """
+
+    def __init__(self, model_dir: str | Path = _MODEL_DIR, default: str = _DEFAULT_MODEL):
+        self.model_dir: Path = Path(model_dir)
+        self.default: str = default
+        self._models: dict[str, LoadedModel] = {}
+        self._raman_shift: np.ndarray | None = None
+        self._raman_shift_mtime: int | None = None
+        self._lock = threading.Lock()
+
+    def _paths(self, name: str) -> tuple[Path, Path]:
+        return self.model_dir.joinpath(name), self.model_dir.joinpath(f"{name}{_PCA_SUFFIX}")
+
+    @property
+    def names(self) -> list[str]:
+        """
+        Names of the available models, i.e. files in `model_dir` that have a `_pca` pair.
+        """
+        names: list[str] = []
+        for path in sorted(self.model_dir.iterdir()):
+            if path.name == _RAMAN_SHIFT or path.name.endswith(_PCA_SUFFIX):
+                continue
+            if self.model_dir.joinpath(f"{path.name}{_PCA_SUFFIX}").exists():
+                names.append(path.name)
+        return names
+
+    def load(self) -> None:
+        """
+        Load (or reload) the Raman Shift axis and every model found in `model_dir`.
+        """
+        self.raman_shift()
+        for name in self.names:
+            self.get(name)
+
+    def get(self, name: str | None = None) -> LoadedModel:
+        """
+        Return the model `name` (default model when None), reloading it if the files changed on disk.
+
+        Raises
+        ------
+        KeyError :
+            When there is no such model in `model_dir`.
+        """
+        if name is None:
+            name = self.default
+        # The name comes from the request: only a model discovered in `model_dir` is unpickled (no path, no `..`)
+        names = self.names
+        if name not in names:
+            raise KeyError(f"Model {name=} is not found in {self.model_dir.as_posix()}. Available: {names}")
+        model_path, pca_path = self._paths(name)
+        try:
+            mtime = (_mtime(model_path), _mtime(pca_path))
+        except FileNotFoundError:
+            raise KeyError(f"Model {name=} is not found in {self.model_dir.as_posix()}. Available: {self.names}")
+
+        loaded = self._models.get(name)
+        if loaded is not None and loaded.mtime == mtime:
+            return loaded
+        with self._lock:
+            loaded = self._models.get(name)
+            if loaded is None or loaded.mtime != mtime:
+                loaded = LoadedModel(name=name, model=_load_pickle(model_path), pca=_load_pickle(pca_path), mtime=mtime)
+                self._models[name] = loaded
+        return loaded
+
+    def raman_shift(self) -> np.ndarray:
+        """
+        The Raman Shift axis of the device the models were trained with.
+        """
+        path = self.model_dir.joinpath(_RAMAN_SHIFT)
+        mtime = _mtime(path)
+        if self._raman_shift is None or self._raman_shift_mtime != mtime:
+            with self._lock:
+                if self._raman_shift is None or self._raman_shift_mtime != mtime:
+                    self._raman_shift = np.asarray(_load_pickle(path), dtype=np.float64)
+                    self._raman_shift_mtime = mtime
+        return self._raman_shift  # type: ignore
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models.clear()
+            self._raman_shift = None
+            self._raman_shift_mtime = None
+
+
+registry = ModelRegistry()
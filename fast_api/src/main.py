@@ -3,14 +3,32 @@ from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from src.web import router as web_routers
 from src.device import router as device_routers
+from src.device import client as device_client, session as device_session, scheduler as device_scheduler
 from src.raman import router as raman_routers
+from src.api import client as telehealth_client
+from src.outbox import outbox
+from src.inference import registry, inference, dispatcher
+from src.spectra import CompiledPipeline
 import os 
 _build_version = os.environ.get("BUILD_VERSION", "DEV")
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # All things needed to do before app is running
+    registry.load()
+    CompiledPipeline.for_axis(registry.raman_shift())
+    inference.start()
+    device_session.start()
+    device_scheduler.start()
+    outbox.start()
     yield
     # All things needed to do when shutting off
+    await device_scheduler.stop()
+    await device_session.stop()
+    await outbox.stop()
+    await dispatcher.stop()
+    await inference.stop()
+    await device_client.close()
+    await telehealth_client.close()
 
 
 app = FastAPI(
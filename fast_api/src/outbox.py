@@ -0,0 +1,200 @@
+"""
+Durable outbox of the glucose records to upload to the telehealth API (`src.api`).
+
+    await outbox.enqueue(GlucoseRecord(user_id=7, code=Code.PRE_LUNCH, value=101.5, created_date=datetime.now()))
+
+`enqueue` only writes the record to Mongo (`raman.telehealth_outbox`), so a measurement never waits for the
+telehealth server. The worker started in the FastAPI `lifespan` drains the outbox in batches:
+- The `_id` of a record is its (PatientID, RecordDT, Code), so the same reading is only queued and sent once.
+- A batch is claimed by pushing its `next_attempt` forward (a lease) under a unique token. The lease is renewed
+  while the batch is being sent, so a worker that dies mid-batch only delays its records by `lease`, and two
+  workers never send the same record. The results are only written under the token, so a worker that lost its
+  lease anyway (e.g. paused for longer than `lease`) does not overwrite the state set by the next one.
+- A record is only sent when the API answers `{"status": 200, ...}`: any other answer (even over HTTP 200) is a
+  failed upload. A failed upload is retried with an exponential backoff; a rejected one (4xx other than 429) or
+  one that failed `max_attempts` times is kept with `status="failed"` and its last error.
+"""
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any
+import httpx
+from pymongo import UpdateOne
+from src.api import GlucoseRecord, TelehealthClient, client as telehealth_client
+from src.db import get_collection
+
+_OUTBOX_INTERVAL:float = float(os.environ.get("OUTBOX_INTERVAL", "5"))
+_OUTBOX_BATCH_SIZE:int = int(os.environ.get("OUTBOX_BATCH_SIZE", "50"))
+_OUTBOX_MAX_ATTEMPTS:int = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "10"))
+_OUTBOX_BACKOFF:float = float(os.environ.get("OUTBOX_BACKOFF", "5"))
+_OUTBOX_MAX_BACKOFF:float = float(os.environ.get("OUTBOX_MAX_BACKOFF", "3600"))
+_OUTBOX_LEASE:float = float(os.environ.get("OUTBOX_LEASE", "120"))
+
+PENDING = "pending"
+SENT = "sent"
+FAILED = "failed"
+
+
+def _now() -> datetime:
+    # Naive UTC, as read back from Mongo
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def record_key(payload: dict[str, Any]) -> str:
+    return f"{payload['PatientID']}:{payload['RecordDT']}:{payload['Code']}"
+
+
+def _is_permanent(error: BaseException) -> bool:
+    # The server rejected the record itself: sending it again would not help.
+    return isinstance(error, httpx.HTTPStatusError) and 400 <= error.response.status_code < 500 \
+        and error.response.status_code != 429
+
+
+class Outbox:
+    """
+    The outbox collection and its background worker.
+    """
+
+    def __init__(self, collection=None, client: TelehealthClient = telehealth_client,
+                 interval: float = _OUTBOX_INTERVAL, batch_size: int = _OUTBOX_BATCH_SIZE,
+                 max_attempts: int = _OUTBOX_MAX_ATTEMPTS, backoff: float = _OUTBOX_BACKOFF,
+                 max_backoff: float = _OUTBOX_MAX_BACKOFF, lease: float = _OUTBOX_LEASE):
+        self.collection = collection if collection is not None else get_collection("telehealth_outbox")
+        self.client = client
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.lease = lease
+        self._wakeup: asyncio.Event | None = None
+        self._worker: asyncio.Task | None = None
+
+    async def enqueue(self, record: GlucoseRecord) -> bool:
+        """
+        Queue `record` for upload. Returns False if the same (PatientID, RecordDT, Code) is already queued or sent.
+        """
+        payload = record.payload()
+        now = _now()
+        result = await self.collection.update_one({"_id": record_key(payload)}, {"$setOnInsert": {
+            "payload": payload,
+            "status": PENDING,
+            "attempts": 0,
+            "created": now,
+            "next_attempt": now,
+        }}, upsert=True)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return result.upserted_id is not None
+
+    async def claim(self) -> list[dict[str, Any]]:
+        """
+        Lease up to `batch_size` due records to this worker.
+        """
+        now = _now()
+        due = {"status": PENDING, "next_attempt": {"$lte": now}}
+        ids = [doc["_id"] async for doc in self.collection.find(due, {"_id": 1}, sort=[("next_attempt", 1)], limit=self.batch_size)]
+        if len(ids) == 0:
+            return []
+        token = uuid.uuid4().hex
+        # Only the records still due are taken: another worker may have claimed some in between.
+        await self.collection.update_many({**due, "_id": {"$in": ids}}, {"$set": {
+            "next_attempt": now + timedelta(seconds=self.lease),
+            "token": token,
+        }})
+        return [doc async for doc in self.collection.find({"_id": {"$in": ids}, "token": token})]
+
+    async def _renew_lease(self, ids: list[Any], token: str) -> None:
+        # Runs while the batch is being sent: a batch may take longer than `lease` (timeouts, retries)
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            await self.collection.update_many({"_id": {"$in": ids}, "token": token}, {"$set": {
+                "next_attempt": _now() + timedelta(seconds=self.lease),
+            }})
+
+    def _update(self, doc: dict[str, Any], result: Any, now: datetime) -> UpdateOne:
+        # Only if the lease is still ours
+        query = {"_id": doc["_id"], "token": doc["token"]}
+        if isinstance(result, dict) and result.get("status") == 200:
+            return UpdateOne(query, {"$set": {"status": SENT, "sent": now, "response": result}, "$unset": {"token": ""}})
+        attempts = doc["attempts"] + 1
+        if isinstance(result, BaseException):
+            update: dict[str, Any] = {"attempts": attempts, "error": repr(result)}
+            permanent = _is_permanent(result)
+        else:
+            # The API answered but did not record it: keep its message and try again
+            message = result.get("message") if isinstance(result, dict) else None
+            update = {"attempts": attempts, "error": message if message is not None else repr(result), "response": result}
+            permanent = False
+        if permanent or attempts >= self.max_attempts:
+            update["status"] = FAILED
+        else:
+            delay = min(self.backoff * 2 ** (attempts - 1), self.max_backoff)
+            update["next_attempt"] = now + timedelta(seconds=delay)
+        return UpdateOne(query, {"$set": update, "$unset": {"token": ""}})
+
+    async def drain_once(self) -> int:
+        """
+        Send one batch. Returns the number of records claimed (0 when nothing is due).
+        """
+        docs = await self.claim()
+        if len(docs) == 0:
+            return 0
+        records = [GlucoseRecord.from_payload(doc["payload"]) for doc in docs]
+        renew = asyncio.create_task(self._renew_lease([doc["_id"] for doc in docs], docs[0]["token"]))
+        try:
+            results = await self.client.post_glucose_many(records)
+        finally:
+            renew.cancel()
+            await asyncio.gather(renew, return_exceptions=True)
+        now = _now()
+        await self.collection.bulk_write([self._update(doc, result, now) for doc, result in zip(docs, results)], ordered=False)
+        return len(docs)
+
+    async def drain(self) -> int:
+        """
+        Send batches until nothing is due. Returns the number of records claimed.
+        """
+        count = 0
+        while (n := await self.drain_once()) > 0:
+            count += n
+        return count
+
+    async def _run_worker(self):
+        indexed = False
+        while True:
+            self._wakeup.clear()  # type: ignore
+            try:
+                if indexed == False:
+                    await self.collection.create_index([("status", 1), ("next_attempt", 1)])
+                    indexed = True
+                await self.drain()
+            except Exception as e:
+                # e.g. Mongo is unreachable: try again at the next interval
+                print(f"Outbox drain failed | {e!r}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)  # type: ignore
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        """
+        Start the worker. Call it from the running event loop (the FastAPI `lifespan`).
+        """
+        self._wakeup = asyncio.Event()
+        if self.interval > 0 and (self._worker is None or self._worker.done()):
+            self._worker = asyncio.create_task(self._run_worker())
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
+        self._wakeup = None
+
+
+outbox = Outbox()
@@ -1,21 +1,18 @@
 
 from typing import Any
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from datetime import datetime
+from itertools import groupby
+import numpy as np
 
-from pymongo import MongoClient
-import os
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from src.db import get_collection
 
-_ME_CONFIG_MONGODB_URL = os.environ["ME_CONFIG_MONGODB_URL"]
-print(_ME_CONFIG_MONGODB_URL)
-# Create a connection to the MongoDB server
-client = MongoClient(_ME_CONFIG_MONGODB_URL)
-# Access a specific database
-db = client["blood_glucose"]
-# Access a specific collection within the database
-collection = db["records"]
+# `blood_glucose.records`, through the shared motor client
+collection = get_collection("records", database="blood_glucose")
 
 router = APIRouter(
     responses={
@@ -36,5 +33,107 @@ class BloodCollection(BaseModel):
 
 @router.post("/save", response_class=JSONResponse)
 async def post_save(blood_col: BloodCollection) -> dict:
-    result = collection.insert_one(blood_col.model_dump())
-    return {"status": "success", "id": str(result.inserted_id), "data": blood_col}
\ No newline at end of file
+    result = await collection.insert_one(blood_col.model_dump())
+    return {"status": "success", "id": str(result.inserted_id), "data": blood_col}
+
+@router.post("/save/bulk", response_class=JSONResponse)
+async def post_save_bulk(blood_cols: list[BloodCollection]) -> dict:
+    """
+    Save many records with one unordered `insert_many`: a failing record does not stop the others.
+    The records are not echoed back, only their ids (in the request order).
+    """
+    if len(blood_cols) == 0:
+        raise HTTPException(status_code=422, detail="Nothing to save.")
+    try:
+        result = await collection.insert_many([blood_col.model_dump() for blood_col in blood_cols], ordered=False)
+    except BulkWriteError as e:
+        failed = sorted(error["index"] for error in e.details.get("writeErrors", []))
+        raise HTTPException(status_code=500, detail={
+            "message": f"{len(failed)} of {len(blood_cols)} records are not saved.",
+            "inserted": e.details.get("nInserted", 0),
+            "failed": failed,
+        })
+    return {"status": "success", "count": len(result.inserted_ids), "ids": [str(id) for id in result.inserted_ids]}
+
+class OptoFileRef(BaseModel):
+    subject_id: str
+    created: datetime
+
+class BatchPredictRequest(BaseModel):
+    spectra: list[list[float]] = []
+    optofiles: list[OptoFileRef] = []
+    subject_ids: list[str] = []
+    model: str | None = None
+    save: bool = False
+
+class OptoFilePrediction(OptoFileRef):
+    glucose: float
+
+class BatchPredictResponse(BaseModel):
+    model: str
+    spectra: list[float]
+    optofiles: list[OptoFilePrediction]
+
+@router.post("/predict/batch", response_class=JSONResponse)
+async def post_predict_batch(request: BatchPredictRequest) -> BatchPredictResponse:
+    """
+    Predict glucose of many spectra in one call.
+
+    `spectra` are raw spectra on the device Raman Shift axis. `optofiles` and `subject_ids`
+    reference stored `OptoFile` documents (their `baseline_subtracted` on their own `raman_shift`).
+    Spectra sharing a Raman Shift axis are preprocessed together by a `CompiledPipeline` (through the `feature_cache`),
+    then stacked and passed to a single `pca.transform` + `model.predict`, in the inference pool.
+    When `save` is True, `glucose_predict` of the referenced `OptoFile` is updated (one unordered `bulk_write`).
+    """
+    from src.db import OptoFile, engine
+    from src.inference import registry, inference, InferenceBusy, LoadedModel
+
+    try:
+        model:LoadedModel = registry.get(request.model)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    optofiles:list[OptoFile] = []
+    for ref in request.optofiles:
+        optofile = await OptoFile.fetch(subject_id=ref.subject_id, created=ref.created)
+        if optofile is None:
+            raise HTTPException(status_code=404, detail=f"OptoFile {ref.subject_id=} {ref.created=} is not found")
+        optofiles.append(optofile)
+    for subject_id in request.subject_ids:
+        optofiles += await OptoFile.fetch_all(subject_id=subject_id)
+
+    if len(request.spectra) + len(optofiles) == 0:
+        raise HTTPException(status_code=422, detail="Nothing to predict. Specify `spectra`, `optofiles` or `subject_ids`.")
+    n_pixels = registry.raman_shift().shape[0]
+    invalid = [idx for idx, spectrum in enumerate(request.spectra) if len(spectrum) != n_pixels]
+    if len(invalid) > 0:
+        raise HTTPException(status_code=422, detail=f"Expecting spectra of {n_pixels} values (the device Raman Shift axis) "
+                                                    f"but spectra {invalid} are not.")
+
+    groups:list[tuple[np.ndarray | None, np.ndarray]] = []
+    if len(request.spectra) > 0:
+        groups.append((None, np.asarray(request.spectra, dtype=np.float64)))
+    for raman_shift, group in groupby(optofiles, key=lambda optofile: optofile.array("raman_shift").tobytes()):
+        groups.append((np.frombuffer(raman_shift), np.vstack([optofile.array("baseline_subtracted") for optofile in group])))
+    try:
+        preds:list[float] = (await inference.predict_groups(groups, model_name=model.name)).tolist()
+    except InferenceBusy as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    n_spectra = len(request.spectra)
+    results:list[OptoFilePrediction] = []
+    updates:list[UpdateOne] = []
+    for optofile, pred in zip(optofiles, preds[n_spectra:]):
+        results.append(OptoFilePrediction(subject_id=optofile.subject_id, created=optofile.created, glucose=pred))
+        if request.save:
+            updates.append(UpdateOne({"_id": optofile.id}, {"$set": {"glucose_predict": pred}}))
+    if len(updates) > 0:
+        try:
+            await engine.get_collection(OptoFile).bulk_write(updates, ordered=False)
+        except BulkWriteError as e:
+            failed = sorted(error["index"] for error in e.details.get("writeErrors", []))
+            raise HTTPException(status_code=500, detail={
+                "message": f"{len(failed)} of {len(updates)} predictions are not saved.",
+                "failed": failed,
+            })
+    return BatchPredictResponse(model=model.name, spectra=preds[:n_spectra], optofiles=results)
\ No newline at end of file
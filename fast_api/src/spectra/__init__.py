@@ -1 +1,4 @@
-from .sample import Sample
\ No newline at end of file
+from .sample import Sample
+from .batch import SpectrumBatch
+from .pipeline import CompiledPipeline
+from .cache import FeatureCache, feature_cache
\ No newline at end of file
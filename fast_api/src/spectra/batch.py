@@ -0,0 +1,329 @@
+import numpy as np
+from numpy.typing import NDArray
+from scipy.signal import find_peaks, peak_widths  # type: ignore
+from scipy.signal import savgol_filter  # type: ignore
+from scipy.signal import butter, filtfilt  # type: ignore
+from datetime import datetime
+from typing import Any, Self, TYPE_CHECKING
+from .sample import Sample, _readonly
+from .pipeline import despike
+from .interpolation import SplineOperator
+
+if TYPE_CHECKING:
+    from ..db import OptoFile
+
+# The `Sample` attributes carried in the metadata table by `from_samples`.
+SAMPLE_FIELDS: list[str] = ["name", "date", "exposure", "accumulation", "grating", "laser", "power", "lens", "slit", "paths"]
+
+
+def _column(values: list[Any]) -> np.ndarray:
+    if len(values) > 0 and all(isinstance(v, datetime) for v in values):
+        return np.array(values, dtype="datetime64[ms]")
+    if len(values) > 0 and all(isinstance(v, (str, int, float, bool)) for v in values):
+        return np.array(values)
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+
+class SpectrumBatch:
+    """
+    `SpectrumBatch` is a representation of many measurements on the same Raman Shift.
+
+    The spectra are the rows of one `y` matrix, so the `Sample` preprocessing methods
+    (`despike`, `interpolate`, `extract_range`, `smoothing`, `normalized`, `baseline`, `butter_*_filter`)
+    are applied to every spectrum at once along axis 1, with the same parameters and results as `Sample`.
+
+    Attributes
+    ----------
+    x : NDArray of shape (n_features, )
+        The Raman Shift shared by every spectrum.
+    y : NDArray of shape (n_samples, n_features)
+        One spectrum per row.
+    meta : dict of {field: NDArray of shape (n_samples, )}
+        The metadata table, one value per spectrum (e.g. 'subject_id', 'created', 'glucose_target').
+    """
+
+    x: NDArray[np.float64]
+    y: NDArray[np.float64]
+    meta: dict[str, np.ndarray]
+
+    _dx: float
+
+    def __init__(self, x: NDArray[np.float64], y: NDArray[np.float64], meta: dict[str, Any] | None = None):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if x.ndim != 1:
+            raise ValueError(f"Expecting 1D `x` but got shape={x.shape}")
+        if y.ndim != 2 or y.shape[1] != x.shape[0]:
+            raise ValueError(f"shape mismatch between x={x.shape} and y={y.shape}")
+        self.meta = {}
+        for key, values in (meta or {}).items():
+            column = values if isinstance(values, np.ndarray) else _column(list(values))
+            if column.shape != (y.shape[0],):
+                raise ValueError(f"shape mismatch between y={y.shape} and meta['{key}']={column.shape}")
+            self.meta[key] = column
+
+        # Original Data that should not be replace so that we can always reset.
+        self._x: NDArray[np.float64] = _readonly(x)
+        self._y: NDArray[np.float64] = _readonly(y)
+        self.reset_data()
+
+    def __len__(self) -> int:
+        return self.y.shape[0]
+
+    def __getitem__(self, idx) -> Self:
+        """
+        The spectra selected by `idx` (an integer, a slice, indexes or a boolean mask), as a new `SpectrumBatch`.
+        """
+        if isinstance(idx, (int, np.integer)):
+            idx = [idx]
+        return SpectrumBatch(self.x, self.y[idx], meta={key: values[idx] for key, values in self.meta.items()})
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.y.shape
+
+    def reset_data(self):
+        """
+        Use to set/reset the data (`x` and `y`) with the original data.
+        """
+        self.x = self._x
+        self.y = self._y
+        self._dx: float = np.diff(self.x).mean()  # type: ignore
+
+    def at(self, shift: float | list[float]) -> np.ndarray:
+        """
+        `Sample.at` of every spectrum: the natural cubic spline of each row evaluated at `shift`.
+
+        Returns
+        -------
+        NDArray :
+            shape of (n_samples, ) for a single `shift`, (n_samples, n_shifts) otherwise.
+        """
+        shift = np.asarray(shift, dtype=np.float64)
+        # One-off query points: not worth a slot in the `SplineOperator` cache
+        y = SplineOperator(self.x, np.atleast_1d(shift))(self.y)
+        return y[:, 0] if shift.ndim == 0 else y
+
+    def find_spike(self, prominence: float = 250, width: float | None = None) -> list[list[np.ndarray]]:
+        """
+        `Sample.find_spike` of every spectrum.
+
+        Returns
+        --------
+        list of list of NDArray :
+            The spike regions (indexes) of each spectrum.
+        """
+        if isinstance(width, type(None)):
+            width = int(10 / self._dx)
+        spike_regions: list[list[np.ndarray]] = []
+        for y in self.y:
+            peak_idxes, _ = find_peaks(y, prominence=prominence)
+            widths, _, lefts, rights = peak_widths(y, peak_idxes)
+            is_spikes = widths < width
+            spike_regions.append([
+                np.arange(np.floor(left) - 1, np.ceil(right) + 1, dtype=np.int64)
+                for left, right in zip(lefts[is_spikes], rights[is_spikes])
+            ])
+        return spike_regions
+
+    def despike(self, window_length: str | int = "auto", threshold: int = 3):
+        """
+        Vectorized `rampy.spectranization.despiking`, same parameters as `Sample.despike`.
+        """
+        if isinstance(window_length, str):
+            if window_length != "auto":
+                raise ValueError(
+                    f"window_length should be 'auto' or integer. Got {window_length=}"
+                )
+            window_length = int(5 / self._dx)
+        self.y = despike(self.y, window_length=window_length, threshold=threshold)
+
+    def interpolate(self, step: float):
+        """
+        Interpolate every spectrum onto the same grid as `Sample.interpolate`, with one `SplineOperator`.
+        """
+        minx = np.floor(self.x.min())
+        maxx = np.ceil(self.x.max())
+        new_x = np.arange(minx, maxx + step, step=step)
+        self.y = SplineOperator.for_axis(self.x, new_x)(self.y)
+        self.x = new_x
+        self._dx = step
+
+    def normalized(self, method: str = "minmax"):
+        """
+        `Sample.normalized` of every spectrum: 'minmax' or 'zscore', per row.
+        """
+        if method == "minmax":
+            ymin = self.y.min(axis=1, keepdims=True)
+            ymax = self.y.max(axis=1, keepdims=True)
+            self.y = (self.y - ymin) / (ymax - ymin)
+        elif method == "zscore":
+            self.y = (self.y - self.y.mean(axis=1, keepdims=True)) / self.y.std(axis=1, keepdims=True)
+        else:
+            raise ValueError(
+                f"method={method} is not supported. Use 'minmax' or 'zscore'. "
+            )
+
+    def smoothing(
+        self, window_length: str | int = "auto", polyorder=2, test: bool = False
+    ) -> np.ndarray:
+        """
+        `scipy.signal.savgol_filter` along axis 1, same parameters as `Sample.smoothing`.
+        """
+        if isinstance(window_length, str):
+            if window_length != "auto":
+                raise ValueError(
+                    f"window_length should be 'auto' or integer. Got {window_length=}"
+                )
+            window_length = int(30 / self._dx)
+
+        y = savgol_filter(x=self.y, window_length=window_length, polyorder=polyorder, axis=1)
+        if test == False:
+            self.y = y
+        return y
+
+    def butter_lowpass_filter(self, normal_cutoff: float, order: int = 1) -> np.ndarray:
+        b, a = butter(order, normal_cutoff, btype='low', analog=False)
+        y = filtfilt(b, a, self.y, axis=1)
+        self.y = y
+        return y
+
+    def butter_highpass_filter(self, normal_cutoff: float, order: int = 1) -> np.ndarray:
+        b, a = butter(order, normal_cutoff, btype='high', analog=False)
+        y = filtfilt(b, a, self.y, axis=1)
+        self.y = y
+        return y
+
+    def baseline(
+        self, order: int, roi: list[list[float]] | np.ndarray | None = None, test: bool = False
+    ) -> np.ndarray:
+        """
+        `rampy.baseline(method='poly')` of every spectrum with one least-squares solve.
+
+        Parameters
+        ----------
+        order : int
+            The order of the polynomial to fit the baseline.
+        roi : n x 2 array or None
+            The [low, high] regions (exclusive bounds, like rampy) where the baseline is fitted.
+            Default is the whole Raman Shift.
+        test : bool
+            When this is True, the baseline is not subtracted from `y`.
+
+        Returns
+        -------
+        NDArray of shape (n_samples, n_features) :
+            The baseline of each spectrum.
+        """
+        if order < 1:
+            raise ValueError(f"order must be greater than 0. Got {order=}")
+        if roi is None:
+            roi = [[self.x.min(), self.x.max()]]
+        roi = np.asarray(roi, dtype=np.float64)
+        if roi.ndim != 2 or roi.shape[1] != 2:
+            raise ValueError(f"roi must be an n x 2 array. Got shape={roi.shape}")
+
+        # Same points as rampy: one block per region, so overlapping regions count twice.
+        points = np.concatenate([np.flatnonzero((self.x > low) & (self.x < high)) for low, high in roi])
+        if points.shape[0] <= order:
+            raise ValueError(f"roi has {points.shape[0]} points, not enough to fit a polynomial of {order=}")
+        x_scaled = (self.x - self.x.mean()) / self.x.std()
+        design = np.vander(x_scaled, order + 1)
+        coefficients = np.linalg.pinv(design[points]) @ self.y[:, points].T
+        y = (design @ coefficients).T
+        if test == False:
+            self.y = self.y - y
+        return y
+
+    def extract_range(self, low: float, high: float):
+        """
+        Use to extract Raman Shift range [low, high] of every spectrum.
+        """
+        cond = (self.x >= low) & (self.x <= high)
+        self.x = self.x[cond]
+        self.y = self.y[:, cond]
+
+    def is_same_range(self, x: NDArray[np.float64]) -> bool:
+        x = np.asarray(x)
+        return x.shape == self.x.shape and bool((x == self.x).all())
+
+    @staticmethod
+    def from_samples(samples: list[Sample], fields: list[str] = SAMPLE_FIELDS) -> "SpectrumBatch":
+        """
+        Stack `Sample`s that have the same Raman Shift. Each attribute of `fields` that every sample has becomes a metadata column.
+        """
+        if len(samples) == 0:
+            raise ValueError(f"Method expect at least one Sample.")
+        first = samples[0]
+        for sample in samples[1:]:
+            if first.is_same_range(sample) == False:
+                raise ValueError(f"Expect every Sample to have the same Raman Shift range.")
+        meta = {
+            key: [getattr(sample, key) for sample in samples]
+            for key in fields if all(hasattr(sample, key) for sample in samples)
+        }
+        return SpectrumBatch(first.x, np.stack([sample.y for sample in samples]), meta=meta)
+
+    def to_samples(self) -> list[Sample]:
+        """
+        One `Sample` (not interpolated) per spectrum, with the metadata columns as attributes.
+        """
+        samples = []
+        for i, y in enumerate(self.y):
+            sample = Sample(x=self.x, y=y, interpolate=False)
+            for key, values in self.meta.items():
+                value = values[i]
+                if isinstance(value, np.datetime64):
+                    value = value.astype(datetime)
+                elif isinstance(value, np.generic):
+                    value = value.item()
+                if key == "paths":
+                    value = set(value)
+                sample.__setattr__(key, value)
+            samples.append(sample)
+        return samples
+
+    @staticmethod
+    def from_optofiles(
+        optofiles: list["OptoFile"],
+        array: str = "baseline_subtracted",
+        fields: list[str] = ["subject_id", "created", "glucose_target"],
+    ) -> "SpectrumBatch":
+        """
+        Stack the `array` of `OptoFile`s measured on the same Raman Shift, with `fields` as metadata.
+        The axis of packed documents must be loaded (`load_axes`).
+        """
+        if len(optofiles) == 0:
+            raise ValueError(f"Method expect at least one OptoFile.")
+        x = optofiles[0].array("raman_shift")
+        for optofile in optofiles[1:]:
+            other = optofile.array("raman_shift")
+            if other.shape != x.shape or (other != x).any():
+                raise ValueError(f"Expect every OptoFile to have the same Raman Shift.")
+        y = np.stack([optofile.array(array) for optofile in optofiles])
+        meta = {key: [getattr(optofile, key) for optofile in optofiles] for key in fields}
+        return SpectrumBatch(x, y, meta=meta)
+
+    def to_optofiles(self, optofiles: list["OptoFile"], array: str = "baseline_subtracted") -> list["OptoFile"]:
+        """
+        Copies of `optofiles` (same order as the rows) with `array` replaced by `y`.
+        `x` must still be their Raman Shift, so only pixel-wise methods (`despike`, `smoothing`, `baseline`, ...) apply.
+        Packed documents stay packed with their dtype.
+        """
+        from ..db.packed import PackedArray
+
+        if len(optofiles) != len(self):
+            raise ValueError(f"Expect {len(self)} OptoFile but got {len(optofiles)}")
+        results = []
+        for optofile, y in zip(optofiles, self.y):
+            if self.is_same_range(optofile.array("raman_shift")) == False:
+                raise ValueError(f"The Raman Shift changed (interpolate/extract_range), it can not be stored in an OptoFile.")
+            new_optofile = optofile.model_copy(deep=True)
+            if new_optofile.is_packed and new_optofile.packed is not None and array in new_optofile.packed:
+                new_optofile.packed[array] = PackedArray.pack(y, dtype=new_optofile.packed[array].dtype)
+            else:
+                setattr(new_optofile, array, y.tolist())
+            results.append(new_optofile)
+        return results
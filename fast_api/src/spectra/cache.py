@@ -0,0 +1,172 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+from numpy.typing import NDArray
+from .pipeline import CompiledPipeline
+
+_CACHE_DIR: str = os.environ.get("FEATURE_CACHE_DIR", ".cache/features")
+_CACHE_MAX_BYTES: int = int(os.environ.get("FEATURE_CACHE_MAX_BYTES", str(256 * 2**20)))
+
+
+class FeatureCache:
+    """
+    Content-addressed on-disk cache of preprocessed spectra.
+
+    An entry is the `CompiledPipeline` output of one spectrum, stored as `<directory>/<key[:2]>/<key>.npy`
+    and read back memory-mapped. The key is a hash of the raw spectrum and of `CompiledPipeline.key`
+    (its Raman Shift axis and parameters), so changing any preprocessing parameter never returns stale features.
+
+    The total size is bounded by `max_bytes` (`FEATURE_CACHE_MAX_BYTES`): the least recently used entries are evicted first.
+    Recency is the file mtime (updated on every hit), so it survives restarts and is shared,
+    approximately, by processes using the same directory.
+    """
+
+    def __init__(self, directory: Path | str = _CACHE_DIR, max_bytes: int = _CACHE_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hits: int = 0
+        self.misses: int = 0
+        self._index: OrderedDict[str, int] | None = None
+        self._size: int = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(pipeline: CompiledPipeline, spectrum: NDArray[np.float64]) -> str:
+        digest = hashlib.sha1(pipeline.key.encode())
+        digest.update(np.ascontiguousarray(spectrum, dtype=np.float64).tobytes())
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.npy"
+
+    @property
+    def index(self) -> OrderedDict[str, int]:
+        """
+        {key: size in bytes}, least recently used first. Built from the directory on first use.
+        """
+        if self._index is None:
+            entries = []
+            for path in self.directory.glob("*/*.npy"):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, path.stem, stat.st_size))
+            entries.sort()
+            self._index = OrderedDict((key, size) for _, key, size in entries)
+            self._size = sum(self._index.values())
+        return self._index
+
+    @property
+    def size(self) -> int:
+        self.index
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def _forget(self, key: str) -> None:
+        size = self.index.pop(key, None)
+        if size is not None:
+            self._size -= size
+
+    def get(self, key: str) -> NDArray[np.float64] | None:
+        """
+        The features of `key` (a read-only memory map), or None.
+        """
+        path = self._path(key)
+        with self._lock:
+            try:
+                features = np.load(path, mmap_mode="r")
+                os.utime(path)
+            except (FileNotFoundError, ValueError, OSError):
+                # Missing (e.g. evicted by another process) or partially written by a crashed one
+                self._forget(key)
+                self.misses += 1
+                return None
+            if key in self.index:
+                self.index.move_to_end(key)
+            else:
+                self.index[key] = path.stat().st_size
+                self._size += self.index[key]
+            self.hits += 1
+            return features
+
+    def put(self, key: str, features: NDArray[np.float64]) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, np.asarray(features, dtype=np.float64))
+        os.replace(tmp, path)
+        with self._lock:
+            self._forget(key)
+            self.index[key] = path.stat().st_size
+            self._size += self.index[key]
+            self._evict()
+
+    def _evict(self) -> None:
+        while self._size > self.max_bytes and len(self.index) > 0:
+            key, size = self.index.popitem(last=False)
+            self._size -= size
+            try:
+                self._path(key).unlink()
+            except FileNotFoundError:
+                pass
+
+    def lookup(self, pipeline: CompiledPipeline, spectra: NDArray[np.float64]) -> tuple[list[str], NDArray[np.float64] | None, NDArray[np.int64]]:
+        """
+        Parameters
+        ----------
+        spectra : NDArray of shape (n_samples, n_pixels)
+
+        Returns
+        -------
+        tuple of (keys, features, missing) :
+            The key of each spectrum, the (n_samples, n_features) features with the cached rows filled
+            (None if nothing is cached) and the indices of the rows that are not cached.
+        """
+        keys = [self.key(pipeline, spectrum) for spectrum in spectra]
+        features = None
+        missing = []
+        for i, key in enumerate(keys):
+            cached = self.get(key)
+            if cached is None:
+                missing.append(i)
+                continue
+            if features is None:
+                features = np.empty((len(keys), cached.shape[0]), dtype=np.float64)
+            features[i] = cached
+        return keys, features, np.asarray(missing, dtype=np.int64)
+
+    def transform(self, pipeline: CompiledPipeline, spectra: NDArray[np.float64] | list[float] | list[list[float]]) -> NDArray[np.float64]:
+        """
+        Same as `pipeline(spectra)`, reading the cached spectra and preprocessing (then caching) only the others.
+        The cache is bypassed when `max_bytes` is 0.
+        """
+        if self.max_bytes <= 0:
+            return pipeline(spectra)
+        Y = np.asarray(spectra, dtype=np.float64)
+        is_single = Y.ndim == 1
+        Y = np.atleast_2d(Y)
+        keys, features, missing = self.lookup(pipeline, Y)
+        if len(missing) > 0:
+            Z = pipeline(Y[missing])
+            if features is None:
+                features = np.empty((Y.shape[0], Z.shape[1]), dtype=np.float64)
+            features[missing] = Z
+            for i, z in zip(missing, Z):
+                self.put(keys[i], z)
+        return features[0] if is_single else features  # type: ignore
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in list(self.index):
+                self._forget(key)
+                self._path(key).unlink(missing_ok=True)
+
+
+feature_cache = FeatureCache()
@@ -0,0 +1,119 @@
+import numpy as np
+from numpy.typing import NDArray
+from scipy import sparse  # type: ignore
+from scipy.sparse.linalg import splu  # type: ignore
+from collections import OrderedDict
+import hashlib
+import os
+
+_SPLINE_CACHE_SIZE:int = int(os.environ.get("SPLINE_CACHE_SIZE", "32"))
+
+
+class SplineOperator:
+    """
+    `SplineOperator` is a precomputed natural cubic spline from a fixed source axis to a fixed target axis.
+
+    The natural spline of `y` is linear in `y`: its second derivatives `M` solve a tridiagonal system `T @ M = D @ y`,
+    and each target point only depends on the 2 source points around it and their `M`:
+    - (1) `T` is factorized once (sparse LU)
+    - (2) `D`, and the value/curvature weights `A` and `B`, are sparse matrices
+    - (3) `spline(y)(target) = A @ y + B @ M`
+
+    So interpolating a spectrum costs a sparse solve and two sparse products instead of building a `CubicSpline`.
+    The output matches `scipy.interpolate.CubicSpline(source, y, bc_type="natural")(target)` to about 1e-12 (relative),
+    including the extrapolation outside the source axis.
+
+    Attributes
+    ----------
+    source : NDArray of shape (n_pixels, )
+        The increasing axis the spectra are measured on.
+    target : NDArray of shape (n_targets, )
+        The axis to interpolate onto.
+    """
+
+    source: NDArray[np.float64]
+    target: NDArray[np.float64]
+
+    _cache: OrderedDict[str, "SplineOperator"] = OrderedDict()
+
+    def __init__(self, source: NDArray[np.float64], target: NDArray[np.float64]):
+        self.source = np.asarray(source, dtype=np.float64)
+        self.target = np.asarray(target, dtype=np.float64)
+        if self.source.ndim != 1 or self.source.shape[0] < 3:
+            raise ValueError(f"Expecting 1D `source` with at least 3 points but got shape={self.source.shape}")
+        if (np.diff(self.source) <= 0).any():
+            raise ValueError(f"`source` must be strictly increasing.")
+        self._compile()
+
+    @classmethod
+    def for_axis(cls, source: NDArray[np.float64], target: NDArray[np.float64]) -> "SplineOperator":
+        """
+        Return a (cached) `SplineOperator` from `source` to `target`.
+        Only the `SPLINE_CACHE_SIZE` most recently used operators are kept.
+        """
+        source = np.asarray(source, dtype=np.float64)
+        target = np.asarray(target, dtype=np.float64)
+        key = hashlib.sha1(source.tobytes() + b"|" + target.tobytes()).hexdigest()
+        operator = cls._cache.get(key)
+        if operator is None:
+            operator = cls(source=source, target=target)
+            cls._cache[key] = operator
+        cls._cache.move_to_end(key)
+        while len(cls._cache) > _SPLINE_CACHE_SIZE:
+            cls._cache.popitem(last=False)
+        return operator
+
+    def _compile(self):
+        x = self.source
+        n = x.shape[0]
+        h = np.diff(x)
+        inner = np.arange(1, n - 1)
+
+        # (1) Natural spline: M[0] = M[-1] = 0, the inner second derivatives solve T @ M[1:-1] = D @ y.
+        T = sparse.diags([h[1:-1], 2 * (h[:-1] + h[1:]), h[1:-1]], offsets=[-1, 0, 1], format="csc")
+        self._lu = splu(T)
+        self._D = sparse.csr_matrix(
+            (
+                np.concatenate([6 / h[:-1], -6 / h[:-1] - 6 / h[1:], 6 / h[1:]]),
+                (np.tile(inner - 1, 3), np.concatenate([inner - 1, inner, inner + 1])),
+            ),
+            shape=(n - 2, n),
+        )
+
+        # (2) The interval of each target point (the end intervals extrapolate).
+        interval = np.clip(np.searchsorted(x, self.target, side="right") - 1, 0, n - 2)
+        width = h[interval]
+        a = (x[interval + 1] - self.target) / width
+        b = 1 - a
+        rows = np.arange(self.target.shape[0])
+        self._A = sparse.csr_matrix(
+            (np.concatenate([a, b]), (np.tile(rows, 2), np.concatenate([interval, interval + 1]))),
+            shape=(rows.shape[0], n),
+        )
+        # Curvature weights on M, without the two zero end values.
+        weights = np.concatenate([(a ** 3 - a) * width ** 2 / 6, (b ** 3 - b) * width ** 2 / 6])
+        columns = np.concatenate([interval, interval + 1]) - 1
+        keep = (columns >= 0) & (columns < n - 2)
+        self._B = sparse.csr_matrix(
+            (weights[keep], (np.tile(rows, 2)[keep], columns[keep])),
+            shape=(rows.shape[0], n - 2),
+        )
+
+    def __call__(self, y: NDArray[np.float64]) -> NDArray[np.float64]:
+        """
+        Interpolate spectra measured on `source` onto `target`.
+
+        Parameters
+        ----------
+        y : NDArray of shape (n_pixels, ) or (n_samples, n_pixels)
+
+        Returns
+        -------
+        NDArray of shape (n_targets, ) or (n_samples, n_targets)
+        """
+        Y = np.asarray(y, dtype=np.float64)
+        if Y.shape[-1] != self.source.shape[0]:
+            raise ValueError(f"shape mismatch between source={self.source.shape} and y={Y.shape}")
+        Y = Y.T
+        M = self._lu.solve(np.ascontiguousarray(self._D @ Y))
+        return (self._A @ Y + self._B @ M).T
@@ -0,0 +1,196 @@
+import numpy as np
+from numpy.typing import NDArray
+from scipy.interpolate import CubicSpline  # type: ignore
+from scipy.signal import savgol_filter  # type: ignore
+import hashlib
+import json
+
+
+class CompiledPipeline:
+    """
+    `CompiledPipeline` is a precomputed version of the `create_sample` preprocessing for a fixed Raman Shift axis.
+
+    The `Sample`-based chain is
+    despike -> interpolate -> extract_range -> smoothing -> baseline -> normalized -> extract_range.
+
+    Everything between despike and normalized is linear in `y`:
+    - (1) CubicSpline interpolation onto the integer grid is a (n_grid, n_pixels) matrix
+    - (2) extract_range is a row selection of that matrix
+    - (3) savgol_filter (mode='interp') is a (n_grid, n_grid) matrix
+    - (4) the 'poly' baseline fitted on the `baseline_roi` points is a least-squares projection
+
+    These are folded into a single `operator` once, so a batch of spectra only needs
+    a vectorized despike, one matrix product, a min-max scaling and a slice.
+    The output matches the `Sample`-based chain to about 1e-9 (absolute, after min-max scaling).
+
+    Attributes
+    ----------
+    x : NDArray of shape (n_features, )
+        The Raman Shift of the output.
+    raman_shift : NDArray of shape (n_pixels, )
+        The Raman Shift axis of the input spectra.
+    operator : NDArray of shape (n_grid, n_pixels)
+        The interpolate -> extract_range -> smoothing -> baseline operator.
+    """
+
+    x: NDArray[np.float64]
+    raman_shift: NDArray[np.float64]
+    operator: NDArray[np.float64]
+
+    _cache: dict[str, "CompiledPipeline"] = {}
+
+    def __init__(
+        self,
+        raman_shift: NDArray[np.float64],
+        despike_window: int = 10,
+        despike_threshold: float = 5,
+        step: float = 1,
+        interpolate_range: tuple[float, float] = (750, 1650),
+        smoothing_window: int = 60,
+        smoothing_polyorder: int = 1,
+        baseline_roi: list[list[float]] = [[905, 915], [1050, 1070], [1100, 1150], [1400, 1460]],
+        baseline_order: int = 1,
+        output_range: tuple[float, float] = (800, 1600),
+    ):
+        self.raman_shift = np.asarray(raman_shift, dtype=np.float64)
+        if self.raman_shift.ndim != 1:
+            raise ValueError(f"Expecting 1D `raman_shift` but got shape={self.raman_shift.shape}")
+        self.despike_window = despike_window
+        self.despike_threshold = despike_threshold
+        self.step = step
+        self.interpolate_range = tuple(interpolate_range)
+        self.smoothing_window = smoothing_window
+        self.smoothing_polyorder = smoothing_polyorder
+        self.baseline_roi = [list(roi) for roi in baseline_roi]
+        self.baseline_order = baseline_order
+        self.output_range = tuple(output_range)
+        self._key: str | None = None
+        self._compile()
+
+    @property
+    def params(self) -> dict:
+        """
+        The preprocessing parameters (without the Raman Shift axis).
+        """
+        return {
+            "despike_window": self.despike_window,
+            "despike_threshold": self.despike_threshold,
+            "step": self.step,
+            "interpolate_range": list(self.interpolate_range),
+            "smoothing_window": self.smoothing_window,
+            "smoothing_polyorder": self.smoothing_polyorder,
+            "baseline_roi": self.baseline_roi,
+            "baseline_order": self.baseline_order,
+            "output_range": list(self.output_range),
+        }
+
+    @property
+    def key(self) -> str:
+        """
+        A hash of the Raman Shift axis and the parameters: two pipelines with the same key give the same output.
+        """
+        if self._key is None:
+            digest = hashlib.sha1(self.raman_shift.tobytes())
+            digest.update(json.dumps(self.params, sort_keys=True).encode())
+            self._key = digest.hexdigest()
+        return self._key
+
+    @classmethod
+    def for_axis(cls, raman_shift: NDArray[np.float64], **kwargs) -> "CompiledPipeline":
+        """
+        Return a (cached) `CompiledPipeline` for `raman_shift` and the parameters `kwargs`.
+        """
+        raman_shift = np.asarray(raman_shift, dtype=np.float64)
+        key = hashlib.sha1(raman_shift.tobytes() + repr(sorted(kwargs.items())).encode()).hexdigest()
+        pipeline = cls._cache.get(key)
+        if pipeline is None:
+            pipeline = cls(raman_shift=raman_shift, **kwargs)
+            cls._cache[key] = pipeline
+        return pipeline
+
+    def _compile(self):
+        x = self.raman_shift
+        n_pixels = x.shape[0]
+        # (1) Interpolate onto the same grid as `Sample.interpolate`, (2) keep only the interpolate_range.
+        grid = np.arange(np.floor(x.min()), np.ceil(x.max()) + self.step, step=self.step)
+        low, high = self.interpolate_range
+        grid = grid[(grid >= low) & (grid <= high)]
+        operator = CubicSpline(x, np.eye(n_pixels), bc_type="natural", axis=0)(grid)
+        # (3) Savitzky-Golay is linear so it can be applied to the operator's columns.
+        operator = savgol_filter(operator, window_length=self.smoothing_window, polyorder=self.smoothing_polyorder, axis=0)
+        # (4) Polynomial baseline fitted on the ROI points (rampy uses exclusive bounds and standardized x).
+        grid_scaled = (grid - grid.mean()) / grid.std()
+        in_roi = np.zeros(grid.shape, dtype=bool)
+        for roi_low, roi_high in self.baseline_roi:
+            in_roi |= (grid > roi_low) & (grid < roi_high)
+        design = np.vander(grid_scaled, self.baseline_order + 1)
+        projection = design @ np.linalg.pinv(design[in_roi])
+        self.operator = operator - projection @ operator[in_roi]
+
+        out_low, out_high = self.output_range
+        self._output_mask = (grid >= out_low) & (grid <= out_high)
+        self.x = grid[self._output_mask]
+
+    def despike(self, Y: NDArray[np.float64]) -> NDArray[np.float64]:
+        """
+        Vectorized `rampy.spectranization.despiking` along axis 1 (see `despike`).
+        """
+        return despike(Y, window_length=self.despike_window, threshold=self.despike_threshold)
+
+    def __call__(self, spectra: NDArray[np.float64] | list[float] | list[list[float]]) -> NDArray[np.float64]:
+        """
+        Preprocess spectra measured on `raman_shift`.
+
+        Parameters
+        ----------
+        spectra : NDArray of shape (n_samples, n_pixels) or (n_pixels, )
+
+        Returns
+        -------
+        NDArray of shape (n_samples, n_features) or (n_features, ) :
+            Same as `create_sample(...).y` for each spectrum.
+        """
+        Y = np.asarray(spectra, dtype=np.float64)
+        is_single = Y.ndim == 1
+        Y = np.atleast_2d(Y)
+        if Y.shape[1] != self.raman_shift.shape[0]:
+            raise ValueError(f"shape mismatch between raman_shift={self.raman_shift.shape} and spectra={Y.shape}")
+
+        Y = self.despike(Y)
+        Z = Y @ self.operator.T
+        zmin = Z.min(axis=1, keepdims=True)
+        zmax = Z.max(axis=1, keepdims=True)
+        # A flat spectrum has no range: scaled to 0 instead of NaN
+        zrange = zmax - zmin
+        Z = (Z[:, self._output_mask] - zmin) / np.where(zrange > 0, zrange, 1)
+        return Z[0] if is_single else Z
+
+
+def despike(Y: NDArray[np.float64], window_length: int, threshold: float) -> NDArray[np.float64]:
+    """
+    Vectorized `rampy.spectranization.despiking` along axis 1.
+
+    Points whose residual to a Savitzky-Golay smoothing (window=`window_length`, polyorder=2) exceeds
+    `threshold` times the RMS residual of their spectrum are replaced with the mean of the
+    non-spike points within `window_length` of them.
+    """
+    neigh = window_length
+    smoothed = savgol_filter(Y, window_length=neigh, polyorder=2, axis=1)
+    residual = np.abs(Y - smoothed)
+    rmse_mean = np.sqrt(np.mean((Y - smoothed) ** 2, axis=1, keepdims=True))
+    spikes = residual > threshold * rmse_mean
+    if not spikes.any():
+        return Y
+
+    # Windowed sum/count of the non-spike points with a cumulative sum.
+    valid = ~spikes
+    n = Y.shape[1]
+    zeros = np.zeros((Y.shape[0], 1))
+    sum_valid = np.hstack([zeros, np.cumsum(np.where(valid, Y, 0), axis=1)])
+    count_valid = np.hstack([zeros, np.cumsum(valid, axis=1)])
+    idx = np.arange(n)
+    low = np.clip(idx - neigh, 0, n)
+    high = np.clip(idx + 1 + neigh, 0, n)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = (sum_valid[:, high] - sum_valid[:, low]) / (count_valid[:, high] - count_valid[:, low])
+    return np.where(spikes, means, Y)
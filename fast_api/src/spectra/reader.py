@@ -0,0 +1,116 @@
+"""
+Load a directory of Horiba LS6 exports (see `read_txt`) at once.
+
+    samples = read_dir("data/silicon/focuspower", cache="data/silicon/focuspower.npz")
+    batch = read_dir("data/silicon/focuspower", as_batch=True)
+
+The files are parsed in a thread or process pool. With `cache`, the raw spectra of the directory are also kept
+in one `.npz`, which is used instead of the files as long as none of them was added, removed or modified.
+"""
+import numpy as np
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+import os
+from .sample import Sample, NAME_FORMAT, _load_raman_from_txt, _parse_filename, _split_filename
+from .batch import SpectrumBatch
+
+
+def _stats(paths: list[Path]) -> np.ndarray:
+    # What the cache is valid for: name, size and mtime of every file.
+    stats = [(path.name, path.stat()) for path in paths]
+    return np.array([f"{name}\t{stat.st_size}\t{stat.st_mtime_ns}" for name, stat in stats])
+
+
+def _load_cache(cache: Path, stats: np.ndarray) -> list[tuple[np.ndarray, np.ndarray]] | None:
+    if cache.exists() == False:
+        return None
+    with np.load(cache, allow_pickle=False) as data:
+        if data["stats"].shape != stats.shape or (data["stats"] != stats).any():
+            return None
+        x, y, offsets = data["x"], data["y"], data["offsets"]
+    return [(x[start:end], y[start:end]) for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def _save_cache(cache: Path, stats: np.ndarray, arrays: list[tuple[np.ndarray, np.ndarray]]):
+    # The spectra may have different lengths: store them end to end with their offsets.
+    offsets = np.cumsum([0] + [x.shape[0] for x, _ in arrays])
+    x = np.concatenate([x for x, _ in arrays]) if len(arrays) > 0 else np.empty(0)
+    y = np.concatenate([y for _, y in arrays]) if len(arrays) > 0 else np.empty(0)
+    cache.parent.mkdir(parents=True, exist_ok=True)
+    # Write then rename so that a reader never sees a partial file.
+    tmp = cache.with_name(f".{cache.name}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        np.savez(f, stats=stats, x=x, y=y, offsets=offsets)
+    os.replace(tmp, cache)
+
+
+def read_dir(
+    directory: str | Path,
+    pattern: str = "*.txt",
+    name_format: list[str] = NAME_FORMAT,
+    interpolate: bool = True,
+    verbose: bool = False,
+    workers: int | None = None,
+    processes: bool = False,
+    cache: str | Path | None = None,
+    as_batch: bool = False,
+) -> list[Sample] | SpectrumBatch:
+    """
+    Load every file of `directory` matching `pattern`, sorted by name, like `read_txt`.
+
+    Parameters
+    ----------
+    directory : str or pathlib.Path
+        The folder of the .txt files.
+    pattern : str
+        Default is '*.txt'. The glob pattern of the files in `directory`.
+    name_format : list of str, optional
+        The naming scheme of the files, see `read_txt`. Every filename is checked before any file is read.
+    interpolate : bool
+        Default is True. This will pass to the Sample(interpolate).
+    workers : int or None
+        The number of threads (or processes) parsing the files. Default is `os.cpu_count()`.
+    processes : bool
+        Default is False. Parse in a process pool instead of a thread pool.
+    cache : str or pathlib.Path or None
+        A `.npz` file holding the raw spectra of the directory. It is read instead of the files when it is
+        up to date, and (re)written otherwise.
+    as_batch : bool
+        Default is False. Return a `SpectrumBatch` (the spectra must share their Raman Shift) instead of a list of `Sample`.
+
+    Returns
+    -------
+    list of Sample or SpectrumBatch
+    """
+    directory = Path(directory)
+    if directory.is_dir() == False:
+        raise FileNotFoundError(f"Path={directory.as_posix()} is not a directory.")
+    paths = sorted(path for path in directory.glob(pattern) if path.is_file())
+
+    names = [_split_filename(path) for path in paths]
+    mismatch = [path.name for path, values in zip(paths, names) if len(values) != len(name_format)]
+    if len(mismatch) > 0:
+        raise ValueError(
+            f"name_format ({len(name_format)}) is not match {len(mismatch)} filename(s) after split.\nname_format={name_format}.\nfilenames={mismatch}"
+        )
+    attributes = [_parse_filename(values, name_format) for values in names]
+
+    stats = _stats(paths)
+    arrays = None if cache is None else _load_cache(Path(cache), stats)
+    if arrays is None:
+        pool: Executor = (ProcessPoolExecutor if processes else ThreadPoolExecutor)(max_workers=workers or os.cpu_count())
+        with pool:
+            arrays = list(pool.map(_load_raman_from_txt, paths))
+        if cache is not None:
+            _save_cache(Path(cache), stats, arrays)
+
+    samples: list[Sample] = []
+    for path, (x, y), values in zip(paths, arrays, attributes):
+        sample = Sample(x=x, y=y, path=path, interpolate=interpolate, verbose=verbose)
+        for key, value in values.items():
+            sample.__setattr__(key, value)
+        samples.append(sample)
+
+    if as_batch:
+        return SpectrumBatch.from_samples(samples)
+    return samples
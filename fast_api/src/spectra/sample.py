@@ -14,8 +14,8 @@ from pathlib import Path
 import os
 from typing import Self
 from datetime import datetime
-from copy import deepcopy
-from functools import reduce
+from copy import copy
+from .interpolation import SplineOperator
 
 
 class Sample:
@@ -33,6 +33,12 @@ class Sample:
     - (2) `sample1.accumulation` + `sample2.accumulation`
     - (3) `sample1.paths`.union(`sample2.paths`)
 
+    `+`, `*` and `|` return a new `Sample` and leave the operands untouched; `+=`, `*=` and `|=` update the left operand in place.
+    The original data (`_x`, `_y`) is shared by every copy and only copied when `x`/`y` are handed out or
+    modified in place (copy-on-write), so copies cost no more than their new `y`. `x` and `y` are always
+    writable arrays owned by the `Sample` they are read from.
+    The spline used by `at` is built once and kept until `x` or `y` change (reading them counts, as they may be modified in place).
+
 
     Attributes
     ----------
@@ -64,8 +70,6 @@ class Sample:
     """
 
     name: str = "unname"
-    x: NDArray[np.float64]
-    y: NDArray[np.float64]
     paths: set[Path]
     date: datetime
     exposure: int
@@ -77,6 +81,10 @@ class Sample:
     slit: float
 
     _dx: float
+    _spline: CubicSpline | None = None
+    # Whether the current x / y are also held by `_x`/`_y` or another `Sample` (see `copy`).
+    _shared_x: bool = False
+    _shared_y: bool = False
 
     def __init__(
         self,
@@ -98,8 +106,8 @@ class Sample:
             raise ValueError(f"shape mismatch between x={x.shape} and y={y.shape}")
 
         # Original Data that should not be replace so that we can always reset.
-        self._x: NDArray[np.float64] = deepcopy(x)
-        self._y: NDArray[np.float64] = deepcopy(y)
+        self._x: NDArray[np.float64] = np.array(x)
+        self._y: NDArray[np.float64] = np.array(y)
 
         self.paths: set[Path] = set({})
         if path:
@@ -116,36 +124,104 @@ class Sample:
                 self.remove_spike(auto=False, spike_regions=spike_regions)
             self.interpolate(step=1)
 
+    @property
+    def x(self) -> NDArray[np.float64]:
+        # The caller may modify `x` in place: it gets an array of its own.
+        # The copy has the same values, so the spline is kept: assign `x` back after modifying it in place.
+        if self._shared_x:
+            self._current_x = np.array(self._current_x)
+            self._shared_x = False
+        return self._current_x
+
+    @x.setter
+    def x(self, x: NDArray[np.float64]):
+        self._current_x = x
+        self._shared_x = False
+        self._spline = None
+
+    @property
+    def y(self) -> NDArray[np.float64]:
+        # Same as `x`
+        if self._shared_y:
+            self._current_y = np.array(self._current_y)
+            self._shared_y = False
+        return self._current_y
+
+    @y.setter
+    def y(self, y: NDArray[np.float64]):
+        self._current_y = y
+        self._shared_y = False
+        self._spline = None
+
+    @property
+    def spline(self) -> CubicSpline:
+        """
+        The natural `CubicSpline` of (`x`, `y`), cached until `x` or `y` are set or modified by a `Sample` method.
+        """
+        if self._spline is None:
+            self._spline = CubicSpline(self._current_x, self._current_y, bc_type="natural")
+        return self._spline
+
     @property
     def shape(self) -> tuple[int,int]:
         return self.data.shape
 
     @property
     def data(self) -> np.ndarray:
-        return np.hstack([self.x.reshape(-1, 1), self.y.reshape(-1, 1)])
+        return np.hstack([self._current_x.reshape(-1, 1), self._current_y.reshape(-1, 1)])
 
     @property
     def mean(self) -> float:
-        return self.y.mean()
+        return self._current_y.mean()
 
     @property
     def std(self) -> float:
-        return self.y.std()
+        return self._current_y.std()
 
     @property
     def stat(self) -> tuple[float, float, float, float]:
         """
         This return a quadruple of (max, min, mean, std) of the sample.y
         """
-        return (self.y.max(), self.y.min(), self.mean, self.std)
+        return (self._current_y.max(), self._current_y.min(), self.mean, self.std)
 
     def reset_data(self):
         """
         Use to set/reset the data (`x` and `y`) with the original data.
+        The original arrays are shared until `x`/`y` are read or modified in place.
+        """
+        self._current_x, self._current_y = self._x, self._y
+        self._shared_x = self._shared_y = True
+        self._spline = None
+        self._dx: float = np.diff(self._x).mean()  # type: ignore
+
+    def _writable_y(self) -> NDArray[np.float64]:
+        # Copy-on-write: `y` may be the original or shared with another `Sample`.
+        # The caller modifies `y` in place, so the spline is dropped either way.
+        if self._shared_y or self._current_y.flags.writeable == False:
+            self._current_y = np.array(self._current_y)
+            self._shared_y = False
+        self._spline = None
+        return self._current_y
+
+    def copy(self) -> Self:
         """
-        self.x = deepcopy(self._x)  # type: ignore
-        self.y = deepcopy(self._y)  # type: ignore
-        self._dx: float = np.diff(self.x).mean()  # type: ignore
+        A new `Sample` sharing the arrays (and spline) of this one. Both copy them before handing them out
+        or modifying them in place.
+        """
+        new_sample = copy(self)
+        new_sample.paths = set(self.paths)
+        self._shared_x = self._shared_y = True
+        new_sample._shared_x = new_sample._shared_y = True
+        return new_sample
+
+    def _operate(self, inplace, b) -> Self:
+        # `inplace` gives the copy a `y` of its own, so this `Sample` does not share its `y` afterwards.
+        shared_y = self._shared_y
+        try:
+            return inplace(self.copy(), b)
+        finally:
+            self._shared_y = shared_y
 
     def at(self, shift: float | list[float]) -> np.ndarray:
         """
@@ -162,10 +238,7 @@ class Sample:
             shape of (n_samples, ) of the intensity you look up for.
         """
 
-        # if(  hasattr(self, "_y_interp") == False ):
-        #     raise AttributeError(f"The Sample should perform .interpolate first before you can use this method.")
-        y_interp = CubicSpline(self.x, self.y, bc_type="natural")
-        return y_interp(shift)
+        return self.spline(shift)
 
     # def find_spike(self, height:float=None, width:float=None, verbose:bool=False) -> list[np.ndarray]:
     def find_spike(
@@ -193,11 +266,11 @@ class Sample:
         if isinstance(width, type(None)):
             width = int(10 / self._dx)
 
-        # peak_idxes, _ = find_peaks(self.y, height=height)
-        peak_idxes, _ = find_peaks(self.y, prominence=prominence)
+        # peak_idxes, _ = find_peaks(self._current_y, height=height)
+        peak_idxes, _ = find_peaks(self._current_y, prominence=prominence)
         if verbose:
             print(f"Found {peak_idxes.shape[0]} peaks.")
-        widths, _, lefts, rights = peak_widths(self.y, peak_idxes)
+        widths, _, lefts, rights = peak_widths(self._current_y, peak_idxes)
         is_spikes = widths < width
         if verbose:
             print(
@@ -254,9 +327,9 @@ class Sample:
             interpolate_window = np.concat([left, right])
             # correct the signal with interp1d
             corrector = interp1d(
-                interpolate_window, self.y[interpolate_window], kind="linear"
+                interpolate_window, self._current_y[interpolate_window], kind="linear"
             )
-            self.y[spike_region] = corrector(spike_region)
+            self._writable_y()[spike_region] = corrector(spike_region)
 
     def despike(self, window_length: str | int = "auto", threshold: int = 3):
         """
@@ -276,22 +349,22 @@ class Sample:
                     f"window_length should be 'auto' or integer. Got {window_length=}"
                 )
             window_length = int(5 / self._dx)
-        self.y = despiking(self.x, self.y, neigh=window_length, threshold=threshold)
+        self.y = despiking(self._current_x, self._current_y, neigh=window_length, threshold=threshold)
 
     def interpolate(self, step: float):
         """
-        Use to interpolate with `scipy.interpolate.CubicSpline` the signal.
+        Use to interpolate the signal with a natural cubic spline.
+        The `SplineOperator` of (`x`, new grid) is shared by every `Sample` on the same Raman Shift.
 
         Parameters
         ----------
         step : float
             The resolution of the interpolated signal.
         """
-        minx = np.floor(self.x.min())
-        maxx = np.ceil(self.x.max())
+        minx = np.floor(self._current_x.min())
+        maxx = np.ceil(self._current_x.max())
         new_x = np.arange(minx, maxx + step, step=step)
-        y_interp = CubicSpline(self.x, self.y, bc_type="natural")
-        self.y = y_interp(new_x)
+        self.y = SplineOperator.for_axis(self._current_x, new_x)(self._current_y)
         self.x = new_x
         self._dx = step
 
@@ -306,9 +379,9 @@ class Sample:
             'zscore' will use Z-Score  method to scale Sample.y to mean=0 std=1
         """
         if method == "minmax":
-            self.y = (self.y - self.y.min()) / (self.y.max() - self.y.min())
+            self.y = (self._current_y - self._current_y.min()) / (self._current_y.max() - self._current_y.min())
         elif method == "zscore":
-            self.y = (self.y - self.mean) / self.std
+            self.y = (self._current_y - self.mean) / self.std
         else:
             raise ValueError(
                 f"method={method} is not supported. Use 'minmax' or 'zscore'. "
@@ -339,29 +412,26 @@ class Sample:
                 )
             window_length = int(30 / self._dx)
 
-        y = deepcopy(self.y)
-        y = savgol_filter(x=y, window_length=window_length, polyorder=polyorder)
+        y = savgol_filter(x=self._current_y, window_length=window_length, polyorder=polyorder)
         if test == False:
             self.y = y
         return y
 
     def butter_lowpass_filter(self, normal_cutoff:float, order:int=1):
         
-        y = deepcopy(self.y)
         # normal_cutoff = cutoff / (fs * 0.5)
         # Get the filter coefficients 
         b, a = butter(order, normal_cutoff, btype='low', analog=False)
-        y = filtfilt(b, a, y)
+        y = filtfilt(b, a, self._current_y)
         self.y = y
         return y
     
     def butter_highpass_filter(self, normal_cutoff:float, order:int=1):
         
-        y = deepcopy(self.y)
         # normal_cutoff = cutoff / (fs * 0.5)
         # Get the filter coefficients 
         b, a = butter(order, normal_cutoff, btype='high', analog=False)
-        y = filtfilt(b, a, y)
+        y = filtfilt(b, a, self._current_y)
         self.y = y
         return y
 
@@ -385,9 +455,9 @@ class Sample:
         if order < 1:
             raise ValueError(f"order must be greater than 0. Got {order=}")
         if roi is None:
-            roi = self.x
+            roi = self._current_x
 
-        y = rbaseline(self.x, self.y, method="poly", order=order, roi=roi)
+        y = rbaseline(self._current_x, self._current_y, method="poly", order=order, roi=roi)
         if test == False:
             self.y = y
         return y
@@ -403,10 +473,10 @@ class Sample:
         high : float
             End of the Raman Shift to extract
         """
-        cond1 = self.x >= low
-        cond2 = self.x <= high
-        self.x = self.x[cond1 & cond2]
-        self.y = self.y[cond1 & cond2]
+        cond1 = self._current_x >= low
+        cond2 = self._current_x <= high
+        self.x = self._current_x[cond1 & cond2]
+        self.y = self._current_y[cond1 & cond2]
 
     def is_same_range(self, sample: Self) -> bool:
         """
@@ -422,8 +492,8 @@ class Sample:
             raise TypeError(
                 f"sample must be type={type(self)}. sample is type={type(sample)}"
             )
-        a = self.x
-        b = sample.x
+        a = self._current_x
+        b = sample._current_x
 
         if a.shape != b.shape:
             return False
@@ -434,10 +504,13 @@ class Sample:
         return self.__add__(b)
 
     def __add__(self, b: Self) -> Self:
+        return self._operate(Sample.__iadd__, b)
+
+    def __iadd__(self, b: Self) -> Self:
         if isinstance(b, int):
-            new_sample = deepcopy(self)
-            new_sample.y += b
-            return new_sample
+            y = self._writable_y()
+            y += b
+            return self
 
         if isinstance(b, Sample) == False:
             raise TypeError(
@@ -447,20 +520,23 @@ class Sample:
         if self.is_same_range(b) == False:
             raise ValueError(f"Expect both a + b to have the same Raman Shift range.")
 
-        new_sample = deepcopy(self)
-        new_sample.y += b.y
-        new_sample.exposure += b.exposure
-        new_sample.paths = new_sample.paths.union(b.paths)
-        return new_sample
+        y = self._writable_y()
+        y += b._current_y
+        self.exposure += b.exposure
+        self.paths = self.paths.union(b.paths)
+        return self
 
     def __rmul__(self, b: float) -> Self:
         return self.__mul__(b)
 
     def __mul__(self, b: float) -> Self:
+        return self._operate(Sample.__imul__, b)
+
+    def __imul__(self, b: float) -> Self:
         if isinstance(b, float):
-            new_sample = deepcopy(self)
-            new_sample.y *= b
-            return new_sample
+            y = self._writable_y()
+            y *= b
+            return self
         else:
             raise TypeError(f"Expect a * b to be type={float}. b is type={type(b)}")
 
@@ -468,6 +544,9 @@ class Sample:
         return self.__or__(b)
 
     def __or__(self, b: Self) -> Self:
+        return self._operate(Sample.__ior__, b)
+
+    def __ior__(self, b: Self) -> Self:
         if isinstance(b, Sample) == False:
             raise TypeError(
                 f"Expect a | b to be type={type(self)}. b is type={type(b)}"
@@ -479,15 +558,17 @@ class Sample:
         if self.exposure != b.exposure:
             raise ValueError(f"Expect both a | b to have the same exposure.")
 
-        new_sample = deepcopy(self)
         acc1 = self.accumulation
         acc2 = b.accumulation
-        y1 = acc1 * self.y
-        y2 = acc2 * b.y
-        new_sample.y = (y1 + y2) / (acc1 + acc2)
-        new_sample.accumulation = acc1 + acc2
-        new_sample.paths = new_sample.paths.union(b.paths)
-        return new_sample
+        if np.issubdtype(self._current_y.dtype, np.floating) == False:
+            self.y = self._current_y.astype(np.float64)
+        y = self._writable_y()
+        y *= acc1
+        y += acc2 * b._current_y
+        y /= acc1 + acc2
+        self.accumulation = acc1 + acc2
+        self.paths = self.paths.union(b.paths)
+        return self
 
     def save(self, path: Path | None = None, basepath: Path = Path()):
         if basepath.exists() == False:
@@ -508,7 +589,7 @@ class Sample:
     def plot(self, label: str | None = None, color=None):
         if label is None:
             label = self.name
-        plt.plot(self.x, self.y, label=label, alpha=0.8, linewidth=0.8, color=color)  # type: ignore
+        plt.plot(self._current_x, self._current_y, label=label, alpha=0.8, linewidth=0.8, color=color)  # type: ignore
 
     def __getitem__(self, idx):
         return self.data[idx]
@@ -540,29 +621,70 @@ class Sample:
 ##########################################
 
 
+# The default naming scheme of the Horiba LS6 exports.
+NAME_FORMAT: list[str] = [
+    "name",
+    "lens",
+    "power",
+    "grating",
+    "laser",
+    "exposure",
+    "accumulation",
+    "year",
+    "month",
+    "date",
+    "hour",
+    "minute",
+    "second",
+    "01",
+]
+
+
+def _readonly(array: np.ndarray, copy: bool = True) -> np.ndarray:
+    # A read-only copy, or a read-only view (the viewed array stays writable for its other owners).
+    array = np.array(array) if copy else array.view()
+    array.flags.writeable = False
+    return array
+
+
 def _load_raman_from_txt(path: Path) -> tuple[np.ndarray, np.ndarray]:
-    measure: np.ndarray = np.flip(np.genfromtxt(path), axis=0)
-    return deepcopy(measure[:, 0]), deepcopy(measure[:, 1])
+    # `np.loadtxt` parses in C; the flipped columns are views, `Sample` copies them once.
+    measure: np.ndarray = np.flip(np.loadtxt(path, ndmin=2), axis=0)
+    return measure[:, 0], measure[:, 1]
+
+
+def _split_filename(path: Path) -> list[str]:
+    # 24_600_785 nm_60 s_1_2024_03_19_10_30_09_01
+    # 24_5x_0-71_600_785 nm_60 s_1_2024_03_19_10_30_09_01
+    return os.path.splitext(path.name)[0].split("_")
+
+
+def _parse_filename(values: list[str], name_format: list[str]) -> dict:
+    """
+    The `Sample` attributes named by `name_format`, and 'date' from the year..second values.
+    """
+    attributes: dict = {}
+    datetime_str: list[str] = []
+    for key, value in zip(name_format, values):
+        if key in ["year", "month", "date", "hour", "minute", "second"]:
+            datetime_str.append(value)
+        else:
+            if key in ["exposure"]:
+                value = int(value.split(" ")[0])  # type: ignore
+            elif key in ["power"]:
+                value = float(value.replace("-", "."))  # type: ignore
+            elif key in ["accumulation"]:
+                value = int(value)  # type: ignore
+            elif key == "01":
+                continue
+            attributes[key] = value
+    attributes["date"] = datetime.strptime("".join(datetime_str), "%Y%m%d%H%M%S")
+    return attributes
 
 
 def read_txt(
     path: str | Path,
-    name_format: list[str] = [
-        "name",
-        "lens",
-        "power",
-        "grating",
-        "laser",
-        "exposure",
-        "accumulation",
-        "year",
-        "month",
-        "date",
-        "hour",
-        "minute",
-        "second",
-        "01",
-    ],
+    name_format: list[str] = NAME_FORMAT,
     interpolate: bool = True,
     verbose: bool = False,
 ) -> Sample:
@@ -593,10 +715,7 @@ def read_txt(
     if path.exists() == False:  # type: ignore
         raise FileNotFoundError(f"Path={path.as_posix()} is not exist.")  # type: ignore
 
-    # 24_600_785 nm_60 s_1_2024_03_19_10_30_09_01
-    # 24_5x_0-71_600_785 nm_60 s_1_2024_03_19_10_30_09_01
-    filename: str = os.path.splitext(path.name)[0]  # type: ignore
-    values: list[str] = filename.split("_")
+    values: list[str] = _split_filename(path)  # type: ignore
     if len(values) != len(name_format):
         raise ValueError(
             f"name_format ({len(name_format)}) is not match the filename ({len(values)}) after split.\nname_format={name_format}.\nfilename={values}"
@@ -605,31 +724,40 @@ def read_txt(
     x, y = _load_raman_from_txt(path=path)  # type: ignore
 
     sample = Sample(x=x, y=y, path=path, interpolate=interpolate, verbose=verbose)
-
-    datetime_str: list[str] = []
-    for key, value in zip(name_format, values):
-        if key in ["year", "month", "date", "hour", "minute", "second"]:
-            datetime_str.append(value)
-        else:
-            if key in ["exposure"]:
-                value = int(value.split(" ")[0])  # type: ignore
-            elif key in ["power"]:
-                value = float(value.replace("-", "."))  # type: ignore
-            elif key in ["accumulation"]:
-                value = int(value)  # type: ignore
-            elif key == "01":
-                continue
-            sample.__setattr__(key, value)
-    sample.__setattr__("date", datetime.strptime("".join(datetime_str), "%Y%m%d%H%M%S"))
+    for key, value in _parse_filename(values, name_format).items():
+        sample.__setattr__(key, value)
     return sample
 
 
 def accumulate(samples: list[Sample]) -> Sample:
+    """
+    Same as `samples[0] | samples[1] | ...`: the mean of the `y` weighted by `accumulation`,
+    computed with one matrix-vector product instead of N-1 intermediate `Sample`.
+    """
     if isinstance(samples, list) == False:
         raise TypeError(f"Method expect list[Sample] but got {type(samples)}")
+    if len(samples) == 0:
+        raise ValueError(f"Method expect at least one Sample.")
     if len(samples) == 1:
         return samples[0]
-    return reduce(lambda a, b: a | b, samples)
+    first = samples[0]
+    for b in samples[1:]:
+        if isinstance(b, Sample) == False:
+            raise TypeError(f"Expect a | b to be type={type(first)}. b is type={type(b)}")
+        if first.is_same_range(b) == False:
+            raise ValueError(f"Expect both a | b to have the same Raman Shift range.")
+        if first.exposure != b.exposure:
+            raise ValueError(f"Expect both a | b to have the same exposure.")
+
+    weights = np.array([sample.accumulation for sample in samples], dtype=np.float64)
+    Y = np.empty((len(samples), first._current_y.shape[0]), dtype=np.result_type(first._current_y, np.float64))
+    for i, sample in enumerate(samples):
+        Y[i] = sample._current_y
+    new_sample = first.copy()
+    new_sample.y = (weights @ Y) / weights.sum()
+    new_sample.accumulation = sum(sample.accumulation for sample in samples)
+    new_sample.paths = set().union(*(sample.paths for sample in samples))
+    return new_sample
 
 
 # if __name__ == '__main__':
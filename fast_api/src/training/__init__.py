@@ -0,0 +1 @@
+from .train import MODELS, build_features, cross_validate, export, interpolate_targets, load_dataset, select_axis
@@ -0,0 +1,315 @@
+"""
+Offline training of the glucose models over `raman.optofiles`.
+
+    uv run python -m src.training.train --out artifacts --workers 8
+    MODEL_DIR=artifacts/<version> uv run fastapi run src/main.py
+
+Steps (same preprocessing, PCA and regressors as `notebook/1-analysis.ipynb`):
+1. `fetch_matrix` the `baseline_subtracted` spectra and the glucose targets.
+2. Preprocess them with `CompiledPipeline` in a process pool, skipping the spectra already in the `FeatureCache`.
+3. Leave-one-subject-out cross-validation of every model, folds run in parallel.
+4. Fit every model on the whole dataset and export `<name>`, `<name>_pca`, `ramanshift` (the layout read by
+   `src.inference.ModelRegistry`) with a `manifest.json` in `<out>/<version>/`.
+
+`ramanshift` is the axis of the deployed device (`--raman-shift`, required when the spectra are on several axes).
+The spectra of the other axes are interpolated onto the same features by their own pipeline.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import pickle
+import platform
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable
+import numpy as np
+from src.db import SpectraMatrix, fetch_matrix
+from src.spectra import CompiledPipeline, FeatureCache, feature_cache
+
+_ARTIFACT_DIR: str = os.environ.get("TRAINING_ARTIFACT_DIR", "artifacts")
+_N_COMPONENTS: int = 25
+_CHUNK_SIZE: int = 64
+
+
+def _mlp():
+    from sklearn.neural_network import MLPRegressor
+    return MLPRegressor(solver='adam', learning_rate='adaptive', max_iter=100000, hidden_layer_sizes=100, activation='identity')
+
+
+def _grid_search_random_forest():
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.model_selection import GridSearchCV
+    param_grid = {
+        'n_estimators': [50, 100, 200],
+        'max_depth': [None, 10, 20],
+        'min_samples_split': [2, 5, 10]
+    }
+    return GridSearchCV(estimator=RandomForestRegressor(random_state=42), param_grid=param_grid, cv=5,
+                        scoring='neg_mean_squared_error')
+
+
+def _sklearn(module: str, name: str, **kwargs):
+    import importlib
+    return getattr(importlib.import_module(module), name)(**kwargs)
+
+
+# name -> factory of an unfitted regressor. The names are the ones of `models/`.
+MODELS: dict[str, Callable[[], Any]] = {
+    "LinearRegression": partial(_sklearn, "sklearn.linear_model", "LinearRegression"),
+    "RandomForestRegressor": partial(_sklearn, "sklearn.ensemble", "RandomForestRegressor"),
+    "GradientBoostingRegressor": partial(_sklearn, "sklearn.ensemble", "GradientBoostingRegressor"),
+    "AdaBoostRegressor": partial(_sklearn, "sklearn.ensemble", "AdaBoostRegressor"),
+    "MLPRegressor": _mlp,
+    "GridSearch-RandomForestRegressor": _grid_search_random_forest,
+}
+
+
+def interpolate_targets(subject_ids: np.ndarray, glucose: np.ndarray) -> np.ndarray:
+    """
+    Fill the glucose between finger pricks per subject, like the notebook
+    (`pandas.Series.interpolate(method='polynomial', order=2)`, rows sorted by created).
+    """
+    import pandas as pd
+    glucose = np.asarray(glucose, dtype=np.float64)
+    target = np.full(glucose.shape, np.nan)
+    for subject_id in np.unique(subject_ids):
+        rows = np.flatnonzero(subject_ids == subject_id)
+        if np.count_nonzero(~np.isnan(glucose[rows])) > 2:
+            target[rows] = pd.Series(glucose[rows]).interpolate(method='polynomial', order=2).to_numpy()
+    return target
+
+
+def _preprocess(raman_shift: np.ndarray, Y: np.ndarray, params: dict) -> np.ndarray:
+    # Runs in a worker process: the pipeline is compiled once per process and axis.
+    return CompiledPipeline.for_axis(raman_shift, **params)(Y)
+
+
+def build_features(matrix: SpectraMatrix, params: dict = {}, workers: int | None = None,
+                   cache: FeatureCache | None = feature_cache, chunk_size: int = _CHUNK_SIZE) -> np.ndarray:
+    """
+    Preprocess every spectrum of `matrix` (see `CompiledPipeline`) in a process pool.
+
+    Spectra found in `cache` are not preprocessed again, the others are added to it.
+    Returns an NDArray of shape (n_samples, n_features).
+    """
+    features: np.ndarray | None = None
+    jobs: list[tuple[np.ndarray, np.ndarray]] = []
+    keys: dict[int, str] = {}
+    for index, axis in enumerate(matrix.axes):
+        rows = np.flatnonzero(matrix.axis_index == index)
+        if cache is not None:
+            pipeline = CompiledPipeline.for_axis(axis, **params)
+            row_keys, cached, missing = cache.lookup(pipeline, matrix.X[rows])
+            if cached is not None:
+                if features is None:
+                    features = np.empty((len(matrix), cached.shape[1]), dtype=np.float64)
+                hit = np.setdiff1d(np.arange(len(rows)), missing)
+                features[rows[hit]] = cached[hit]
+            keys.update((int(rows[i]), row_keys[i]) for i in missing)
+            rows = rows[missing]
+        jobs += [(axis, rows[i:i + chunk_size]) for i in range(0, len(rows), chunk_size)]
+
+    if len(jobs) > 0:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(_preprocess, [axis for axis, _ in jobs], [matrix.X[rows] for _, rows in jobs],
+                                   [params] * len(jobs))
+            for (_, rows), Z in zip(jobs, results):
+                if features is None:
+                    features = np.empty((len(matrix), Z.shape[1]), dtype=np.float64)
+                features[rows] = Z
+                if cache is not None:
+                    for row, z in zip(rows, Z):
+                        cache.put(keys[int(row)], z)
+    if features is None:
+        features = np.empty((0, 0), dtype=np.float64)
+    return features
+
+
+def select_axis(matrix: SpectraMatrix, raman_shift: np.ndarray | None = None, params: dict = {}) -> np.ndarray:
+    """
+    The Raman Shift axis to export: `raman_shift` (the deployed device's) or the only axis of `matrix`.
+
+    Raises
+    ------
+    ValueError :
+        When `raman_shift` is None and `matrix` has several axes, or when the features of an axis of `matrix`
+        are not on the same Raman Shift as the ones of the exported axis (e.g. it does not cover `output_range`).
+    """
+    if raman_shift is None:
+        if len(matrix.axes) != 1:
+            raise ValueError(f"Samples are on {len(matrix.axes)} Raman Shift axes. "
+                             "Pass the axis of the deployed device (e.g. --raman-shift models/ramanshift).")
+        raman_shift = matrix.axes[0]
+    raman_shift = np.asarray(raman_shift, dtype=np.float64)
+    expected = CompiledPipeline.for_axis(raman_shift, **params).x
+    for index, axis in enumerate(matrix.axes):
+        x = CompiledPipeline.for_axis(axis, **params).x
+        if x.shape != expected.shape or np.any(x != expected):
+            n_samples = int(np.count_nonzero(matrix.axis_index == index))
+            raise ValueError(f"{n_samples} samples are on a Raman Shift axis ({axis.min():.1f}-{axis.max():.1f}) "
+                             f"whose features ({x.shape[0]}) do not match the exported axis ({expected.shape[0]}). "
+                             "Exclude their subjects (--subjects).")
+    return raman_shift
+
+
+def _fit(name: str, X: np.ndarray, y: np.ndarray, n_components: int) -> tuple[Any, Any]:
+    from sklearn.decomposition import PCA
+    pca = PCA(n_components=n_components)
+    model = MODELS[name]().fit(pca.fit_transform(X), y)
+    if hasattr(model, "best_estimator_"):
+        model = model.best_estimator_
+    return model, pca
+
+
+def _fold(name: str, X: np.ndarray, y: np.ndarray, train: np.ndarray, test: np.ndarray, n_components: int) -> np.ndarray:
+    model, pca = _fit(name, X[train], y[train], n_components)
+    return model.predict(pca.transform(X[test]))
+
+
+def _metrics(y: np.ndarray, y_hat: np.ndarray) -> dict[str, float]:
+    error = y_hat - y
+    ss_tot = np.sum((y - y.mean()) ** 2)
+    return {
+        "rmse": float(np.sqrt(np.mean(error ** 2))),
+        "mae": float(np.mean(np.abs(error))),
+        "r2": float(1 - np.sum(error ** 2) / ss_tot) if ss_tot > 0 else float("nan"),
+    }
+
+
+def cross_validate(X: np.ndarray, y: np.ndarray, groups: np.ndarray, names: list[str],
+                   n_components: int = _N_COMPONENTS, workers: int | None = None) -> dict[str, dict]:
+    """
+    Leave-one-subject-out cross-validation. Every (model, held-out subject) fold runs as one job.
+
+    Returns
+    -------
+    dict of {name: {"overall": metrics, "subjects": {subject_id: metrics}, "predictions": list}}
+        Metrics are rmse, mae and r2 of the out-of-fold predictions.
+    """
+    from joblib import Parallel, delayed
+    subjects = np.unique(groups)
+    folds = [(np.flatnonzero(groups != subject), np.flatnonzero(groups == subject)) for subject in subjects]
+    jobs = [(name, train, test) for name in names for train, test in folds]
+    predictions = Parallel(n_jobs=workers or -1)(
+        delayed(_fold)(name, X, y, train, test, n_components) for name, train, test in jobs
+    )
+    results: dict[str, dict] = {}
+    for name in names:
+        y_hat = np.empty(y.shape, dtype=np.float64)
+        per_subject = {}
+        for (job_name, _, test), pred in zip(jobs, predictions):
+            if job_name != name:
+                continue
+            y_hat[test] = pred
+            per_subject[str(groups[test[0]])] = _metrics(y[test], pred)
+        results[name] = {"overall": _metrics(y, y_hat), "subjects": per_subject, "predictions": y_hat.tolist()}
+    return results
+
+
+def export(out_dir: Path | str, X: np.ndarray, y: np.ndarray, raman_shift: np.ndarray, names: list[str],
+           manifest: dict, n_components: int = _N_COMPONENTS, version: str | None = None) -> Path:
+    """
+    Fit every model on (X, y) and write the artifacts and `manifest.json` to `out_dir/<version>/`.
+    """
+    import sklearn
+    digest = hashlib.sha1(X.tobytes() + y.tobytes()).hexdigest()[:8]
+    version = version or f"{datetime.now():%Y%m%d-%H%M%S}-{digest}"
+    path = Path(out_dir) / version
+    path.mkdir(parents=True, exist_ok=False)
+    models: dict[str, dict] = {}
+    for name in names:
+        model, pca = _fit(name, X, y, n_components)
+        with open(path / name, "wb") as f:
+            pickle.dump(model, f)
+        with open(path / f"{name}_pca", "wb") as f:
+            pickle.dump(pca, f)
+        models[name] = {"params": {k: repr(v) for k, v in model.get_params().items()}}
+    with open(path / "ramanshift", "wb") as f:
+        pickle.dump(np.asarray(raman_shift, dtype=np.float64), f)
+
+    manifest = {
+        "version": version,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "n_samples": int(X.shape[0]),
+        "n_features": int(X.shape[1]),
+        "n_components": n_components,
+        "dataset_sha1": digest,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "sklearn": sklearn.__version__,
+        **manifest,
+    }
+    for name, entry in manifest.get("models", {}).items():
+        models.setdefault(name, {}).update(entry)
+    manifest["models"] = models
+    with open(path / "manifest.json", "w") as f:
+        json.dump(manifest, f, indent=2, default=str)
+    return path
+
+
+async def load_dataset(subject_ids: list[str] | None = None) -> tuple[SpectraMatrix, np.ndarray]:
+    """
+    The spectra of `subject_ids` (all by default) that have a glucose target, and that target.
+    """
+    matrix = await fetch_matrix("baseline_subtracted", fields=["subject_id", "created", "glucose_target"], subject_ids=subject_ids)
+    glucose = np.array([np.nan if v is None else v for v in matrix.meta["glucose_target"]], dtype=np.float64)
+    y = interpolate_targets(matrix.meta["subject_id"], glucose)
+    keep = ~np.isnan(y)
+    matrix = SpectraMatrix(X=matrix.X[keep], meta={k: v[keep] for k, v in matrix.meta.items()},
+                           axes=matrix.axes, axis_index=matrix.axis_index[keep])
+    return matrix, y[keep]
+
+
+def main(args: argparse.Namespace) -> Path:
+    start = time.perf_counter()
+    matrix, y = asyncio.run(load_dataset(args.subjects))
+    groups = matrix.meta["subject_id"]
+    print(f"{len(matrix)} spectra of {len(np.unique(groups))} subjects | {time.perf_counter() - start:.1f} s", file=sys.stderr)
+
+    params: dict = {}
+    raman_shift: np.ndarray | None = None
+    if args.raman_shift is not None:
+        with open(args.raman_shift, "rb") as f:
+            raman_shift = pickle.load(f)
+    raman_shift = select_axis(matrix, raman_shift, params=params)
+    pipeline = CompiledPipeline.for_axis(raman_shift, **params)
+    cache = FeatureCache(args.cache_dir) if args.cache_dir is not None else feature_cache
+    X = build_features(matrix, params=params, workers=args.workers, cache=cache)
+    print(f"features {X.shape} ({cache.hits} cached) | {time.perf_counter() - start:.1f} s", file=sys.stderr)
+
+    results = cross_validate(X, y, groups, args.models, n_components=args.n_components, workers=args.workers)
+    for name, result in results.items():
+        overall = result["overall"]
+        print(f"{name:<34} rmse={overall['rmse']:.2f} mae={overall['mae']:.2f} r2={overall['r2']:.3f}", file=sys.stderr)
+    print(f"cross-validation | {time.perf_counter() - start:.1f} s", file=sys.stderr)
+
+    manifest = {
+        "subjects": sorted(str(s) for s in np.unique(groups)),
+        "target": "glucose_target interpolated per subject (polynomial, order 2)",
+        "preprocessing": pipeline.params,
+        "raman_shift_axes": len(matrix.axes),
+        "cross_validation": "leave-one-subject-out",
+        "models": {name: {"cv": {k: v for k, v in result.items() if k != "predictions"}} for name, result in results.items()},
+    }
+    path = export(args.out, X, y, pipeline.raman_shift, args.models, manifest, n_components=args.n_components)
+    print(f"exported to {path} | {time.perf_counter() - start:.1f} s")
+    return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog="python -m src.training.train", description="Train and export the glucose models.")
+    parser.add_argument("--subjects", nargs="+", default=None, help="Subject IDs. Default: all.")
+    parser.add_argument("--models", nargs="+", choices=list(MODELS), default=list(MODELS))
+    parser.add_argument("--n-components", type=int, default=_N_COMPONENTS)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--raman-shift", type=Path, default=None,
+                        help="Pickled Raman Shift axis of the deployed device (e.g. models/ramanshift). Default: the axis of the spectra.")
+    parser.add_argument("--cache-dir", type=Path, default=None, help="Feature cache. Default: FEATURE_CACHE_DIR.")
+    parser.add_argument("--out", type=Path, default=Path(_ARTIFACT_DIR))
+    main(parser.parse_args())
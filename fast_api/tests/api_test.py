@@ -0,0 +1,186 @@
+import unittest
+import asyncio
+import json
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+import httpx
+from src.api import Code, GlucoseRecord, TelehealthClient
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps the connections alive
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        server: StubServer = self.server  # type: ignore
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with server.lock:
+            server.requests.append((self.path, dict(self.headers), body))
+            server.connections.add(self.client_address)
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            status = server.statuses.pop(0) if len(server.statuses) > 0 else 200
+        time.sleep(server.delay)
+        with server.lock:
+            server.in_flight -= 1
+        data = json.dumps({"ok": status == 200, "echo": body}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.lock = threading.Lock()
+        self.requests: list = []
+        self.connections: set = set()
+        self.statuses: list[int] = []
+        self.delay = 0.0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def handle_error(self, request, client_address):
+        # The client gave up (timeout test)
+        pass
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/api/v1/"
+
+
+class TestTelehealthClient(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubServer()
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+        self.thread.start()
+        self.client = TelehealthClient(base_url=self.server.url, api_key="key", timeout=2, retries=2, backoff=0.01,
+                                       max_connections=4, concurrency=4)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def run_client(self, coroutine):
+        async def main():
+            try:
+                return await coroutine
+            finally:
+                await self.client.close()
+        return asyncio.run(main())
+
+    def test_requests(self):
+        created = datetime(2025, 9, 15, 9, 14, 8)
+        self.run_client(self.client.post_glucose(7, Code.PRE_LUNCH, 101.5, created))
+        self.run_client(self.client.fetch_by_user_id(7, created, datetime(2025, 9, 16)))
+        (path, headers, body), (path2, _, body2) = self.server.requests
+        self.assertEqual(path, "/api/v1/diabetesrecords")
+        self.assertEqual(headers["x-api-key"], "key")
+        self.assertEqual(body, {"PatientID": 7, "Code": 60, "Value": 101.5, "RecordDT": "2025-09-15 09:14:08"})
+        self.assertEqual(path2, "/api/v1/get_blood_sugar")
+        self.assertEqual(body2, {"patient_id": 7, "date_time_start": "2025-09-15", "date_time_end": "2025-09-16"})
+
+    def test_retry(self):
+        self.server.statuses = [503, 502]
+        response = self.run_client(self.client.post("get_blood_sugar", {"a": 1}, idempotent=True))
+        self.assertEqual(response["echo"], {"a": 1})
+        self.assertEqual(len(self.server.requests), 3)
+
+        # A write is only retried when the server did not process it
+        self.server.requests.clear()
+        self.server.statuses = [429, 503]
+        self.run_client(self.client.post("diabetesrecords", {"a": 1}))
+        self.assertEqual(len(self.server.requests), 3)
+        self.server.requests.clear()
+        self.server.statuses = [502]
+        with self.assertRaises(httpx.HTTPStatusError):
+            self.run_client(self.client.post("diabetesrecords", {"a": 1}))
+        self.assertEqual(len(self.server.requests), 1)
+
+        self.server.statuses = [503, 503, 503]
+        with self.assertRaises(httpx.HTTPStatusError):
+            self.run_client(self.client.post("diabetesrecords", {"a": 1}))
+        # Not retried
+        self.server.requests.clear()
+        self.server.statuses = [400]
+        with self.assertRaises(httpx.HTTPStatusError):
+            self.run_client(self.client.post("diabetesrecords", {"a": 1}))
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_timeout(self):
+        self.server.delay = 0.5
+        client = TelehealthClient(base_url=self.server.url, timeout=0.1, retries=1, backoff=0.01)
+        self.client = client
+        with self.assertRaises(httpx.TimeoutException):
+            self.run_client(client.fetch_by_user_id(7, datetime(2025, 9, 15), datetime(2025, 9, 16)))
+        self.assertEqual(len(self.server.requests), 2)
+        # The record may have been written: not sent again
+        self.server.requests.clear()
+        with self.assertRaises(httpx.ReadTimeout):
+            self.run_client(client.post("diabetesrecords", {}))
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_connect_error(self):
+        # Never sent: a write is retried
+        with patch.object(httpx.AsyncClient, "post", side_effect=httpx.ConnectError("refused")) as post:
+            with self.assertRaises(httpx.ConnectError):
+                self.run_client(self.client.post("diabetesrecords", {}))
+        self.assertEqual(post.call_count, 3)
+
+    def test_loop_change(self):
+        other = asyncio.new_event_loop()
+        thread = threading.Thread(target=other.run_forever, daemon=True)
+        thread.start()
+
+        async def session():
+            return self.client.session
+
+        try:
+            old = asyncio.run_coroutine_threadsafe(session(), other).result(timeout=2)
+            new = self.run_client(self.client.fetch_by_user_id(7, datetime(2025, 9, 15), datetime(2025, 9, 16)))
+            self.assertEqual(new["echo"]["patient_id"], 7)
+            # The session of the other loop is closed in that loop
+            deadline = time.monotonic() + 2
+            while old.is_closed == False and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertTrue(old.is_closed)
+        finally:
+            other.call_soon_threadsafe(other.stop)
+            thread.join()
+            other.close()
+
+    def test_post_glucose_many(self):
+        self.server.delay = 0.05
+        records = [GlucoseRecord(i, Code.POST_SUPPER, 100 + i, datetime(2025, 9, 15, 9, i)) for i in range(20)]
+        self.server.statuses = [400]
+        start = time.perf_counter()
+        results = self.run_client(self.client.post_glucose_many(records))
+        elapsed = time.perf_counter() - start
+        self.assertEqual(len(results), 20)
+        self.assertEqual(sum(isinstance(result, httpx.HTTPStatusError) for result in results), 1)
+        values = sorted(result["echo"]["Value"] for result in results if isinstance(result, dict))
+        self.assertEqual(len(values), 19)
+        # Concurrent under the cap, on pooled keep-alive connections
+        self.assertLessEqual(self.server.max_in_flight, 4)
+        self.assertGreater(self.server.max_in_flight, 1)
+        self.assertLess(elapsed, 20 * 0.05)
+        self.assertLessEqual(len(self.server.connections), 4)
+
+        self.server.max_in_flight = 0
+        self.run_client(self.client.post_glucose_many(records[:6], concurrency=1))
+        self.assertEqual(self.server.max_in_flight, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
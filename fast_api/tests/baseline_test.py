@@ -0,0 +1,61 @@
+import unittest
+import os
+os.environ.setdefault("RPC_SERVER", "backend_dotnet:5283")
+import numpy as np
+from src.device import baseline_correction, baseline_correction_batch
+
+_EXAMPLE = "example/2509150914089 250mw 3000ms.txt"
+
+
+def _reference_baseline_correction(signal: np.ndarray) -> np.ndarray:
+    # The original list-based implementation, kept here as the parity oracle.
+    window_size:int = 7
+    baseline_signal: np.ndarray = signal.copy()
+    original_signal_itera: np.ndarray = signal.copy()
+    for _ in range(20):
+        start_window:int = (window_size - 1) // 2
+        end_window  :int = (window_size + 1) // 2
+        original_signal_itera_before: list[float] = ([original_signal_itera[0]] * start_window) + original_signal_itera.tolist() + ([original_signal_itera[-1]] * end_window )
+        original_signal_itera_after: list[float] = []
+        for temp1 in range(len(signal)):
+            _Temporigin_signal_itera_before:list[float] = []
+            for j in range(temp1 + window_size - temp1):
+                _Temporigin_signal_itera_before.append(original_signal_itera_before[j + temp1])
+            avg:float = sum(_Temporigin_signal_itera_before)/len(_Temporigin_signal_itera_before)
+            original_signal_itera_after.append(avg)
+        r1:np.ndarray = np.array(baseline_signal) - np.array(original_signal_itera_after)
+        for idx, point in enumerate(r1):
+            if point > 0:
+                baseline_signal[idx] = original_signal_itera_after[idx]
+        window_size = window_size + 4
+        original_signal_itera = baseline_signal.copy()
+    return signal - baseline_signal
+
+
+class TestBaselineCorrection(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Columns: Pixel;Raman Shift;Raw;Dark;Dark Subtracted;BaseLine Subtracted
+        data = np.loadtxt(_EXAMPLE, delimiter=";", skiprows=15, encoding="utf-8-sig")
+        cls.raw = data[:, 2]
+        cls.dark_subtracted = data[:, 4]
+        cls.expected = _reference_baseline_correction(cls.raw)
+
+    def test_parity_with_reference(self):
+        np.testing.assert_allclose(baseline_correction(self.raw), self.expected, rtol=1e-9, atol=1e-6)
+
+    def test_batch_matches_single(self):
+        frames = np.vstack([self.raw, self.dark_subtracted, self.raw[::-1]])
+        corrected = baseline_correction_batch(frames)
+        self.assertEqual(corrected.shape, frames.shape)
+        for frame, row in zip(frames, corrected):
+            np.testing.assert_allclose(row, _reference_baseline_correction(frame), rtol=1e-9, atol=1e-6)
+
+    def test_does_not_modify_input(self):
+        raw = self.raw.copy()
+        baseline_correction(raw)
+        np.testing.assert_array_equal(raw, self.raw)
+
+
+if __name__ == '__main__':
+    unittest.main()
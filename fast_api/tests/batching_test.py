@@ -0,0 +1,151 @@
+import unittest
+import asyncio
+import shutil
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+from src.inference import BatchDispatcher, InferencePool, ModelRegistry
+
+_EXAMPLE = Path("example/2509150914089 250mw 3000ms.txt")
+_MODEL_DIR = Path("models")
+
+
+class CountingPool(InferencePool):
+    """Records the size of every batch sent to the pool."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sizes: list[int] = []
+
+    async def predict(self, spectra, model_name=None, raman_shift=None):
+        self.sizes.append(np.atleast_2d(spectra).shape[0])
+        return await super().predict(spectra, model_name=model_name, raman_shift=raman_shift)
+
+
+class TestBatchDispatcher(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = Path(tempfile.mkdtemp())
+        for name in ["ramanshift", "LinearRegression", "LinearRegression_pca", "MLPRegressor", "MLPRegressor_pca"]:
+            shutil.copy(_MODEL_DIR.joinpath(name), cls.tmp.joinpath(name))
+        cls.registry = ModelRegistry(model_dir=cls.tmp, default="LinearRegression")
+        data = np.loadtxt(_EXAMPLE, delimiter=";", skiprows=15, encoding="utf-8-sig")
+        cls.spectra = data[:, 5] + np.random.default_rng(5).normal(scale=5, size=(10, data.shape[0]))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def setUp(self):
+        self.pool = CountingPool(registry=self.registry, kind="thread", workers=1)
+
+    def _run(self, dispatcher: BatchDispatcher, coro):
+        async def run():
+            try:
+                return await coro
+            finally:
+                await dispatcher.stop()
+                await self.pool.stop()
+        return asyncio.run(run())
+
+    def _expected(self, model_name: str | None = None) -> np.ndarray:
+        async def run():
+            try:
+                return await self.pool.predict(self.spectra, model_name=model_name)
+            finally:
+                await self.pool.stop()
+        expected = asyncio.run(run())
+        self.pool.sizes.clear()
+        return expected
+
+    def test_batches_concurrent_predictions(self):
+        expected = self._expected()
+        dispatcher = BatchDispatcher(pool=self.pool, max_batch=4, max_wait_ms=50)
+
+        async def run():
+            return await asyncio.gather(*[dispatcher.predict(spectrum) for spectrum in self.spectra])
+
+        preds = self._run(dispatcher, run())
+        np.testing.assert_allclose(preds, expected, rtol=1e-9)
+        self.assertEqual(self.pool.sizes, [4, 4, 2])
+        self.assertEqual((dispatcher.batches, dispatcher.predictions), (3, 10))
+
+    def test_lone_request_waits_max_wait(self):
+        dispatcher = BatchDispatcher(pool=self.pool, max_batch=32, max_wait_ms=30)
+
+        async def run():
+            # Warm-up: the first call loads the models in the worker
+            await dispatcher.predict(self.spectra[0])
+            start = time.perf_counter()
+            await dispatcher.predict(self.spectra[1])
+            return time.perf_counter() - start
+
+        elapsed = self._run(dispatcher, run())
+        self.assertGreaterEqual(elapsed, 0.03)
+        self.assertLess(elapsed, 1)
+        self.assertEqual(self.pool.sizes, [1, 1])
+
+    def test_models_are_not_mixed(self):
+        expected = self._expected("MLPRegressor")
+        dispatcher = BatchDispatcher(pool=self.pool, max_batch=32, max_wait_ms=10)
+
+        async def run():
+            return await asyncio.gather(
+                *[dispatcher.predict(spectrum, model_name="MLPRegressor") for spectrum in self.spectra[:3]],
+                *[dispatcher.predict(spectrum) for spectrum in self.spectra[3:5]],
+            )
+
+        preds = self._run(dispatcher, run())
+        np.testing.assert_allclose(preds[:3], expected[:3], rtol=1e-9)
+        self.assertEqual(sorted(self.pool.sizes), [2, 3])
+
+    def test_errors(self):
+        dispatcher = BatchDispatcher(pool=self.pool, max_batch=32, max_wait_ms=10)
+
+        async def run():
+            with self.assertRaises(ValueError):
+                await dispatcher.predict(self.spectra[0][:100])
+            return await asyncio.gather(
+                dispatcher.predict(self.spectra[0], model_name="NotAModel"),
+                dispatcher.predict(self.spectra[1], model_name="NotAModel"),
+                dispatcher.predict(self.spectra[2]),
+                return_exceptions=True,
+            )
+
+        results = self._run(dispatcher, run())
+        self.assertIsInstance(results[0], KeyError)
+        self.assertIsInstance(results[1], KeyError)
+        self.assertIsInstance(results[2], float)
+
+    def test_cancelled_caller_is_skipped(self):
+        dispatcher = BatchDispatcher(pool=self.pool, max_batch=32, max_wait_ms=20)
+
+        async def run():
+            calls = [asyncio.ensure_future(dispatcher.predict(spectrum)) for spectrum in self.spectra[:3]]
+            await asyncio.sleep(0)
+            calls[1].cancel()
+            return await asyncio.gather(*calls, return_exceptions=True)
+
+        results = self._run(dispatcher, run())
+        self.assertIsInstance(results[1], asyncio.CancelledError)
+        self.assertEqual(self.pool.sizes, [2])
+
+    def test_stop_cancels_pending(self):
+        dispatcher = BatchDispatcher(pool=self.pool, max_batch=32, max_wait_ms=10_000)
+
+        async def run():
+            call = asyncio.ensure_future(dispatcher.predict(self.spectra[0]))
+            await asyncio.sleep(0.01)
+            await dispatcher.stop()
+            return await asyncio.gather(call, return_exceptions=True)
+
+        self.assertIsInstance(self._run(dispatcher, run())[0], asyncio.CancelledError)
+        self.assertEqual(self.pool.sizes, [])
+        with self.assertRaises(ValueError):
+            BatchDispatcher(pool=self.pool, max_batch=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,347 @@
+import unittest
+import os
+os.environ.setdefault("RPC_SERVER", "backend_dotnet:5283")
+os.environ.setdefault("ME_CONFIG_MONGODB_URL", "mongodb://localhost:27017")
+# No outbox worker: there is no Mongo to drain
+os.environ.setdefault("OUTBOX_INTERVAL", "0")
+import asyncio
+import json
+import time
+import threading
+from concurrent import futures
+from unittest import mock
+import grpc
+import numpy as np
+from fastapi.testclient import TestClient
+from rpc import raman_pb2, raman_pb2_grpc
+from src.main import app
+from src.device import client, session, scheduler, Subscription, protocol
+
+_EXAMPLE = "example/2509150914089 250mw 3000ms.txt"
+
+
+class FakeRaman(raman_pb2_grpc.RamanServicer):
+    """An in-process stand-in for backend_dotnet that streams the example spectrum."""
+
+    def __init__(self, frame_delay: float = 0.0):
+        data = np.loadtxt(_EXAMPLE, delimiter=";", skiprows=15, encoding="utf-8-sig")
+        self.spectrum = data[:, 5].tolist()
+        self.frame_delay = frame_delay
+        self.calls: dict[str, int] = {}
+        self.cancelled = threading.Event()
+        self.conf = (250, 1000, 1)
+
+    def _count(self, name: str):
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def _status(self) -> raman_pb2.DeviceStatus:
+        laser_power, exposure, accumulations = self.conf
+        return raman_pb2.DeviceStatus(IsConnected=True, device=raman_pb2.Device(name="ATR25000", com_port="COM1", device_id="0"),
+                                      laser_power=laser_power, exposure=exposure, accumulations=accumulations)
+
+    def GetDeviceList(self, request, context):
+        self._count("GetDeviceList")
+        return raman_pb2.DeviceList(devices=[raman_pb2.Device(name="ATR25000", com_port="COM1", device_id="0")])
+
+    def DeviceCheck(self, request, context):
+        self._count("DeviceCheck")
+        return self._status()
+
+    def Connect(self, request, context):
+        self._count("Connect")
+        return self._status()
+
+    def SetMeasureConf(self, request, context):
+        self._count("SetMeasureConf")
+        self.conf = (request.laser_power, request.exposure, request.accumulations)
+        return self._status()
+
+    def ReadCCD(self, request, context):
+        self._count("ReadCCD")
+        for data_type in ["dark", "signal"]:
+            if self.frame_delay and context.is_active():
+                time.sleep(self.frame_delay)
+            if not context.is_active():
+                self.cancelled.set()
+                return
+            ccd = raman_pb2.CCD(data_type=data_type, data=self.spectrum)
+            ccd.time.GetCurrentTime()
+            yield ccd
+
+
+def serve(servicer: FakeRaman) -> tuple[grpc.Server, str]:
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=8))
+    raman_pb2_grpc.add_RamanServicer_to_server(servicer, server)
+    port = server.add_insecure_port("localhost:0")
+    server.start()
+    return server, f"localhost:{port}"
+
+
+class DeviceTestCase(unittest.TestCase):
+    frame_delay: float = 0.0
+
+    def setUp(self):
+        self.servicer = FakeRaman(frame_delay=self.frame_delay)
+        self.server, target = serve(self.servicer)
+        self._target = client.target
+        client.target = target
+        client._stub = None
+        session.invalidate()
+
+    def tearDown(self):
+        self.server.stop(None)
+        client.target = self._target
+        client._stub = None
+
+
+class TestMeasure(DeviceTestCase):
+    def test_measure(self):
+        with TestClient(app) as http:
+            with http.websocket_connect("/api/device/ws/measure") as ws:
+                ws.send_text(json.dumps({"action": "start", "model": "LinearRegression"}))
+                messages = []
+                while True:
+                    message = json.loads(ws.receive_text())
+                    messages.append(message)
+                    if message["progress"] == 100.0 or message["is_ok"] == False:
+                        break
+        self.assertTrue(messages[-1]["is_ok"], messages[-1])
+        self.assertIsInstance(messages[-1]["data"]["glucose"], float)
+        self.assertEqual(self.servicer.calls["ReadCCD"], 3)
+
+    def test_measure_binary(self):
+        with TestClient(app) as http:
+            with http.websocket_connect("/api/device/ws/measure?format=float64") as ws:
+                ws.send_text(json.dumps({"action": "start", "model": "LinearRegression"}))
+                frames = []
+                while True:
+                    message = ws.receive()
+                    if message.get("bytes") is not None:
+                        frames.append(protocol.decode_ccd(message["bytes"]))
+                        continue
+                    message = json.loads(message["text"])
+                    if message["progress"] == 100.0:
+                        break
+        self.assertEqual(len(frames), 3)
+        np.testing.assert_array_equal(frames[0]["data"], self.servicer.spectrum)
+        self.assertIsNone(frames[0]["corrected_data"])
+
+    def test_unknown_format(self):
+        with TestClient(app) as http:
+            with self.assertRaises(Exception):
+                with http.websocket_connect("/api/device/ws/ccd?format=xml") as ws:
+                    ws.receive_text()
+
+    def test_session_reuses_connection(self):
+        with TestClient(app) as http:
+            with http.websocket_connect("/api/device/ws/measure") as ws:
+                for _ in range(2):
+                    ws.send_text(json.dumps({"action": "start", "model": "LinearRegression"}))
+                    while json.loads(ws.receive_text())["progress"] != 100.0:
+                        pass
+            status = http.get("/api/device/status").json()
+        self.assertEqual(self.servicer.calls["Connect"], 1)
+        self.assertEqual(self.servicer.calls["SetMeasureConf"], 1)
+        self.assertEqual(self.servicer.calls["ReadCCD"], 6)
+        self.assertTrue(status["IsConnected"])
+        self.assertEqual(status["device"]["name"], "ATR25000")
+
+    def test_heartbeat(self):
+        session.heartbeat_interval = 0.05
+        try:
+            with TestClient(app):
+                time.sleep(0.3)
+        finally:
+            session.heartbeat_interval = 10
+        self.assertGreater(self.servicer.calls.get("DeviceCheck", 0), 0)
+        self.assertTrue(session.is_connected)
+        self.assertEqual(session.conf, (250, 1000, 1))
+
+    def test_heartbeat_survives_errors(self):
+        session.heartbeat_interval = 0.05
+        calls = []
+
+        async def device_check():
+            calls.append(len(calls))
+            if len(calls) == 1:
+                raise RuntimeError("unexpected")
+            return self.servicer._status()
+
+        try:
+            with mock.patch.object(client, "device_check", device_check):
+                with TestClient(app):
+                    time.sleep(0.3)
+        finally:
+            session.heartbeat_interval = 10
+        self.assertGreater(len(calls), 1)
+
+    def test_device_unavailable(self):
+        self.server.stop(None)
+        with TestClient(app) as http:
+            with http.websocket_connect("/api/device/ws/measure") as ws:
+                ws.send_text(json.dumps({"action": "start"}))
+                ws.receive_text()
+                message = json.loads(ws.receive_text())
+        self.assertFalse(message["is_ok"])
+        self.assertIn("Device error", message["detail"])
+
+    def test_invalid_message(self):
+        with TestClient(app) as http:
+            with http.websocket_connect("/api/device/ws/measure") as ws:
+                ws.send_text(json.dumps({"action": "start", "laser_power": 0}))
+                message = json.loads(ws.receive_text())
+                self.assertFalse(message["is_ok"])
+                self.assertIn("laser_power", message["detail"])
+                # Still open
+                ws.send_text(json.dumps({"action": "arming"}))
+                self.assertTrue(json.loads(ws.receive_text())["is_ok"])
+
+    def test_unexpected_error(self):
+        async def read_ccd(timeout=None):
+            raise RuntimeError("broken frame")
+            yield
+
+        with mock.patch.object(client, "read_ccd", read_ccd):
+            with TestClient(app) as http:
+                with http.websocket_connect("/api/device/ws/measure") as ws:
+                    ws.send_text(json.dumps({"action": "start"}))
+                    while (message := json.loads(ws.receive_text()))["is_ok"]:
+                        pass
+        self.assertIn("Measurement error", message["detail"])
+        self.assertIn("broken frame", message["detail"])
+
+
+class TestJobs(DeviceTestCase):
+    def test_submit_and_follow(self):
+        with TestClient(app) as http:
+            request = {"device": 0, "laser_power": 250, "exposure": 2000, "accumulations": 2, "reads": 2, "model": "LinearRegression"}
+            job = http.post("/api/device/jobs", json=request).json()
+            self.assertIn(job["status"], ["queued", "running"])
+            with http.websocket_connect(f"/api/device/ws/jobs/{job['job_id']}") as ws:
+                messages = []
+                while (message := json.loads(ws.receive_text()))["progress"] != 100.0:
+                    messages.append(message)
+            status = http.get(f"/api/device/jobs/{job['job_id']}").json()
+            self.assertEqual(http.get("/api/device/jobs/unknown").status_code, 404)
+        self.assertEqual(status["status"], "done")
+        self.assertIsInstance(status["result"]["glucose"], float)
+        self.assertEqual(message["data"], status["result"])
+        self.assertEqual([m["progress"] for m in messages], [10.0, 30.0, 70.0, 85.0])
+        self.assertIn("ccd", messages[1]["data"])
+        self.assertEqual(self.servicer.conf, (250, 2000, 2))
+        self.assertEqual(self.servicer.calls["ReadCCD"], 2)
+
+    def test_devices_on_other_backends(self):
+        other = FakeRaman()
+        server, target = serve(other)
+        scheduler.targets = {1: target}
+        try:
+            with TestClient(app) as http:
+                jobs = [http.post("/api/device/jobs", json={"device": device, "reads": 1, "model": "LinearRegression"}).json()
+                        for device in [0, 1, 0]]
+                self.assertEqual([job["position"] for job in jobs], [0, 0, 1])
+                for job in jobs:
+                    with http.websocket_connect(f"/api/device/ws/jobs/{job['job_id']}") as ws:
+                        while json.loads(ws.receive_text())["progress"] != 100.0:
+                            pass
+        finally:
+            scheduler.targets = {}
+            scheduler.lanes.clear()
+            server.stop(None)
+        self.assertEqual(self.servicer.calls["ReadCCD"], 2)
+        self.assertEqual(other.calls["ReadCCD"], 1)
+
+    def test_cancel(self):
+        self.servicer.frame_delay = 0.5
+        with TestClient(app) as http:
+            job = http.post("/api/device/jobs", json={}).json()
+            waiting = http.post("/api/device/jobs", json={}).json()
+            self.assertEqual(waiting["position"], 1)
+            cancelled = http.delete(f"/api/device/jobs/{waiting['job_id']}").json()
+            self.assertEqual(cancelled["status"], "cancelled")
+            self.assertIsNone(cancelled["position"])
+            deadline = time.monotonic() + 2
+            while "ReadCCD" not in self.servicer.calls and time.monotonic() < deadline:
+                time.sleep(0.01)
+            http.delete(f"/api/device/jobs/{job['job_id']}")
+            self.assertEqual(http.get(f"/api/device/jobs/{job['job_id']}").json()["status"], "cancelled")
+        self.assertTrue(self.servicer.cancelled.wait(timeout=2))
+
+
+class TestSlowDevice(DeviceTestCase):
+    frame_delay = 0.5
+
+    def test_event_loop_stays_responsive(self):
+        with TestClient(app) as http:
+            with http.websocket_connect("/api/device/ws/ccd") as ws:
+                ws.send_text("read_ccd")
+                start = time.perf_counter()
+                response = http.get("/api/device/models")
+                elapsed = time.perf_counter() - start
+                self.assertEqual(response.status_code, 200)
+                self.assertLess(elapsed, self.frame_delay)
+                json.loads(ws.receive_text())
+
+    def test_viewers_share_one_stream(self):
+        with TestClient(app) as http:
+            with http.websocket_connect("/api/device/ws/ccd") as ws1, http.websocket_connect("/api/device/ws/ccd") as ws2:
+                ws1.send_text("read_ccd")
+                ws2.send_text("read_ccd")
+                frames1 = [json.loads(ws1.receive_text()) for _ in range(2)]
+                frames2 = [json.loads(ws2.receive_text()) for _ in range(2)]
+        self.assertEqual(self.servicer.calls["ReadCCD"], 1)
+        self.assertEqual([f["data_type"] for f in frames1], ["dark", "signal"])
+        self.assertEqual(frames1, frames2)
+
+    def test_binary_frames(self):
+        with TestClient(app) as http:
+            with http.websocket_connect("/api/device/ws/ccd?format=float32") as ws_bin, http.websocket_connect("/api/device/ws/ccd") as ws_json:
+                ws_bin.send_text("read_ccd")
+                binary = ws_bin.receive_bytes()
+                text = ws_json.receive_text()
+        frame = protocol.decode_ccd(binary)
+        expected = json.loads(text)
+        self.assertEqual(frame["data_type"], expected["data_type"])
+        np.testing.assert_allclose(frame["data"], expected["data"], rtol=1e-6)
+        np.testing.assert_allclose(frame["corrected_data"], expected["corrected_data"], rtol=1e-5, atol=1e-2)
+        self.assertLess(len(binary) * 3, len(text))
+
+    def test_disconnect_cancels_read_ccd(self):
+        with TestClient(app) as http:
+            with http.websocket_connect("/api/device/ws/ccd") as ws:
+                ws.send_text("read_ccd")
+                time.sleep(0.1)
+        self.assertTrue(self.servicer.cancelled.wait(timeout=2))
+
+
+class TestSubscription(unittest.TestCase):
+    def test_drop_oldest(self):
+        async def run():
+            subscription = Subscription(maxsize=2)
+            for i in range(5):
+                subscription.put(i)
+            return subscription.dropped, [await subscription.get() for _ in range(2)]
+        dropped, items = asyncio.run(run())
+        self.assertEqual(dropped, 3)
+        self.assertEqual(items, [3, 4])
+
+
+class TestProtocol(unittest.TestCase):
+    def test_round_trip(self):
+        from datetime import datetime, timedelta, timezone
+        time = datetime(2025, 9, 25, 8, 16, 44, tzinfo=timezone.utc)
+        data = np.linspace(0, 1, 2048)
+        for format in protocol.FORMATS:
+            buffer = protocol.encode_ccd(time=time, duration=timedelta(seconds=3), data_type="signal",
+                                         data=data, corrected_data=data * 2, format=format)
+            self.assertEqual(len(buffer), protocol.HEADER.size + 2 * 2048 * protocol.FORMATS[format].itemsize)
+            frame = protocol.decode_ccd(buffer)
+            self.assertEqual(frame["time"], time)
+            self.assertEqual(frame["duration"], timedelta(seconds=3))
+            self.assertEqual(frame["data_type"], "signal")
+            np.testing.assert_allclose(frame["data"], data, rtol=1e-7)
+            np.testing.assert_allclose(frame["corrected_data"], data * 2, rtol=1e-7)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+"""
+In-memory stand-in for the part of motor's collection used by the app, shared by the tests:
+
+    collection = FakeCollection([{"_id": 1, "subject_id": "s1"}])
+    await collection.bulk_write([UpdateOne({"_id": 1}, {"$set": {"glucose_target": 92.0}})])
+
+The documents are kept by `_id` in `collection.docs`. Every `find` (query, projection) is recorded in
+`collection.finds`, every `bulk_write` request in `collection.requests`.
+"""
+from typing import Any
+
+_OPERATORS = {
+    "$in": lambda value, arg: value in arg,
+    "$ne": lambda value, arg: value != arg,
+    "$lt": lambda value, arg: value is not None and value < arg,
+    "$lte": lambda value, arg: value is not None and value <= arg,
+    "$gt": lambda value, arg: value is not None and value > arg,
+    "$gte": lambda value, arg: value is not None and value >= arg,
+}
+
+
+def _match(doc: dict, query: dict | None) -> bool:
+    for key, condition in (query or {}).items():
+        value = doc.get(key)
+        if isinstance(condition, dict) and any(op.startswith("$") for op in condition):
+            if not all(_OPERATORS[op](value, arg) for op, arg in condition.items()):
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+def _project(doc: dict, projection: dict | None) -> dict:
+    # Inclusion of top-level fields and `packed.<name>`, with `_id` unless excluded, like Mongo
+    if not projection:
+        return dict(doc)
+    out = {"_id": doc["_id"]} if projection.get("_id", 1) and "_id" in doc else {}
+    for name, keep in projection.items():
+        if keep == 0 or name == "_id":
+            continue
+        if name.startswith("packed."):
+            array = name.split(".")[1]
+            if doc.get("packed") and array in doc["packed"]:
+                out.setdefault("packed", {})[array] = doc["packed"][array]
+        elif name in doc:
+            out[name] = doc[name]
+    return out
+
+
+class Result:
+    def __init__(self, matched: int = 0, modified: int = 0, upserted: list | None = None):
+        self.matched_count = matched
+        self.modified_count = modified
+        self.upserted_ids = upserted or []
+        self.upserted_count = len(self.upserted_ids)
+        self.upserted_id = self.upserted_ids[0] if self.upserted_ids else None
+
+
+class FakeCursor:
+    def __init__(self, docs: list[dict]):
+        self.docs = docs
+
+    async def __aiter__(self):
+        for doc in self.docs:
+            yield doc
+
+
+class FakeCollection:
+    def __init__(self, docs: list[dict] | None = None):
+        self.docs: dict[Any, dict] = {}
+        self.indexes: list = []
+        self.finds: list[tuple[dict, dict | None]] = []
+        self.requests: list = []
+        for doc in docs or []:
+            self._insert(doc)
+
+    def _insert(self, doc: dict) -> Any:
+        doc.setdefault("_id", f"fake-{len(self.docs)}")
+        self.docs[doc["_id"]] = doc
+        return doc["_id"]
+
+    def _update(self, query: dict, update: dict, upsert: bool, many: bool) -> Result:
+        docs = [doc for doc in self.docs.values() if _match(doc, query)]
+        if len(docs) == 0:
+            if upsert == False:
+                return Result()
+            # Like Mongo, the equality conditions of the query are part of the inserted document
+            doc = {key: value for key, value in query.items() if not isinstance(value, dict)}
+            doc.update(update.get("$setOnInsert", {}))
+            doc.update(update.get("$set", {}))
+            return Result(upserted=[self._insert(doc)])
+        modified = 0
+        for doc in docs if many else docs[:1]:
+            before = dict(doc)
+            doc.update(update.get("$set", {}))
+            for key in update.get("$unset", {}):
+                doc.pop(key, None)
+            modified += doc != before
+        return Result(matched=len(docs) if many else 1, modified=modified)
+
+    async def create_index(self, keys, **kwargs):
+        self.indexes.append((keys, kwargs))
+
+    def find(self, query: dict | None = None, projection: dict | None = None, sort=None, limit: int = 0, batch_size: int = 0):
+        self.finds.append((query, projection))
+        docs = [doc for doc in self.docs.values() if _match(doc, query)]
+        for key, direction in reversed(sort or []):
+            docs.sort(key=lambda doc: doc[key], reverse=direction < 0)
+        return FakeCursor([_project(doc, projection) for doc in (docs[:limit] if limit else docs)])
+
+    async def update_one(self, query, update, upsert=False) -> Result:
+        return self._update(query, update, upsert, many=False)
+
+    async def update_many(self, query, update, upsert=False) -> Result:
+        return self._update(query, update, upsert, many=True)
+
+    async def bulk_write(self, requests, ordered=True) -> Result:
+        total = Result()
+        for request in requests:
+            self.requests.append(request)
+            result = self._update(request._filter, request._doc, request._upsert, many=False)
+            total.matched_count += result.matched_count
+            total.modified_count += result.modified_count
+            total.upserted_count += result.upserted_count
+        return total
+
+    async def delete_many(self, query):
+        self.docs = {key: doc for key, doc in self.docs.items() if not _match(doc, query)}
+
+    async def delete_one(self, query):
+        doc = next((doc for doc in self.docs.values() if _match(doc, query)), None)
+        if doc is not None:
+            del self.docs[doc["_id"]]
@@ -0,0 +1,88 @@
+import unittest
+import os
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+from src.spectra import CompiledPipeline, FeatureCache
+
+_EXAMPLE = Path("example/2509150914089 250mw 3000ms.txt")
+
+
+class TestFeatureCache(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        data = np.loadtxt(_EXAMPLE, delimiter=";", skiprows=16)
+        cls.raman_shift = data[:, 1]
+        rng = np.random.default_rng(0)
+        cls.spectra = data[:, 5] + rng.normal(scale=5, size=(6, data.shape[0]))
+        cls.pipeline = CompiledPipeline.for_axis(cls.raman_shift)
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = FeatureCache(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_transform(self):
+        expected = self.pipeline(self.spectra)
+        np.testing.assert_array_equal(self.cache.transform(self.pipeline, self.spectra[:4]), expected[:4])
+        self.assertEqual((self.cache.hits, len(self.cache)), (0, 4))
+        # 4 hits, 2 misses
+        np.testing.assert_array_equal(self.cache.transform(self.pipeline, self.spectra), expected)
+        self.assertEqual((self.cache.hits, len(self.cache)), (4, 6))
+        # Single spectrum
+        np.testing.assert_array_equal(self.cache.transform(self.pipeline, self.spectra[0]), expected[0])
+
+    def test_key(self):
+        key = FeatureCache.key(self.pipeline, self.spectra[0])
+        self.assertEqual(key, FeatureCache.key(CompiledPipeline(self.raman_shift), self.spectra[0].tolist()))
+        self.assertNotEqual(key, FeatureCache.key(self.pipeline, self.spectra[1]))
+        for params in [{"despike_threshold": 4}, {"smoothing_window": 30}, {"baseline_roi": [[905, 915], [1400, 1460]]}]:
+            self.assertNotEqual(key, FeatureCache.key(CompiledPipeline.for_axis(self.raman_shift, **params), self.spectra[0]))
+        self.assertNotEqual(key, FeatureCache.key(CompiledPipeline.for_axis(self.raman_shift + 1), self.spectra[0]))
+
+    def test_memmap(self):
+        self.cache.transform(self.pipeline, self.spectra[:1])
+        features = self.cache.get(FeatureCache.key(self.pipeline, self.spectra[0]))
+        self.assertIsInstance(features, np.memmap)
+        self.assertFalse(features.flags.writeable)
+
+    def test_lru_eviction(self):
+        self.cache.transform(self.pipeline, self.spectra[:3])
+        entry_size = self.cache.size // 3
+        cache = FeatureCache(self.tmp.name, max_bytes=3 * entry_size)
+        keys = [FeatureCache.key(self.pipeline, spectrum) for spectrum in self.spectra]
+        # Recency is the mtime
+        for i, key in enumerate(keys[:3]):
+            os.utime(cache._path(key), ns=(time.time_ns(), 1_000_000_000 * (i + 1)))
+        cache.get(keys[0])
+        cache.transform(self.pipeline, self.spectra[3:4])
+        self.assertLessEqual(cache.size, cache.max_bytes)
+        self.assertEqual([cache.get(key) is not None for key in keys[:4]], [True, False, True, True])
+        # Shared directory: a fresh instance sees the same entries
+        self.assertEqual(len(FeatureCache(self.tmp.name)), 3)
+
+    def test_missing_file(self):
+        self.cache.transform(self.pipeline, self.spectra[:1])
+        key = FeatureCache.key(self.pipeline, self.spectra[0])
+        self.cache._path(key).unlink()
+        self.assertIsNone(self.cache.get(key))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_disabled(self):
+        cache = FeatureCache(self.tmp.name, max_bytes=0)
+        np.testing.assert_array_equal(cache.transform(self.pipeline, self.spectra), self.pipeline(self.spectra))
+        self.assertEqual(len(cache), 0)
+
+    def test_clear(self):
+        self.cache.transform(self.pipeline, self.spectra)
+        self.cache.clear()
+        self.assertEqual((len(self.cache), self.cache.size), (0, 0))
+        self.assertEqual(list(Path(self.tmp.name).glob("*/*.npy")), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import unittest
+import os
+os.environ.setdefault("ME_CONFIG_MONGODB_URL", "mongodb://localhost:27017")
+import asyncio
+from datetime import date, datetime, timedelta
+from src.history import HistoryCache, HistoryError, _now, _runs
+from fake_mongo import FakeCollection
+
+
+class FakeClient:
+    # `get_blood_sugar`: 2 records a day, on odd days only
+    def __init__(self):
+        self.calls: list[tuple[int, date, date]] = []
+        self.status = 200
+
+    async def fetch_by_user_id(self, user_id, start_date, end_date):
+        self.calls.append((user_id, start_date.date(), end_date.date()))
+        data = []
+        day = start_date.date()
+        while day <= end_date.date():
+            if day.day % 2 == 1:
+                for hour in [7, 19]:
+                    data.append({"PatientID": user_id, "RecordDate": day.isoformat(), "Code": 58, "Value": 90 + hour,
+                                 "RecordDT": f"{day.isoformat()} {hour:02d}:00:00"})
+            day += timedelta(days=1)
+        if self.status != 200:
+            return {"status": self.status, "message": "error", "data": None}
+        return {"status": 200, "message": "success", "data": data}
+
+
+class TestHistoryCache(unittest.TestCase):
+
+    def setUp(self):
+        self.collection = FakeCollection()
+        self.client = FakeClient()
+        self.history = HistoryCache(collection=self.collection, client=self.client, today_ttl=300)
+
+    def get(self, start, end, patient_id=10):
+        return asyncio.run(self.history.get(patient_id, start, end))
+
+    def test_runs(self):
+        days = [date(2025, 10, d) for d in [1, 2, 3, 5, 7, 8]]
+        self.assertEqual(_runs(days), [(days[0], days[2]), (days[3], days[3]), (days[4], days[5])])
+        self.assertEqual(_runs([]), [])
+
+    def test_read_through(self):
+        records = self.get(datetime(2025, 10, 1), datetime(2025, 10, 10))
+        self.assertEqual(self.client.calls, [(10, date(2025, 10, 1), date(2025, 10, 10))])
+        self.assertEqual(len(records), 10)
+        self.assertEqual([r["RecordDT"] for r in records], sorted(r["RecordDT"] for r in records))
+        # Every day is cached, with or without records
+        self.assertEqual(len(self.collection.docs), 10)
+        self.assertEqual(self.collection.docs["10:2025-10-02"]["records"], [])
+        self.assertIsNone(self.collection.docs["10:2025-10-01"]["expires"])
+
+        # Served from the cache
+        self.assertEqual(self.get(date(2025, 10, 3), date(2025, 10, 7)), [r for r in records if "2025-10-03" <= r["RecordDate"] <= "2025-10-07"])
+        self.assertEqual(len(self.client.calls), 1)
+
+    def test_only_missing_ranges(self):
+        self.get(date(2025, 10, 5), date(2025, 10, 6))
+        self.get(date(2025, 10, 9), date(2025, 10, 9))
+        self.client.calls.clear()
+        records = self.get(date(2025, 10, 3), date(2025, 10, 11))
+        self.assertEqual(sorted(self.client.calls), [
+            (10, date(2025, 10, 3), date(2025, 10, 4)),
+            (10, date(2025, 10, 7), date(2025, 10, 8)),
+            (10, date(2025, 10, 10), date(2025, 10, 11)),
+        ])
+        self.assertEqual(sorted({r["RecordDate"] for r in records}), [f"2025-10-{d:02d}" for d in [3, 5, 7, 9, 11]])
+        # Another patient has its own days
+        self.get(date(2025, 10, 5), date(2025, 10, 5), patient_id=11)
+        self.assertEqual(self.client.calls[-1], (11, date(2025, 10, 5), date(2025, 10, 5)))
+
+    def test_today_expires(self):
+        today = date.today()
+        self.get(today - timedelta(days=1), today)
+        doc = self.collection.docs[HistoryCache.key(10, today)]
+        self.assertGreater(doc["expires"], _now())
+        self.assertIsNone(self.collection.docs[HistoryCache.key(10, today - timedelta(days=1))]["expires"])
+        self.assertEqual(self.collection.indexes, [([("expires", 1)], {"expireAfterSeconds": 0})])
+
+        self.get(today - timedelta(days=1), today)
+        self.assertEqual(len(self.client.calls), 1)
+        # Expired but not purged yet: fetched again, alone
+        doc["expires"] = _now() - timedelta(seconds=1)
+        self.get(today - timedelta(days=1), today)
+        self.assertEqual(self.client.calls[-1], (10, today, today))
+
+    def test_error_is_not_cached(self):
+        # An upstream error returned with HTTP 200
+        self.client.status = 500
+        with self.assertRaises(HistoryError):
+            self.get(date(2025, 10, 1), date(2025, 10, 3))
+        self.assertEqual(self.collection.docs, {})
+        self.client.status = 200
+        self.assertEqual(len(self.get(date(2025, 10, 1), date(2025, 10, 3))), 4)
+        self.assertEqual(len(self.client.calls), 2)
+
+    def test_invalidate(self):
+        self.get(date(2025, 10, 1), date(2025, 10, 3))
+        asyncio.run(self.history.invalidate(10, date(2025, 10, 2)))
+        self.get(date(2025, 10, 1), date(2025, 10, 3))
+        self.assertEqual(self.client.calls[-1], (10, date(2025, 10, 2), date(2025, 10, 2)))
+        asyncio.run(self.history.invalidate(10))
+        self.assertEqual(self.collection.docs, {})
+
+    def test_error_is_passed_through(self):
+        self.get(date(2025, 10, 2), date(2025, 10, 2))
+        self.client.status = 500
+        response = asyncio.run(self.history.fetch_by_user_id(10, datetime(2025, 10, 1), datetime(2025, 10, 3)))
+        self.assertEqual(response, {"status": 500, "message": "error", "data": None})
+        self.client.status = 200
+        response = asyncio.run(self.history.fetch_by_user_id(10, datetime(2025, 10, 1), datetime(2025, 10, 3)))
+        self.assertEqual((response["status"], response["message"], len(response["data"])), (200, "success", 4))
+
+    def test_response_shape(self):
+        response = asyncio.run(self.history.fetch_by_user_id(10, datetime(2025, 10, 31), datetime(2025, 10, 31)))
+        self.assertEqual(response["date_time_start"], "2025-10-31 00:00:00")
+        self.assertEqual(response["date_time_end"], "2025-10-31 23:59:59")
+        self.assertEqual(len(response["data"]), 2)
+        self.assertEqual(self.get(date(2025, 10, 2), date(2025, 10, 1)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
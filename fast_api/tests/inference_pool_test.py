@@ -0,0 +1,129 @@
+import unittest
+import os
+import asyncio
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock
+import numpy as np
+from rampy import baseline as rbaseline  # type: ignore
+from src.inference import InferenceBusy, InferencePool, ModelRegistry
+from src.inference import pool as inference_pool
+from src.spectra import CompiledPipeline, Sample, feature_cache
+
+_EXAMPLE = Path("example/2509150914089 250mw 3000ms.txt")
+_MODEL_DIR = Path("models")
+
+
+class TestInferencePool(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = Path(tempfile.mkdtemp())
+        for name in ["ramanshift", "LinearRegression", "LinearRegression_pca"]:
+            shutil.copy(_MODEL_DIR.joinpath(name), cls.tmp.joinpath(name))
+        cls.registry = ModelRegistry(model_dir=cls.tmp, default="LinearRegression")
+        data = np.loadtxt(_EXAMPLE, delimiter=";", skiprows=15, encoding="utf-8-sig")
+        rng = np.random.default_rng(3)
+        cls.spectra = data[:, 5] + rng.normal(scale=5, size=(4, data.shape[0]))
+        model = cls.registry.get()
+        cls.expected = model.predict(CompiledPipeline.for_axis(cls.registry.raman_shift())(cls.spectra))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def _run(self, pool: InferencePool, coro):
+        async def run():
+            try:
+                return await coro
+            finally:
+                await pool.stop()
+        return asyncio.run(run())
+
+    def test_thread_pool(self):
+        pool = InferencePool(registry=self.registry, kind="thread", workers=2)
+
+        async def run():
+            main = threading.get_ident()
+            ident = await pool.run(lambda registry: (threading.get_ident(), registry))
+            single = await asyncio.gather(*[pool.predict(spectrum) for spectrum in self.spectra])
+            groups = await pool.predict_groups([(None, self.spectra[:2]), (self.registry.raman_shift(), self.spectra[2:])])
+            return main, ident, single, groups
+
+        main, (ident, registry), single, groups = self._run(pool, run())
+        self.assertNotEqual(main, ident)
+        self.assertIs(registry, self.registry)
+        np.testing.assert_allclose(np.concatenate(single), self.expected, rtol=1e-9)
+        np.testing.assert_allclose(groups, self.expected, rtol=1e-9)
+        self.assertEqual(pool.pending, 0)
+
+    def test_process_pool(self):
+        pool = InferencePool(registry=self.registry, kind="process", workers=1)
+
+        async def run():
+            pool.start()
+            pid = await pool.run(inference_pool._ping)
+            return pid, await pool.predict(self.spectra)
+
+        pid, preds = self._run(pool, run())
+        self.assertNotEqual(pid, os.getpid())
+        np.testing.assert_allclose(preds, self.expected, rtol=1e-9)
+
+    def test_live_predictions_skip_the_cache(self):
+        pool = InferencePool(registry=self.registry, kind="thread", workers=1)
+
+        async def run():
+            with mock.patch.object(feature_cache, "transform", wraps=feature_cache.transform) as transform:
+                single = await pool.predict(self.spectra[0])
+                self.assertEqual(transform.call_count, 0)
+                groups = await pool.predict_groups([(None, self.spectra)])
+                self.assertEqual(transform.call_count, 1)
+            return single, groups
+
+        single, groups = self._run(pool, run())
+        np.testing.assert_allclose(single, self.expected[:1], rtol=1e-9)
+        np.testing.assert_allclose(groups, self.expected, rtol=1e-9)
+
+    def test_unknown_model(self):
+        pool = InferencePool(registry=self.registry, kind="thread", workers=1)
+        with self.assertRaises(KeyError):
+            self._run(pool, pool.predict(self.spectra[0], model_name="NotAModel"))
+
+    def test_queue_depth(self):
+        pool = InferencePool(registry=self.registry, kind="thread", workers=1, queue_depth=1)
+
+        async def run():
+            calls = [asyncio.ensure_future(pool.run(lambda registry: time.sleep(0.1))) for _ in range(2)]
+            await asyncio.sleep(0)
+            self.assertEqual(pool.pending, 2)
+            with self.assertRaises(InferenceBusy):
+                await pool.run(lambda registry: None)
+            await asyncio.gather(*calls)
+            # Room again once the calls are done
+            return await pool.run(lambda registry: "done")
+
+        self.assertEqual(self._run(pool, run()), "done")
+        with self.assertRaises(ValueError):
+            InferencePool(kind="gpu")
+
+    def test_create_sample(self):
+        pool = InferencePool(registry=self.registry, kind="thread", workers=1)
+        sample = self._run(pool, pool.create_sample(self.spectra[0]))
+        self.assertIsInstance(sample, Sample)
+        expected = Sample(x=self.registry.raman_shift(), y=self.spectra[0], interpolate=False)
+        expected.despike(window_length=10, threshold=5)
+        expected.interpolate(step=1)
+        expected.extract_range(low=750, high=1650)
+        expected.smoothing(window_length=60, polyorder=1)
+        y, _ = rbaseline(expected.x, expected.y, roi=[[905, 915], [1050, 1070], [1100, 1150], [1400, 1460]])
+        expected.y = y.reshape(-1)
+        expected.normalized(method="minmax")
+        expected.extract_range(low=800, high=1600)
+        np.testing.assert_array_equal(sample.y, expected.y)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+import os
+os.environ.setdefault("ME_CONFIG_MONGODB_URL", "mongodb://localhost:27017")
+import asyncio
+import tempfile
+from pathlib import Path
+from src.db.ingest import Checkpoint, describe, find_files, ingest
+from fake_mongo import FakeCollection
+
+_DATA = Path("../data")
+
+
+class TestIngest(unittest.TestCase):
+
+    def test_describe(self):
+        self.assertEqual(describe(Path("additional/s16_92_2601150802321 350mw 3000ms.txt")), ("s16", 92.0))
+        self.assertEqual(describe(Path("finger/s3/2509150914089 250mw 3000ms.txt")), ("s3", None))
+
+    def test_find_files(self):
+        files = find_files([_DATA / "finger" / "s1"])
+        self.assertGreater(len(files), 0)
+        # Not an export of a measurement session
+        self.assertNotIn("blood - 175.txt", [f.name for f in files])
+        # Any year, not only 2025
+        with tempfile.TemporaryDirectory() as tmp:
+            names = ["2601150802321 350mw 3000ms.txt", "3012312359591 250mw 3000ms.txt", "s2_101_2601150802321 350mw 3000ms.txt",
+                     "250915 notes.txt", "blood - 175.txt"]
+            for name in names:
+                Path(tmp, name).touch()
+            self.assertEqual([f.name for f in find_files([Path(tmp)])], sorted(names[:3]))
+
+    def test_ingest(self):
+        files = find_files([_DATA / "additional"])
+        collection = FakeCollection()
+        report = asyncio.run(ingest(files, collection=collection, batch_size=5, workers=2, verbose=False))
+        self.assertEqual((report.parsed, report.inserted, len(report.failed)), (len(files), len(files), 0))
+        request = next(r for r in collection.requests if r._filter["subject_id"] == "s16")
+        self.assertEqual(request._doc["$set"]["glucose_target"], 92.0)
+        self.assertEqual(len(request._doc["$set"]["baseline_subtracted"]), 2048)
+        self.assertNotIn("_id", request._doc["$set"])
+        self.assertIn("_id", request._doc["$setOnInsert"])
+
+        # Re-ingesting the same files updates the same keys (nothing is modified)
+        report = asyncio.run(ingest(files, collection=collection, batch_size=5, workers=2, verbose=False))
+        self.assertEqual((report.inserted, report.updated), (0, len(files)))
+
+    def test_resume(self):
+        files = find_files([_DATA / "additional"])
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "checkpoint"
+            asyncio.run(ingest(files[:4], collection=FakeCollection(), workers=1, checkpoint=Checkpoint(path), verbose=False))
+            collection = FakeCollection()
+            report = asyncio.run(ingest(files, collection=collection, workers=1, checkpoint=Checkpoint(path), verbose=False))
+        self.assertEqual((report.skipped, report.parsed), (4, len(files) - 4))
+        self.assertEqual(len(collection.requests), len(files) - 4)
+
+    def test_parse_error(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            bad = Path(tmp) / "s1" / "2500000000000 broken.txt"
+            bad.parent.mkdir()
+            bad.write_text("Data Generated by Optosky\nFile Version;1.2\n")
+            report = asyncio.run(ingest([bad], collection=FakeCollection(), workers=1,
+                                        checkpoint=Checkpoint(Path(tmp) / "checkpoint"), verbose=False))
+            self.assertEqual(report.parsed, 0)
+            self.assertEqual([f for f, _ in report.failed], [bad])
+            # Failed files are not checkpointed
+            self.assertNotIn(bad, Checkpoint(Path(tmp) / "checkpoint"))
+
+
+if __name__ == '__main__':
+    unittest.main()
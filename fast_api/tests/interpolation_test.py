@@ -0,0 +1,64 @@
+import unittest
+from unittest import mock
+import numpy as np
+from scipy.interpolate import CubicSpline  # type: ignore
+from src.spectra import interpolation
+from src.spectra.interpolation import SplineOperator
+
+_EXAMPLE = "example/2509150914089 250mw 3000ms.txt"
+
+
+class TestSplineOperator(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        data = np.loadtxt(_EXAMPLE, delimiter=";", skiprows=16)
+        cls.x = data[:, 1]
+        rng = np.random.default_rng(18)
+        cls.Y = data[:, 5] + rng.normal(scale=5, size=(4, data.shape[0]))
+        # The `Sample.interpolate` grid, which extrapolates a little past both ends
+        cls.grid = np.arange(np.floor(cls.x.min()), np.ceil(cls.x.max()) + 1, step=1)
+
+    def test_matches_cubic_spline(self):
+        operator = SplineOperator(self.x, self.grid)
+        expected = CubicSpline(self.x, self.Y, bc_type="natural", axis=1)(self.grid)
+        np.testing.assert_allclose(operator(self.Y), expected, rtol=1e-12, atol=1e-9)
+        np.testing.assert_allclose(operator(self.Y[0]), expected[0], rtol=1e-12, atol=1e-9)
+
+    def test_small_axis(self):
+        x = np.array([0.0, 1.0, 3.0])
+        y = np.array([1.0, -2.0, 5.0])
+        target = np.linspace(-1, 4, 11)
+        np.testing.assert_allclose(SplineOperator(x, target)(y), CubicSpline(x, y, bc_type="natural")(target))
+
+    def test_sparse(self):
+        operator = SplineOperator(self.x, self.grid)
+        # 2 source points per target point
+        self.assertEqual(operator._A.nnz, 2 * self.grid.shape[0])
+        self.assertEqual(operator._D.nnz, 3 * (self.x.shape[0] - 2))
+
+    def test_for_axis_is_cached(self):
+        operator = SplineOperator.for_axis(self.x, self.grid)
+        self.assertIs(SplineOperator.for_axis(self.x.copy(), self.grid.copy()), operator)
+        self.assertIsNot(SplineOperator.for_axis(self.x, self.grid[:-1]), operator)
+
+    def test_cache_is_bounded(self):
+        with mock.patch.object(interpolation, "_SPLINE_CACHE_SIZE", 2), mock.patch.object(SplineOperator, "_cache", type(SplineOperator._cache)()):
+            first = SplineOperator.for_axis(self.x, self.grid)
+            second = SplineOperator.for_axis(self.x, self.grid[:-1])
+            self.assertIs(SplineOperator.for_axis(self.x, self.grid), first)
+            SplineOperator.for_axis(self.x, self.grid[:-2])
+            self.assertEqual(len(SplineOperator._cache), 2)
+            # The least recently used operator (grid[:-1]) is evicted first
+            self.assertIs(SplineOperator.for_axis(self.x, self.grid), first)
+            self.assertIsNot(SplineOperator.for_axis(self.x, self.grid[:-1]), second)
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            SplineOperator(self.x[::-1], self.grid)
+        with self.assertRaises(ValueError):
+            SplineOperator(self.x, self.grid)(self.Y[:, :10])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import unittest
+import os
+os.environ.setdefault("RPC_SERVER", "backend_dotnet:5283")
+import asyncio
+from pydantic import BaseModel
+from src.device.client import RamanClient
+from src.device.hub import CCDHub
+from src.device.session import DeviceSession
+from src.device.jobs import Job, JobScheduler, Lane, MeasureRequest, parse_targets, CANCELLED, DONE, FAILED, QUEUED
+
+
+class Message(BaseModel):
+    progress: float | None = None
+
+
+def make_lane(target: str = "default:5283") -> Lane:
+    client = RamanClient(target=target)
+    return Lane(client=client, session=DeviceSession(client=client), hub=CCDHub(client=client, encoders={}))
+
+
+class TestJobScheduler(unittest.TestCase):
+
+    def _scheduler(self, duration: float = 0.05, **kwargs) -> tuple[JobScheduler, list[tuple[str, int, str]]]:
+        log: list[tuple[str, int, str]] = []
+
+        async def run(lane: Lane, job: Job):
+            log.append(("start", job.request.device, lane.client.target))
+            job.publish(Message(progress=50))
+            await asyncio.sleep(duration)
+            if job.request.reads == 13:
+                raise RuntimeError("device fault")
+            log.append(("end", job.request.device, lane.client.target))
+            return {"device": job.request.device}
+
+        return JobScheduler(run=run, lane=make_lane(), targets={1: "second:5283"}, **kwargs), log
+
+    def test_serialized_per_lane_parallel_across(self):
+        scheduler, log = self._scheduler()
+
+        async def run():
+            jobs = [scheduler.submit(MeasureRequest(device=device)) for device in [0, 1, 0, 2]]
+            self.assertEqual([scheduler.status(job).position for job in jobs], [0, 0, 1, 2])
+            await asyncio.gather(*[self._wait(job) for job in jobs])
+            await scheduler.stop()
+            return jobs
+
+        jobs = asyncio.run(run())
+        self.assertEqual([job.status for job in jobs], [DONE] * 4)
+        self.assertEqual(jobs[1].result, {"device": 1})
+        # Device 1 has its own backend: it starts with the first job of the default one
+        self.assertEqual(log[:2], [("start", 0, "default:5283"), ("start", 1, "second:5283")])
+        # Devices 0 and 2 share the default backend: one after the other
+        default = [event for event in log if event[2] == "default:5283"]
+        self.assertEqual([event[0] for event in default], ["start", "end"] * 3)
+        self.assertEqual([event[1] for event in default], [0, 0, 0, 0, 2, 2])
+
+    def test_events_and_failure(self):
+        scheduler, _ = self._scheduler()
+
+        async def run():
+            job = scheduler.submit(MeasureRequest(reads=13))
+            events = [message async for message, _ in job.events()]
+            # A late subscriber still gets every event
+            late = [message async for message, _ in job.events()]
+            await scheduler.stop()
+            return job, events, late
+
+        job, events, late = asyncio.run(run())
+        self.assertEqual(job.status, FAILED)
+        self.assertIn("device fault", job.detail)
+        self.assertEqual([message.progress for message in events], [50])
+        self.assertEqual(events, late)
+        self.assertEqual(job.progress, 50)
+
+    def test_cancel(self):
+        scheduler, log = self._scheduler(duration=10)
+
+        async def run():
+            running = scheduler.submit(MeasureRequest())
+            waiting = scheduler.submit(MeasureRequest())
+            await asyncio.sleep(0.01)
+            scheduler.cancel(waiting)
+            self.assertEqual(waiting.status, CANCELLED)
+            scheduler.cancel(running)
+            await asyncio.sleep(0.01)
+            await scheduler.stop()
+            return running, waiting
+
+        running, waiting = asyncio.run(run())
+        self.assertEqual(running.status, CANCELLED)
+        self.assertEqual(running._task.cancelled(), True)
+        self.assertEqual(log, [("start", 0, "default:5283")])
+
+    def test_stop_cancels_pending(self):
+        scheduler, _ = self._scheduler(duration=10)
+
+        async def run():
+            jobs = [scheduler.submit(MeasureRequest()) for _ in range(2)]
+            self.assertEqual(jobs[1].status, QUEUED)
+            await asyncio.sleep(0.01)
+            await scheduler.stop()
+            return jobs
+
+        self.assertEqual([job.status for job in asyncio.run(run())], [CANCELLED] * 2)
+
+    def test_history(self):
+        scheduler, _ = self._scheduler(duration=0, history=2)
+
+        async def run():
+            jobs = []
+            for _ in range(4):
+                jobs.append(scheduler.submit(MeasureRequest()))
+                await self._wait(jobs[-1])
+            await scheduler.stop()
+            return jobs
+
+        jobs = asyncio.run(run())
+        # The last job was not finished yet when it was submitted
+        self.assertEqual(list(scheduler.jobs), [job.id for job in jobs[1:]])
+
+    def test_parse_targets(self):
+        self.assertEqual(parse_targets(""), {})
+        self.assertEqual(parse_targets("1=raman-1:5283, 2=raman-2:5283"), {1: "raman-1:5283", 2: "raman-2:5283"})
+        with self.assertRaises(ValueError):
+            parse_targets("raman-1:5283")
+
+    @staticmethod
+    async def _wait(job: Job):
+        async for _ in job.events():
+            pass
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+import gc
+import io
+import os
+os.environ.setdefault("ME_CONFIG_MONGODB_URL", "mongodb://localhost:27017")
+from pathlib import Path
+import numpy as np
+from src.db import OptoFile
+from benchmarks.legacy import read_opto_file_legacy
+
+_DATA = Path("../data")
+_EXAMPLE = Path("example/2509150914089 250mw 3000ms.txt")
+
+
+def _dump(optofile: OptoFile) -> dict:
+    dump = optofile.model_dump()
+    dump.pop("id")
+    return dump
+
+
+class TestReadOptoFile(unittest.TestCase):
+    files = [_EXAMPLE, *sorted(_DATA.glob("finger/s1/25*"))[:2], *sorted(_DATA.glob("additional/*.txt"))[:2]]
+
+    def test_parity_with_legacy(self):
+        for path in self.files:
+            with self.subTest(path=path.name):
+                self.assertEqual(_dump(OptoFile.read_opto_file(path, subject_id="s1")),
+                                 _dump(read_opto_file_legacy(path, subject_id="s1")))
+
+    def test_bytes_and_file_like(self):
+        expected = _dump(OptoFile.read_opto_file(_EXAMPLE, subject_id="s1"))
+        content = _EXAMPLE.read_bytes()
+        self.assertEqual(_dump(OptoFile.read_opto_file(content, subject_id="s1")), expected)
+        buffer = io.BytesIO(content)
+        self.assertEqual(_dump(OptoFile.read_opto_file(buffer, subject_id="s1")), expected)
+        gc.collect()
+        # The caller's stream is left open
+        self.assertFalse(buffer.closed)
+        self.assertEqual(_dump(OptoFile.read_opto_file(io.StringIO(content.decode("utf-8-sig")), subject_id="s1")), expected)
+
+    def test_typed_arrays(self):
+        header, arrays = OptoFile.parse_opto_file(_EXAMPLE)
+        self.assertEqual(header["device_sn"], "242320457XX")
+        self.assertEqual(arrays["pixel"].dtype, np.int64)
+        self.assertEqual(arrays["raw"].dtype, np.float64)
+        self.assertEqual(arrays["raman_shift"].shape, (2048, ))
+
+    def test_missing_data_header(self):
+        with self.assertRaises(ValueError):
+            OptoFile.parse_opto_file(b"Data Generated by Optosky\nFile Version;1.2\n")
+
+
+if __name__ == '__main__':
+    unittest.main()
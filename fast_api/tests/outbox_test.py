@@ -0,0 +1,169 @@
+import unittest
+import os
+os.environ.setdefault("ME_CONFIG_MONGODB_URL", "mongodb://localhost:27017")
+import asyncio
+from datetime import datetime, timedelta
+from typing import Any
+import httpx
+from src.api import Code, GlucoseRecord
+from src.outbox import Outbox, PENDING, SENT, FAILED
+from fake_mongo import FakeCollection
+
+
+class FakeClient:
+    def __init__(self):
+        self.sent: list[list[GlucoseRecord]] = []
+        # The exception raised for, or the error response to, a user_id
+        self.errors: dict[int, Any] = {}
+        # Called while a batch is being sent
+        self.during = None
+
+    async def post_glucose_many(self, records):
+        self.sent.append(records)
+        if self.during is not None:
+            await self.during()
+        return [self.errors.pop(record.user_id, {"status": 200, "message": "success"}) for record in records]
+
+
+def _error(status: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "http://stub/diabetesrecords")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(status, request=request))
+
+
+def _record(user_id: int, minute: int = 0) -> GlucoseRecord:
+    return GlucoseRecord(user_id=user_id, code=Code.PRE_LUNCH, value=100.0 + user_id, created_date=datetime(2025, 9, 15, 9, minute))
+
+
+class TestOutbox(unittest.TestCase):
+
+    def setUp(self):
+        self.collection = FakeCollection()
+        self.client = FakeClient()
+        self.outbox = Outbox(collection=self.collection, client=self.client, batch_size=3, backoff=10, max_attempts=3)
+
+    def test_enqueue_dedupe(self):
+        self.assertTrue(asyncio.run(self.outbox.enqueue(_record(1))))
+        self.assertFalse(asyncio.run(self.outbox.enqueue(_record(1))))
+        self.assertTrue(asyncio.run(self.outbox.enqueue(_record(1, minute=5))))
+        other = _record(1)
+        other.code = Code.POST_LUNCH
+        self.assertTrue(asyncio.run(self.outbox.enqueue(other)))
+        self.assertEqual(len(self.collection.docs), 3)
+        self.assertIn("1:2025-09-15 09:00:00:60", self.collection.docs)
+
+    def test_drain_in_batches(self):
+        for i in range(7):
+            asyncio.run(self.outbox.enqueue(_record(i)))
+        self.assertEqual(asyncio.run(self.outbox.drain()), 7)
+        self.assertEqual([len(batch) for batch in self.client.sent], [3, 3, 1])
+        self.assertTrue(all(doc["status"] == SENT and "token" not in doc for doc in self.collection.docs.values()))
+        sent = [record for batch in self.client.sent for record in batch]
+        self.assertEqual(sorted(record.user_id for record in sent), list(range(7)))
+        self.assertEqual(sent[0].created_date, datetime(2025, 9, 15, 9, 0))
+        # Nothing is sent twice
+        self.assertEqual(asyncio.run(self.outbox.drain()), 0)
+
+    def test_retry_and_failure(self):
+        for i in range(3):
+            asyncio.run(self.outbox.enqueue(_record(i)))
+        self.client.errors = {0: httpx.ConnectError("down"), 1: _error(400), 2: _error(503)}
+        self.assertEqual(asyncio.run(self.outbox.drain()), 3)
+        docs = [self.collection.docs[f"{i}:2025-09-15 09:00:00:60"] for i in range(3)]
+        self.assertEqual([doc["status"] for doc in docs], [PENDING, FAILED, PENDING])
+        self.assertEqual([doc["attempts"] for doc in docs], [1, 1, 1])
+        self.assertIn("ConnectError", docs[0]["error"])
+        # Not due before the backoff
+        self.assertGreater(docs[0]["next_attempt"], datetime.now() - timedelta(days=1))
+        self.assertEqual(asyncio.run(self.outbox.drain()), 0)
+
+        for doc in docs:
+            doc["next_attempt"] = datetime(2000, 1, 1)
+        self.assertEqual(asyncio.run(self.outbox.drain()), 2)
+        self.assertEqual([doc["status"] for doc in docs], [SENT, FAILED, SENT])
+
+    def test_error_response(self):
+        for i in range(2):
+            asyncio.run(self.outbox.enqueue(_record(i)))
+        # A 2xx HTTP response with an error status (or no status at all) is not sent
+        self.client.errors = {0: {"status": 500, "message": "database error"}, 1: {"message": "success"}}
+        self.assertEqual(asyncio.run(self.outbox.drain()), 2)
+        docs = [self.collection.docs[f"{i}:2025-09-15 09:00:00:60"] for i in range(2)]
+        self.assertEqual([(doc["status"], doc["attempts"]) for doc in docs], [(PENDING, 1), (PENDING, 1)])
+        self.assertEqual(docs[0]["error"], "database error")
+        self.assertEqual(docs[0]["response"], {"status": 500, "message": "database error"})
+
+        for attempt in range(2):
+            self.client.errors = {0: {"status": 500, "message": "database error"}}
+            for doc in docs:
+                doc["next_attempt"] = datetime(2000, 1, 1)
+            asyncio.run(self.outbox.drain())
+        self.assertEqual([(doc["status"], doc["attempts"]) for doc in docs], [(FAILED, 3), (SENT, 1)])
+        self.assertEqual(docs[1]["response"], {"status": 200, "message": "success"})
+
+    def test_max_attempts(self):
+        asyncio.run(self.outbox.enqueue(_record(0)))
+        doc = next(iter(self.collection.docs.values()))
+        for attempt in range(3):
+            self.client.errors = {0: _error(503)}
+            doc["next_attempt"] = datetime(2000, 1, 1)
+            asyncio.run(self.outbox.drain())
+        self.assertEqual((doc["status"], doc["attempts"]), (FAILED, 3))
+
+    def test_claim_is_exclusive(self):
+        for i in range(3):
+            asyncio.run(self.outbox.enqueue(_record(i)))
+        first = asyncio.run(self.outbox.claim())
+        self.assertEqual(len(first), 3)
+        # Leased: another worker gets nothing until the lease expires
+        self.assertEqual(asyncio.run(Outbox(collection=self.collection, client=self.client).claim()), [])
+
+    def test_lease_is_renewed(self):
+        for i in range(3):
+            asyncio.run(self.outbox.enqueue(_record(i)))
+        outbox = Outbox(collection=self.collection, client=self.client, lease=0.06)
+        other = Outbox(collection=self.collection, client=FakeClient(), lease=0.06)
+        claimed = []
+
+        async def during():
+            # The batch takes longer than the lease: still not claimable by another worker
+            await asyncio.sleep(0.2)
+            claimed.extend(await other.claim())
+
+        self.client.during = during
+        self.assertEqual(asyncio.run(outbox.drain_once()), 3)
+        self.assertEqual(claimed, [])
+        self.assertTrue(all(doc["status"] == SENT for doc in self.collection.docs.values()))
+
+    def test_lost_lease(self):
+        asyncio.run(self.outbox.enqueue(_record(0)))
+        doc = next(iter(self.collection.docs.values()))
+
+        async def during():
+            # The lease expired and another worker claimed the record
+            doc["token"] = "other"
+
+        self.client.during = during
+        self.client.errors = {0: _error(400)}
+        asyncio.run(self.outbox.drain_once())
+        # Left to the other worker
+        self.assertEqual((doc["status"], doc["token"], doc["attempts"]), (PENDING, "other", 0))
+
+    def test_worker(self):
+        async def main():
+            outbox = Outbox(collection=self.collection, client=self.client, interval=60)
+            outbox.start()
+            await outbox.enqueue(_record(1))
+            # `enqueue` wakes the worker up
+            for _ in range(100):
+                await asyncio.sleep(0.01)
+                if len(self.client.sent) > 0:
+                    break
+            await outbox.stop()
+        asyncio.run(main())
+        self.assertEqual(len(self.client.sent), 1)
+        self.assertEqual(self.collection.indexes, [([("status", 1), ("next_attempt", 1)], {})])
+        self.assertEqual(next(iter(self.collection.docs.values()))["status"], SENT)
+
+
+if __name__ == '__main__':
+    unittest.main()
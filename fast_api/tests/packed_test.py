@@ -0,0 +1,105 @@
+import unittest
+import os
+os.environ.setdefault("ME_CONFIG_MONGODB_URL", "mongodb://localhost:27017")
+import asyncio
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+import bson
+import numpy as np
+from src.db import Axis, OptoFile, PackedArray
+from src.db.packed import get_axis, register_axis
+from src.db.ingest import _parse_batch
+
+_EXAMPLE = Path("example/2509150914089 250mw 3000ms.txt")
+_ARRAYS = ["pixel", "raman_shift", "raw", "dark", "dark_subtracted", "baseline_subtracted"]
+
+
+class TestPackedArray(unittest.TestCase):
+
+    def test_roundtrip(self):
+        array = np.random.default_rng(0).normal(size=(3, 5))
+        for dtype in ["<f4", "<f8", ">f8"]:
+            packed = PackedArray.pack(array, dtype=dtype)
+            self.assertEqual(packed.shape, [3, 5])
+            self.assertTrue(packed.dtype.startswith("<"))
+            np.testing.assert_allclose(packed.unpack(), array, rtol=1e-6)
+        # Survives BSON as Binary
+        doc = bson.decode(bson.encode(PackedArray.pack(array).model_dump_doc()))
+        np.testing.assert_array_equal(PackedArray.model_validate_doc(doc).unpack(), array)
+
+    def test_axes_cache_is_bounded(self):
+        axes = [Axis.create("sn", pixel=np.arange(3), raman_shift=np.arange(3) + i) for i in range(3)]
+        with patch("src.db.packed._AXES_CACHE_SIZE", 2):
+            register_axis(axes[0])
+            register_axis(axes[1])
+            get_axis(axes[0].key)
+            register_axis(axes[2])
+        # The least recently used one is dropped
+        self.assertIs(get_axis(axes[0].key), axes[0])
+        self.assertIs(get_axis(axes[2].key), axes[2])
+        with self.assertRaises(KeyError):
+            get_axis(axes[1].key)
+
+
+class TestPackedOptoFile(unittest.TestCase):
+
+    def test_pack_float64(self):
+        optofile = OptoFile.read_opto_file(_EXAMPLE, subject_id="s1")
+        expected = {name: optofile.array(name) for name in _ARRAYS}
+        axis = optofile.pack("float64")
+        self.assertTrue(optofile.is_packed)
+        self.assertIsNone(optofile.raw)
+        self.assertTrue(axis.key.startswith(optofile.device_sn))
+        self.assertIs(get_axis(optofile.axis_key), axis)
+        for name in _ARRAYS:
+            np.testing.assert_array_equal(optofile.array(name), expected[name])
+        self.assertEqual(optofile.array("pixel").dtype, np.int64)
+
+        optofile.unpack()
+        self.assertFalse(optofile.is_packed)
+        self.assertIsNone(optofile.axis_key)
+        for name in _ARRAYS:
+            np.testing.assert_array_equal(getattr(optofile, name), expected[name])
+
+    def test_pack_float32(self):
+        optofile = OptoFile.read_opto_file(_EXAMPLE, subject_id="s1")
+        expected = {name: optofile.array(name) for name in _ARRAYS}
+        size = len(bson.encode(optofile.model_dump_doc()))
+        optofile.pack("float32")
+        self.assertLess(len(bson.encode(optofile.model_dump_doc())), size / 4)
+        for name in _ARRAYS:
+            np.testing.assert_allclose(optofile.array(name), expected[name], rtol=1e-6)
+        # The axis is not degraded
+        np.testing.assert_array_equal(optofile.array("raman_shift"), expected["raman_shift"])
+
+    def test_save_packs_a_copy(self):
+        optofile = OptoFile.read_opto_file(_EXAMPLE, subject_id="s1")
+        raw = list(optofile.raw)  # type: ignore
+        with patch("src.db.optofile._STORAGE", "float32"), \
+             patch("src.db.optofile.engine.save", AsyncMock(side_effect=lambda doc: doc)) as save, \
+             patch("src.db.optofile.save_axes", AsyncMock()):
+            saved = asyncio.run(optofile.save())
+        save.assert_awaited_once_with(saved)
+        self.assertTrue(saved.is_packed)
+        self.assertEqual(saved.id, optofile.id)
+        # The caller's instance keeps its lists
+        self.assertFalse(optofile.is_packed)
+        self.assertEqual(optofile.raw, raw)
+
+    def test_same_axis(self):
+        files = sorted(Path("../data/finger/s1").glob("25*.txt"))[:3]
+        docs, axes, errors = _parse_batch(files, storage="float32")
+        self.assertEqual((len(docs), len(axes), len(errors)), (3, 1, 0))
+        self.assertEqual({doc["axis_key"] for doc in docs}, set(axes))
+        for doc in docs:
+            self.assertIsNone(doc["raw"])
+            self.assertIsInstance(doc["packed"]["raw"]["data"], bytes)
+
+    def test_array_unknown(self):
+        optofile = OptoFile.read_opto_file(_EXAMPLE, subject_id="s1")
+        with self.assertRaises(KeyError):
+            optofile.array("subject_id")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+import asyncio
+import os
+os.environ.setdefault("RPC_SERVER", "backend_dotnet:5283")
+import numpy as np
+from rampy.spectranization import despiking
+from src.device import create_sample
+from src.inference import registry
+from src.spectra import CompiledPipeline
+
+_EXAMPLE = "example/2509150914089 250mw 3000ms.txt"
+_TOLERANCE = 1e-9
+
+
+class TestCompiledPipeline(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        data = np.loadtxt(_EXAMPLE, delimiter=";", skiprows=15, encoding="utf-8-sig")
+        cls.raman_shift = registry.raman_shift()
+        rng = np.random.default_rng(24)
+        spiked = data[:, 5].copy()
+        spiked[rng.integers(0, spiked.shape[0], 8)] += 5000
+        cls.spectra = np.vstack([data[:, 5], data[:, 4], spiked])
+        cls.pipeline = CompiledPipeline.for_axis(cls.raman_shift)
+
+    def test_matches_create_sample(self):
+        features = self.pipeline(self.spectra)
+        for spectrum, row in zip(self.spectra, features):
+            sample = asyncio.run(create_sample(spectrum))
+            np.testing.assert_array_equal(sample.x, self.pipeline.x)
+            np.testing.assert_allclose(row, sample.y, rtol=0, atol=_TOLERANCE)
+
+    def test_single_spectrum(self):
+        feature = self.pipeline(self.spectra[0])
+        self.assertEqual(feature.shape, self.pipeline.x.shape)
+        np.testing.assert_allclose(feature, self.pipeline(self.spectra)[0], rtol=0, atol=_TOLERANCE)
+
+    def test_despike_matches_rampy(self):
+        despiked = self.pipeline.despike(self.spectra)
+        for spectrum, row in zip(self.spectra, despiked):
+            expected = despiking(self.raman_shift, spectrum, neigh=10, threshold=5)
+            np.testing.assert_allclose(row, expected, rtol=1e-12)
+
+    def test_for_axis_is_cached(self):
+        self.assertIs(CompiledPipeline.for_axis(self.raman_shift.copy()), self.pipeline)
+        self.assertIsNot(CompiledPipeline.for_axis(self.raman_shift, smoothing_window=30), self.pipeline)
+
+    def test_shape_mismatch(self):
+        with self.assertRaises(ValueError):
+            self.pipeline(self.spectra[:, :100])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+import os
+os.environ.setdefault("ME_CONFIG_MONGODB_URL", "mongodb://localhost:27017")
+import asyncio
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+from src.db import OptoFile, SpectraMatrix, fetch_matrix
+from src.db.query import build_projection, build_query
+from fake_mongo import FakeCollection
+
+_FILES = sorted(Path("../data/finger/s1").glob("25*.txt"))[:5]
+
+
+def _docs(storage: str) -> list[dict]:
+    docs = []
+    for f in _FILES:
+        optofile = OptoFile.read_opto_file(f, subject_id="s1")
+        if storage != "list":
+            optofile.pack(storage)
+        docs.append(optofile.model_dump_doc())
+    return docs
+
+
+class TestQuery(unittest.TestCase):
+
+    def test_build_query(self):
+        self.assertEqual(build_query(), {})
+        query = build_query(subject_ids=["s1"], start=datetime(2025, 9, 1), end=datetime(2025, 10, 1), query={"is_interpolated": False})
+        self.assertEqual(query, {"is_interpolated": False, "subject_id": {"$in": ["s1"]},
+                                 "created": {"$gte": datetime(2025, 9, 1), "$lt": datetime(2025, 10, 1)}})
+        self.assertEqual(build_query(start=datetime(2025, 9, 1)), {"created": {"$gte": datetime(2025, 9, 1)}})
+
+    def test_build_projection(self):
+        projection = build_projection(["subject_id"], arrays=["baseline_subtracted", "raman_shift"])
+        self.assertEqual(projection, {"subject_id": 1, "baseline_subtracted": 1, "axis_key": 1, "packed.baseline_subtracted": 1,
+                                      "raman_shift": 1, "_id": 0})
+        with self.assertRaises(KeyError):
+            build_projection([], arrays=["subject_id"])
+
+    def test_from_docs(self):
+        expected = np.stack([OptoFile.read_opto_file(f, subject_id="s1").array("baseline_subtracted") for f in _FILES])
+        for storage in ["list", "float64", "float32"]:
+            matrix = SpectraMatrix.from_docs(_docs(storage), fields=["subject_id", "created", "glucose_target"])
+            self.assertEqual(matrix.X.shape, (len(_FILES), 2048))
+            np.testing.assert_allclose(matrix.X, expected, rtol=1e-6)
+            self.assertEqual(matrix.raman_shift.shape, (2048,))
+            self.assertEqual(matrix.meta["created"].dtype, np.dtype("datetime64[ms]"))
+            self.assertEqual(list(matrix.meta["subject_id"]), ["s1"] * len(_FILES))
+
+    def test_several_axes(self):
+        docs = _docs("list")
+        docs[1]["raman_shift"] = [v + 1 for v in docs[1]["raman_shift"]]
+        matrix = SpectraMatrix.from_docs(docs)
+        self.assertEqual(len(matrix.axes), 2)
+        self.assertEqual(list(matrix.axis_index), [0, 1, 0, 0, 0])
+        with self.assertRaises(ValueError):
+            matrix.raman_shift
+
+    def test_fetch_matrix(self):
+        for storage in ["list", "float32"]:
+            docs = _docs(storage)
+            collection = FakeCollection(docs)
+            matrix = asyncio.run(fetch_matrix(subject_ids=["s1"], batch_size=2, collection=collection))
+            expected = SpectraMatrix.from_docs(docs, fields=["subject_id", "created", "glucose_target"])
+            np.testing.assert_array_equal(matrix.X, expected.X)
+            np.testing.assert_array_equal(matrix.meta["created"], expected.meta["created"])
+            self.assertEqual(len(matrix.axes), 1)
+            self.assertEqual(list(matrix.axis_index), [0] * len(docs))
+            # Only the requested fields are read
+            query, projection = collection.finds[0]
+            self.assertEqual(query, {"subject_id": {"$in": ["s1"]}})
+            self.assertNotIn("raw", projection)
+
+    def test_fetch_matrix_empty(self):
+        matrix = asyncio.run(fetch_matrix(collection=FakeCollection([])))
+        self.assertEqual(len(matrix), 0)
+        self.assertEqual(len(matrix.meta["subject_id"]), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
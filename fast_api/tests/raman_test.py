@@ -0,0 +1,134 @@
+import unittest
+import asyncio
+import os
+os.environ.setdefault("RPC_SERVER", "backend_dotnet:5283")
+os.environ.setdefault("ME_CONFIG_MONGODB_URL", "mongodb://localhost:27017")
+# No outbox worker: there is no Mongo to drain
+os.environ.setdefault("OUTBOX_INTERVAL", "0")
+from unittest import mock
+from pathlib import Path
+import numpy as np
+from bson import ObjectId
+from fastapi.testclient import TestClient
+from pymongo.errors import BulkWriteError
+from src.db import OptoFile, engine
+from src.main import app
+from src.device import predict
+
+_EXAMPLE = "example/2509150914089 250mw 3000ms.txt"
+
+
+class TestPredictBatch(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        data = np.loadtxt(_EXAMPLE, delimiter=";", skiprows=15, encoding="utf-8-sig")
+        cls.spectra = [data[:, 5], data[:, 4], data[:, 5] * 1.1]
+
+    def test_matches_single_predict(self):
+        with TestClient(app) as client:
+            response = client.post("/api/raman/predict/batch", json={
+                "spectra": [spectrum.tolist() for spectrum in self.spectra],
+                "model": "LinearRegression",
+            })
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["model"], "LinearRegression")
+        expected = [asyncio.run(predict(spectrum, model_name="LinearRegression")) for spectrum in self.spectra]
+        np.testing.assert_allclose(body["spectra"], expected)
+
+    def test_unknown_model(self):
+        with TestClient(app) as client:
+            response = client.post("/api/raman/predict/batch", json={"spectra": [self.spectra[0].tolist()], "model": "NotAModel"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_empty_request(self):
+        with TestClient(app) as client:
+            response = client.post("/api/raman/predict/batch", json={})
+        self.assertEqual(response.status_code, 422)
+
+    def test_invalid_spectra(self):
+        spectrum = self.spectra[0].tolist()
+        with TestClient(app) as client:
+            for spectra in [[spectrum, spectrum[:100]], [spectrum[:-1]]]:
+                with self.subTest(lengths=[len(s) for s in spectra]):
+                    response = client.post("/api/raman/predict/batch", json={"spectra": spectra})
+                    self.assertEqual(response.status_code, 422)
+            # A flat spectrum has no min-max range
+            response = client.post("/api/raman/predict/batch", json={"spectra": [[100.0] * len(spectrum)], "model": "LinearRegression"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(np.isfinite(response.json()["spectra"]).all())
+
+    def test_save_predictions(self):
+        optofiles = [OptoFile.read_opto_file(f, subject_id="s1") for f in sorted(Path("../data/finger/s1").glob("25*.txt"))[:3]]
+        collection = mock.Mock(bulk_write=mock.AsyncMock())
+        with mock.patch.object(OptoFile, "fetch_all", mock.AsyncMock(return_value=optofiles)), \
+             mock.patch.object(engine, "get_collection", return_value=collection), TestClient(app) as client:
+            response = client.post("/api/raman/predict/batch", json={"subject_ids": ["s1"], "save": True})
+        self.assertEqual(response.status_code, 200)
+        # One bulk_write for every prediction
+        collection.bulk_write.assert_awaited_once()
+        requests = collection.bulk_write.await_args.args[0]
+        self.assertEqual([request._filter for request in requests], [{"_id": optofile.id} for optofile in optofiles])
+        self.assertEqual([request._doc["$set"]["glucose_predict"] for request in requests],
+                         [prediction["glucose"] for prediction in response.json()["optofiles"]])
+
+
+class FakeRecords:
+    # `blood_glucose.records` of motor: coroutines only
+    def __init__(self, fail: list[int] = []):
+        self.docs: list[dict] = []
+        self.fail = fail
+
+    async def insert_one(self, doc):
+        self.docs.append(doc)
+
+        class Result:
+            inserted_id = ObjectId()
+        return Result()
+
+    async def insert_many(self, docs, ordered=True):
+        if len(self.fail) > 0:
+            self.docs += [doc for i, doc in enumerate(docs) if i not in self.fail]
+            raise BulkWriteError({"nInserted": len(docs) - len(self.fail),
+                                  "writeErrors": [{"index": i, "code": 11000} for i in self.fail]})
+        self.docs += docs
+
+        class Result:
+            inserted_ids = [ObjectId() for _ in docs]
+        return Result()
+
+
+class TestSave(unittest.TestCase):
+    def _record(self, i: int) -> dict:
+        return {"name": f"s{i}", "timestamp": "2025-09-15T09:14:08", "meal": "lunch", "before_after": "before",
+                "glucose": 100 + i, "spectrum": {"raw": [1.0, 2.0, 3.0]}}
+
+    def test_save(self):
+        records = FakeRecords()
+        with mock.patch("src.raman.collection", records), TestClient(app) as client:
+            response = client.post("/api/raman/save", json=self._record(0))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "success")
+        self.assertEqual(records.docs[0]["spectrum"], {"raw": [1.0, 2.0, 3.0]})
+
+    def test_save_bulk(self):
+        records = FakeRecords()
+        with mock.patch("src.raman.collection", records), TestClient(app) as client:
+            response = client.post("/api/raman/save/bulk", json=[self._record(i) for i in range(30)])
+            self.assertEqual(client.post("/api/raman/save/bulk", json=[]).status_code, 422)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body["count"], len(body["ids"])), (30, 30))
+        self.assertEqual([doc["glucose"] for doc in records.docs], [100 + i for i in range(30)])
+
+    def test_save_bulk_partial_failure(self):
+        records = FakeRecords(fail=[3])
+        with mock.patch("src.raman.collection", records), TestClient(app) as client:
+            response = client.post("/api/raman/save/bulk", json=[self._record(i) for i in range(5)])
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.json()["detail"]["failed"], [3])
+        self.assertEqual(len(records.docs), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
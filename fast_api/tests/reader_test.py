@@ -0,0 +1,92 @@
+import unittest
+import os
+import tempfile
+from pathlib import Path
+from unittest import mock
+import numpy as np
+from src.spectra import SpectrumBatch
+from src.spectra.sample import read_txt
+from src.spectra.reader import read_dir
+
+
+def _write(directory: Path, name: str, seed: int, n: int = 1024) -> Path:
+    # Same layout as the Horiba LS6 exports: two columns, decreasing Raman Shift.
+    rng = np.random.default_rng(seed)
+    x = np.linspace(2000.3, 199.6, n)
+    y = 1000 + 50 * np.exp(-((x - 1000) / 20) ** 2) + rng.normal(scale=5, size=n)
+    path = directory / name
+    np.savetxt(path, np.column_stack([x, y]), delimiter="\t", fmt="%.6f")
+    return path
+
+
+class TestReadDir(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tmp.name, "ls6")
+        self.directory.mkdir()
+        self.paths = [
+            _write(self.directory, f"s{i}_5x_0-71_600_785 nm_60 s_{i + 1}_2024_03_19_10_30_{i:02d}_01.txt", seed=i)
+            for i in range(6)
+        ]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_matches_read_txt(self):
+        for processes in [False, True]:
+            samples = read_dir(self.directory, workers=2, processes=processes)
+            self.assertEqual(len(samples), len(self.paths))
+            for sample, path in zip(samples, self.paths):
+                expected = read_txt(path)
+                np.testing.assert_array_equal(sample.x, expected.x)
+                np.testing.assert_array_equal(sample.y, expected.y)
+                self.assertEqual(sample.paths, {path})
+                for key in ["name", "lens", "power", "grating", "laser", "exposure", "accumulation", "date"]:
+                    self.assertEqual(getattr(sample, key), getattr(expected, key))
+
+    def test_batch(self):
+        batch = read_dir(self.directory, as_batch=True)
+        self.assertIsInstance(batch, SpectrumBatch)
+        self.assertEqual(batch.shape[0], len(self.paths))
+        self.assertEqual(list(batch.meta["name"]), [f"s{i}" for i in range(6)])
+        self.assertEqual(list(batch.meta["accumulation"]), list(range(1, 7)))
+
+    def test_name_format_is_checked_first(self):
+        _write(self.directory, "bad_name.txt", seed=9)
+        with mock.patch("src.spectra.reader._load_raman_from_txt") as load:
+            with self.assertRaises(ValueError) as context:
+                read_dir(self.directory)
+        load.assert_not_called()
+        self.assertIn("bad_name.txt", str(context.exception))
+        # The pattern can leave it out
+        self.assertEqual(len(read_dir(self.directory, pattern="s*.txt")), len(self.paths))
+
+    def test_cache(self):
+        cache = Path(self.tmp.name, "cache", "ls6.npz")
+        expected = read_dir(self.directory, interpolate=False, cache=cache)
+        self.assertTrue(cache.exists())
+        with mock.patch("src.spectra.reader._load_raman_from_txt") as load:
+            samples = read_dir(self.directory, interpolate=False, cache=cache)
+        load.assert_not_called()
+        for sample, other in zip(samples, expected):
+            np.testing.assert_array_equal(sample.x, other.x)
+            np.testing.assert_array_equal(sample.y, other.y)
+            self.assertEqual(sample.date, other.date)
+
+        # A modified file invalidates the cache
+        _write(self.directory, self.paths[2].name, seed=99)
+        os.utime(self.paths[2], ns=(0, 10**18))
+        samples = read_dir(self.directory, interpolate=False, cache=cache)
+        np.testing.assert_array_equal(samples[2].y, read_txt(self.paths[2], interpolate=False).y)
+        # And an added one
+        _write(self.directory, "s9_5x_0-71_600_785 nm_60 s_1_2024_03_19_10_31_00_01.txt", seed=9)
+        self.assertEqual(len(read_dir(self.directory, cache=cache)), len(self.paths) + 1)
+
+    def test_missing_directory(self):
+        with self.assertRaises(FileNotFoundError):
+            read_dir(Path(self.tmp.name, "missing"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+import os
+os.environ.setdefault("ME_CONFIG_MONGODB_URL", "mongodb://localhost:27017")
+import asyncio
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from src.db.reference import ReferenceCurves, label_optofiles
+from fake_mongo import FakeCollection
+
+_DATA = "../data"
+
+
+class TestReferenceCurves(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.curves = ReferenceCurves.load(_DATA)
+
+    def test_load(self):
+        self.assertEqual(len(self.curves.subject_ids), 15)
+        df = pd.read_csv(f"{_DATA}/s1.csv", parse_dates=["created"])
+        t, g = self.curves.series["s1"]
+        np.testing.assert_array_equal(t, df.created.to_numpy().astype("datetime64[s]").astype(np.int64))
+        np.testing.assert_array_equal(g, df.glucose.to_numpy())
+
+    def test_nearest_prick(self):
+        # Same as `map_glucose_target` of the 0-db notebook
+        df = pd.read_csv(f"{_DATA}/s2.csv", index_col="created", parse_dates=["created"])
+        created = [df.index[0] + timedelta(seconds=s) for s in range(-200, 40 * 60, 37)]
+        labels = self.curves.label(["s2"] * len(created), created)
+        for i, c in enumerate(created):
+            diff = df.index - c
+            position = np.abs(diff.total_seconds()).argmin()
+            if abs(diff[position]) <= timedelta(minutes=3):
+                self.assertFalse(labels["is_interpolated"][i])
+                self.assertEqual(labels["glucose_target"][i], df.glucose.iloc[position])
+                self.assertEqual(labels["prick_time"][i], np.datetime64(df.index[position], "s"))
+            else:
+                self.assertTrue(np.isnat(labels["prick_time"][i]))
+        # Before the first prick, out of tolerance
+        self.assertFalse(labels["labelled"][0])
+
+    def test_interpolation(self):
+        df = pd.read_csv(f"{_DATA}/s3.csv", parse_dates=["created"])
+        seconds = df.created.to_numpy().astype("datetime64[s]").astype(np.int64)
+        query = np.arange(seconds[0] + 240, seconds[-1] - 240, 60)
+        query = query[np.min(np.abs(query[:, None] - seconds[None, :]), axis=1) > 180]
+        created = query.astype("datetime64[s]")
+        labels = self.curves.label(np.array(["s3"] * len(query)), created)
+        self.assertTrue(labels["is_interpolated"].all())
+        # The notebook's polynomial interpolation of order 2, on time
+        series = pd.Series(df.glucose.to_numpy(dtype=float), index=seconds)
+        series = series.reindex(np.union1d(seconds, query)).interpolate(method="polynomial", order=2)
+        np.testing.assert_allclose(labels["glucose_target"], series.loc[query].to_numpy(), rtol=1e-9)
+
+        linear = ReferenceCurves.load(_DATA, kind="linear").label(["s3"] * len(query), created)
+        np.testing.assert_allclose(linear["glucose_target"], np.interp(query, seconds, df.glucose.to_numpy()))
+
+    def test_mixed_subjects(self):
+        t1, g1 = self.curves.series["s1"]
+        t5, g5 = self.curves.series["s5"]
+        subject_ids = ["s5", "s1", "unknown", "s5"]
+        created = np.array([t5[2], t1[0], t1[0], t5[-1] + 3600], dtype="datetime64[s]")
+        labels = self.curves.label(subject_ids, created)
+        np.testing.assert_array_equal(labels["labelled"], [True, True, False, False])
+        self.assertEqual(labels["glucose_target"][0], g5[2])
+        self.assertEqual(labels["glucose_target"][1], g1[0])
+
+    def test_label_optofiles(self):
+        t, g = self.curves.series["s4"]
+        start = t[0].astype("datetime64[s]").astype(datetime)
+        docs = [{"_id": i, "subject_id": "s4", "created": start + timedelta(minutes=2 * i)} for i in range(10)]
+        docs.append({"_id": 99, "subject_id": "s99", "created": start})
+        collection = FakeCollection(docs)
+        count = asyncio.run(label_optofiles(self.curves, batch_size=4, collection=collection))
+        self.assertEqual(count, 10)
+        self.assertEqual(collection.finds[0][0]["glucose_target"], None)
+        update = collection.requests[0]._doc["$set"]
+        self.assertEqual(update, {"glucose_target": g[0], "is_interpolated": False, "prick_time": start})
+        self.assertIsInstance(collection.requests[1]._doc["$set"]["glucose_target"], float)
+
+        asyncio.run(label_optofiles(self.curves, overwrite=True, collection=collection))
+        self.assertNotIn("glucose_target", collection.finds[-1][0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+import os
+import shutil
+import tempfile
+from pathlib import Path
+import numpy as np
+from src.inference import ModelRegistry
+
+_MODEL_DIR = Path("models")
+
+
+class TestModelRegistry(unittest.TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        for name in ["ramanshift", "LinearRegression", "LinearRegression_pca", "MLPRegressor", "MLPRegressor_pca"]:
+            shutil.copy(_MODEL_DIR.joinpath(name), self.tmp.joinpath(name))
+        self.registry = ModelRegistry(model_dir=self.tmp, default="LinearRegression")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_names(self):
+        self.assertEqual(self.registry.names, ["LinearRegression", "MLPRegressor"])
+
+    def test_get_is_cached(self):
+        self.registry.load()
+        self.assertIs(self.registry.get(), self.registry.get("LinearRegression"))
+        self.assertEqual(self.registry.raman_shift().shape, (2048, ))
+
+    def test_reload_on_mtime_change(self):
+        first = self.registry.get("MLPRegressor")
+        path = self.tmp.joinpath("MLPRegressor")
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        second = self.registry.get("MLPRegressor")
+        self.assertIsNot(first, second)
+        self.assertIs(second, self.registry.get("MLPRegressor"))
+
+    def test_unknown_model(self):
+        with self.assertRaises(KeyError):
+            self.registry.get("NotAModel")
+
+    def test_name_outside_model_dir(self):
+        # A pair of pickles next to the model directory: never loaded through a path-like name
+        outside = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, outside)
+        for name in ["Other", "Other_pca"]:
+            shutil.copy(_MODEL_DIR.joinpath("LinearRegression" + name[5:]), outside.joinpath(name))
+        for name in [outside.joinpath("Other").as_posix(), f"../{outside.name}/Other", "ramanshift", "LinearRegression_pca"]:
+            with self.subTest(name=name), self.assertRaises(KeyError):
+                self.registry.get(name)
+
+    def test_predict(self):
+        model = self.registry.get()
+        X = np.random.default_rng(0).random((3, model.pca.n_features_in_))
+        self.assertEqual(model.predict(X).shape, (3, ))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+import unittest
+from copy import deepcopy
+from functools import reduce
+from pathlib import Path
+import numpy as np
+from scipy.interpolate import CubicSpline  # type: ignore
+from src.spectra import Sample
+from src.spectra.sample import accumulate
+
+
+def _sample(seed: int, accumulation: int = 1, exposure: int = 3) -> Sample:
+    rng = np.random.default_rng(seed)
+    x = np.linspace(200, 2000, 500)
+    sample = Sample(x=x, y=1000 + rng.normal(scale=10, size=x.shape), interpolate=False)
+    sample.accumulation = accumulation
+    sample.exposure = exposure
+    sample.paths = {Path(f"{seed}.txt")}
+    return sample
+
+
+def _or_legacy(a: Sample, b: Sample) -> Sample:
+    # The deepcopy-based `|`, kept as the oracle.
+    new_sample = deepcopy(a)
+    new_sample.y = (a.accumulation * a.y + b.accumulation * b.y) / (a.accumulation + b.accumulation)
+    new_sample.accumulation = a.accumulation + b.accumulation
+    new_sample.paths = new_sample.paths.union(b.paths)
+    return new_sample
+
+
+class TestSample(unittest.TestCase):
+
+    def test_original_data_is_shared(self):
+        y = np.arange(10, dtype=np.float64)
+        sample = Sample(x=np.arange(10, dtype=np.float64), y=y, interpolate=False)
+        # A copy of the input, shared by reset_data until `y` is handed out
+        y[0] = 100
+        self.assertEqual(sample._y[0], 0)
+        self.assertIs(sample._current_y, sample._y)
+        # `y` is writable and writing to it leaves the original untouched
+        sample.y[0] = 50
+        self.assertEqual(sample._y[0], 0)
+        sample.normalized()
+        sample.reset_data()
+        self.assertIs(sample._current_y, sample._y)
+        sample.y[1] = 50
+        sample.reset_data()
+        np.testing.assert_array_equal(sample.y, np.arange(10))
+
+    def test_copy_on_write(self):
+        sample = _sample(0)
+        sample.remove_spike(auto=False, spike_regions=[np.arange(100, 104)])
+        self.assertFalse(np.shares_memory(sample.y, sample._y))
+        # The original is untouched
+        np.testing.assert_array_equal(sample._y, _sample(0).y)
+
+        other = sample.copy()
+        self.assertIs(other._current_y, sample._current_y)
+        other += 1
+        self.assertFalse(np.shares_memory(other.y, sample.y))
+        np.testing.assert_array_equal(other.y, sample.y + 1)
+
+        # Both copies hand out arrays of their own
+        other = sample.copy()
+        other.y[0] = -1
+        self.assertNotEqual(sample.y[0], -1)
+        self.assertFalse(np.shares_memory(other.x, sample.x))
+
+    def test_operators_do_not_modify_operands(self):
+        a, b = _sample(1, accumulation=2), _sample(2, accumulation=3)
+        ya, yb = a.y.copy(), b.y.copy()
+        c = a | b
+        d = a + b
+        e = a * 2.0
+        np.testing.assert_array_equal(a.y, ya)
+        np.testing.assert_array_equal(b.y, yb)
+        self.assertEqual((a.accumulation, a.exposure, a.paths), (2, 3, {Path("1.txt")}))
+        np.testing.assert_array_equal(c.y, _or_legacy(a, b).y)
+        self.assertEqual((c.accumulation, c.paths), (5, {Path("1.txt"), Path("2.txt")}))
+        np.testing.assert_array_equal(d.y, ya + yb)
+        self.assertEqual(d.exposure, 6)
+        np.testing.assert_array_equal(e.y, ya * 2.0)
+        # The operands stay writable
+        a.y[0] = 0
+        b.x[0] = 0
+        self.assertNotEqual(c.y[0], 0)
+        self.assertNotEqual(d.y[0], 0)
+
+    def test_inplace_operators(self):
+        a, b = _sample(1, accumulation=2), _sample(2, accumulation=3)
+        expected = _or_legacy(a, b)
+        a_id = id(a)
+        a |= b
+        self.assertEqual(id(a), a_id)
+        np.testing.assert_array_equal(a.y, expected.y)
+        self.assertEqual(a.accumulation, 5)
+        a *= 0.5
+        np.testing.assert_array_equal(a.y, expected.y * 0.5)
+        with self.assertRaises(TypeError):
+            a *= 2
+
+    def test_spline_is_cached(self):
+        sample = _sample(3)
+        shifts = np.arange(905, 915)
+        np.testing.assert_array_equal(sample.at(shifts), CubicSpline(sample.x, sample.y, bc_type="natural")(shifts))
+        spline = sample.spline
+        sample.at(1060.0)
+        self.assertIs(sample.spline, spline)
+        # The copy shares the data, so the spline
+        self.assertIs(sample.copy().spline, spline)
+        # Reading `x`/`y` (even when it copies a shared array) keeps the spline, setting them drops it
+        sample.x, sample.y
+        self.assertIs(sample.spline, spline)
+        y = sample.y
+        y[0] += 1
+        sample.y = y
+        self.assertIsNot(sample.spline, spline)
+        for change in [lambda s: s.normalized(), lambda s: s.remove_spike(auto=False, spike_regions=[np.arange(10, 14)]),
+                       lambda s: s.extract_range(300, 1000), lambda s: s.__iadd__(1)]:
+            spline = sample.spline
+            change(sample)
+            self.assertIsNot(sample.spline, spline)
+            np.testing.assert_array_equal(sample.at(shifts), CubicSpline(sample.x, sample.y, bc_type="natural")(shifts))
+
+    def test_interpolate(self):
+        sample = _sample(4)
+        expected = CubicSpline(sample.x, sample.y, bc_type="natural")(np.arange(200, 2001))
+        sample.interpolate(step=1)
+        np.testing.assert_array_equal(sample.x, np.arange(200, 2001))
+        np.testing.assert_allclose(sample.y, expected, rtol=1e-12)
+
+    def test_accumulate(self):
+        samples = [_sample(i, accumulation=i % 3 + 1) for i in range(20)]
+        expected = reduce(_or_legacy, samples)
+        result = accumulate(samples)
+        np.testing.assert_allclose(result.y, expected.y, rtol=1e-12)
+        self.assertEqual(result.accumulation, expected.accumulation)
+        self.assertEqual(result.paths, expected.paths)
+        # The inputs are untouched
+        np.testing.assert_array_equal(samples[0].y, _sample(0, accumulation=1).y)
+        self.assertIs(accumulate(samples[:1]), samples[0])
+
+    def test_accumulate_errors(self):
+        with self.assertRaises(ValueError):
+            accumulate([_sample(0), _sample(1, exposure=5)])
+        other = _sample(1)
+        other.extract_range(300, 1000)
+        with self.assertRaises(ValueError):
+            accumulate([_sample(0), other])
+        with self.assertRaises(ValueError):
+            accumulate([])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+import unittest
+import os
+os.environ.setdefault("ME_CONFIG_MONGODB_URL", "mongodb://localhost:27017")
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+from rampy import baseline as rbaseline  # type: ignore
+from src.db import OptoFile
+from src.spectra import Sample, SpectrumBatch
+from src.spectra.interpolation import SplineOperator
+
+_EXAMPLE = Path("example/2509150914089 250mw 3000ms.txt")
+_TOLERANCE = 1e-9
+
+
+class TestSpectrumBatch(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.optofile = OptoFile.read_opto_file(_EXAMPLE, subject_id="s1")
+        cls.x = cls.optofile.array("raman_shift")
+        rng = np.random.default_rng(17)
+        cls.Y = cls.optofile.array("raw") + rng.normal(scale=20, size=(5, cls.x.shape[0]))
+        cls.Y[2, rng.integers(0, cls.x.shape[0], 6)] += 5000
+
+    def _pair(self) -> tuple[SpectrumBatch, list[Sample]]:
+        return SpectrumBatch(self.x, self.Y), [Sample(x=self.x, y=y, interpolate=False) for y in self.Y]
+
+    def _assert_same(self, batch: SpectrumBatch, samples: list[Sample]):
+        for row, sample in zip(batch.y, samples):
+            np.testing.assert_array_equal(batch.x, sample.x)
+            np.testing.assert_allclose(row, sample.y, rtol=0, atol=_TOLERANCE * np.abs(sample.y).max())
+
+    def test_matches_sample(self):
+        steps = [
+            ("despike", {"window_length": 10, "threshold": 5}),
+            ("interpolate", {"step": 1}),
+            ("extract_range", {"low": 750, "high": 1650}),
+            ("smoothing", {"window_length": 60, "polyorder": 1}),
+            ("butter_lowpass_filter", {"normal_cutoff": 0.2}),
+            ("butter_highpass_filter", {"normal_cutoff": 0.001}),
+            ("normalized", {"method": "zscore"}),
+            ("normalized", {"method": "minmax"}),
+        ]
+        batch, samples = self._pair()
+        for method, kwargs in steps:
+            getattr(batch, method)(**kwargs)
+            for sample in samples:
+                getattr(sample, method)(**kwargs)
+            with self.subTest(method=method):
+                self._assert_same(batch, samples)
+
+    def test_at(self):
+        batch, samples = self._pair()
+        shifts = np.arange(1050, 1070)
+        values = batch.at(shifts)
+        self.assertEqual(values.shape, (len(batch), shifts.shape[0]))
+        for row, sample in zip(values, samples):
+            np.testing.assert_allclose(row, sample.at(shifts), rtol=1e-12)
+        np.testing.assert_allclose(batch.at(1060.5), [sample.at(1060.5) for sample in samples], rtol=1e-12)
+        # One-off query points do not fill the `SplineOperator` cache
+        cached = len(SplineOperator._cache)
+        batch.at(shifts + 0.25)
+        self.assertEqual(len(SplineOperator._cache), cached)
+
+    def test_find_spike(self):
+        batch, samples = self._pair()
+        regions = batch.find_spike()
+        self.assertGreater(len(regions[2]), 0)
+        for found, sample in zip(regions, samples):
+            expected = sample.find_spike()
+            self.assertEqual(len(found), len(expected))
+            for a, b in zip(found, expected):
+                np.testing.assert_array_equal(a, b)
+
+    def test_baseline_matches_rampy(self):
+        batch = SpectrumBatch(self.x, self.Y)
+        batch.interpolate(step=1)
+        batch.extract_range(750, 1650)
+        roi = [[905, 915], [1050, 1070], [1100, 1150], [1400, 1460]]
+        y = batch.y.copy()
+        fitted = batch.baseline(order=2, roi=roi)
+        for row, corrected, base in zip(y, batch.y, fitted):
+            expected, expected_base = rbaseline(batch.x, row, roi=roi, method="poly", polynomial_order=2)
+            np.testing.assert_allclose(base, expected_base.ravel(), rtol=1e-9)
+            np.testing.assert_allclose(corrected, expected.ravel(), rtol=1e-9)
+        # `test` keeps y
+        np.testing.assert_array_equal(batch.baseline(order=1, test=True).shape, batch.y.shape)
+        np.testing.assert_allclose(batch.y, y - fitted)
+        with self.assertRaises(ValueError):
+            batch.baseline(order=0)
+
+    def test_reset_and_select(self):
+        batch = SpectrumBatch(self.x, self.Y, meta={"subject_id": ["s1", "s2", "s3", "s4", "s5"]})
+        batch.extract_range(800, 1600)
+        subset = batch[batch.meta["subject_id"] != "s3"]
+        self.assertEqual(subset.shape, (4, batch.x.shape[0]))
+        self.assertEqual(list(subset.meta["subject_id"]), ["s1", "s2", "s4", "s5"])
+        self.assertEqual(len(batch[0]), 1)
+        batch.reset_data()
+        np.testing.assert_array_equal(batch.y, self.Y)
+        self.assertFalse(batch._y.flags.writeable)
+        with self.assertRaises(ValueError):
+            SpectrumBatch(self.x, self.Y[:, :10])
+        with self.assertRaises(ValueError):
+            SpectrumBatch(self.x, self.Y, meta={"subject_id": ["s1"]})
+
+    def test_samples_round_trip(self):
+        samples = [Sample(x=self.x, y=y, path=f"{i}.txt", interpolate=False) for i, y in enumerate(self.Y)]
+        for i, sample in enumerate(samples):
+            sample.name = f"s{i}"
+            sample.exposure = 3
+            sample.date = datetime(2025, 9, 15, 9, 14, i)
+        batch = SpectrumBatch.from_samples(samples)
+        self.assertEqual(set(batch.meta), {"name", "exposure", "date", "paths"})
+        self.assertEqual(batch.meta["date"].dtype, np.dtype("datetime64[ms]"))
+        for a, b in zip(batch.to_samples(), samples):
+            np.testing.assert_array_equal(a.y, b.y)
+            self.assertEqual((a.name, a.exposure, a.date, a.paths), (b.name, b.exposure, b.date, b.paths))
+            self.assertIsInstance(a.exposure, int)
+
+        other = samples[0].copy()
+        other.extract_range(800, 1600)
+        with self.assertRaises(ValueError):
+            SpectrumBatch.from_samples([samples[1], other])
+
+    def test_optofiles_round_trip(self):
+        optofiles = [self.optofile.model_copy(update={"subject_id": f"s{i}"}) for i in range(3)]
+        packed = self.optofile.model_copy(deep=True)
+        packed.pack("float64")
+        optofiles.append(packed)
+        batch = SpectrumBatch.from_optofiles(optofiles, array="raw")
+        self.assertEqual(list(batch.meta["subject_id"]), ["s0", "s1", "s2", "s1"])
+        np.testing.assert_array_equal(batch.y[3], self.optofile.array("raw"))
+
+        batch.smoothing(window_length=11)
+        results = batch.to_optofiles(optofiles, array="raw")
+        for optofile, result, row in zip(optofiles, results, batch.y):
+            np.testing.assert_array_equal(result.array("raw"), row)
+            self.assertEqual(result.is_packed, optofile.is_packed)
+        # The inputs are untouched
+        np.testing.assert_array_equal(optofiles[3].array("raw"), self.optofile.array("raw"))
+
+        batch.interpolate(step=1)
+        with self.assertRaises(ValueError):
+            batch.to_optofiles(optofiles, array="raw")
+
+
+if __name__ == '__main__':
+    unittest.main()
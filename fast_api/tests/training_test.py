@@ -0,0 +1,98 @@
+import unittest
+import os
+os.environ.setdefault("ME_CONFIG_MONGODB_URL", "mongodb://localhost:27017")
+import json
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+import numpy as np
+from src.db import OptoFile, SpectraMatrix
+from src.inference import ModelRegistry
+from src.spectra import CompiledPipeline, FeatureCache
+from src.training import build_features, cross_validate, export, interpolate_targets, select_axis
+
+_DATA = Path("../data/finger")
+
+
+def _matrix(n_per_subject: int = 6) -> SpectraMatrix:
+    docs = []
+    for subject_id in ["s1", "s2", "s3"]:
+        for f in sorted((_DATA / subject_id).glob("25*.txt"))[:n_per_subject]:
+            docs.append(OptoFile.read_opto_file(f, subject_id=subject_id).model_dump_doc())
+    return SpectraMatrix.from_docs(docs, fields=["subject_id", "created"])
+
+
+class TestTraining(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.matrix = _matrix()
+
+    def test_interpolate_targets(self):
+        subject_ids = np.array(["s1"] * 5 + ["s2"] * 3)
+        glucose = np.array([100, np.nan, 120, np.nan, 100, 90, np.nan, 95])
+        target = interpolate_targets(subject_ids, glucose)
+        np.testing.assert_allclose(target[[0, 2, 4]], [100, 120, 100])
+        self.assertAlmostEqual(target[1], 115)
+        # Not enough pricks to fit a polynomial of order 2
+        self.assertTrue(np.isnan(target[5:]).all())
+
+    def test_build_features(self):
+        expected = CompiledPipeline.for_axis(self.matrix.raman_shift)(self.matrix.X)
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = FeatureCache(tmp)
+            X = build_features(self.matrix, workers=2, cache=cache, chunk_size=5)
+            np.testing.assert_allclose(X, expected, atol=1e-12)
+            self.assertEqual(len(cache), len(self.matrix))
+            # Every spectrum is cached: no preprocessing
+            with patch("src.training.train.ProcessPoolExecutor") as executor:
+                np.testing.assert_array_equal(build_features(self.matrix, workers=2, cache=cache), X)
+                executor.assert_not_called()
+            # Other parameters, other entries
+            build_features(self.matrix, params={"smoothing_window": 30}, workers=1, cache=cache)
+            self.assertEqual(len(cache), 2 * len(self.matrix))
+
+    def test_select_axis(self):
+        axis = self.matrix.raman_shift
+        np.testing.assert_array_equal(select_axis(self.matrix), axis)
+        # Another device: same features, so the deployed axis must be given
+        two_axes = SpectraMatrix(X=self.matrix.X, meta=self.matrix.meta, axes=[axis, axis + 0.5],
+                                 axis_index=np.arange(len(self.matrix)) % 2)
+        with self.assertRaisesRegex(ValueError, "--raman-shift"):
+            select_axis(two_axes)
+        np.testing.assert_array_equal(select_axis(two_axes, axis + 0.5), axis + 0.5)
+        self.assertEqual(build_features(two_axes, workers=1, cache=None).shape[1], CompiledPipeline.for_axis(axis).x.shape[0])
+        # An axis that does not cover the features is rejected
+        short = SpectraMatrix(X=self.matrix.X, meta=self.matrix.meta, axes=[axis, axis + 700],
+                              axis_index=np.arange(len(self.matrix)) % 2)
+        with self.assertRaisesRegex(ValueError, "do not match the exported axis"):
+            select_axis(short, axis)
+
+    def test_cross_validate_and_export(self):
+        X = build_features(self.matrix, workers=1, cache=None)
+        y = np.linspace(80, 160, len(X))
+        groups = self.matrix.meta["subject_id"]
+        results = cross_validate(X, y, groups, ["LinearRegression"], n_components=5, workers=1)
+        self.assertEqual(sorted(results["LinearRegression"]["subjects"]), ["s1", "s2", "s3"])
+        self.assertEqual(len(results["LinearRegression"]["predictions"]), len(X))
+        self.assertIn("rmse", results["LinearRegression"]["overall"])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = export(tmp, X, y, self.matrix.raman_shift, ["LinearRegression"],
+                          manifest={"models": {"LinearRegression": {"cv": results["LinearRegression"]["overall"]}}},
+                          n_components=5, version="test")
+            manifest = json.loads((path / "manifest.json").read_text())
+            self.assertEqual(manifest["version"], "test")
+            self.assertEqual(manifest["n_samples"], len(X))
+            self.assertIn("cv", manifest["models"]["LinearRegression"])
+            self.assertIn("params", manifest["models"]["LinearRegression"])
+
+            # The export is a model directory for the API
+            registry = ModelRegistry(model_dir=path, default="LinearRegression")
+            self.assertEqual(registry.names, ["LinearRegression"])
+            self.assertEqual(registry.get().predict(X).shape, (len(X),))
+            np.testing.assert_array_equal(registry.raman_shift(), self.matrix.raman_shift)
+
+
+if __name__ == '__main__':
+    unittest.main()